@@ -15,8 +15,9 @@ from agents.state_management import ConversationStateMachine
 from agents.memory import Memory
 from agents.tot.tot import ToT
 
-from utils.parsing import dict2xml, xml2xmlstr, xmlstr2dict
+from utils.parsing import dict2xmlstr, xmlstr2dict
 from utils.llm import llm_turn
+from utils.telemetry import set_call_context
 
 from anthropic import Anthropic
 
@@ -55,6 +56,10 @@ class AgentManager():
 
             self.agents: list[Agent] = []
 
+            # Tasks are only ever appended, never edited, so each one is serialized once; keyed by id() since
+            # the agents' task lists keep every task alive
+            self.task_xmlstrs: dict[int, str] = {}
+
             agtmgr_dir, input_dir = os.environ.get("AGTMGR_DIR"), os.environ.get("INPUT_DIR")
             if agtmgr_dir is None:
                 error_message = f"{self.PRINT_PREFIX} AGTMGR_DIR environment variable not set (check .env)"
@@ -74,7 +79,7 @@ class AgentManager():
                 print(f"{self.PRINT_PREFIX} loaded transition_data")
 
             self.csm = ConversationStateMachine(state_data=state_data, transition_data=transition_data, init_state_path="AwaitIPC", prefix=self.PRINT_PREFIX, owner_class_name="AgentManager")
-            self.memory = Memory(environ_path_key="AGTMGR_DIR", prefix=self.PRINT_PREFIX)
+            self.memory = Memory(environ_path_key="AGTMGR_DIR", prefix=self.PRINT_PREFIX, owner="AGTMGR")
 
             self.parsed_response = None
 
@@ -85,6 +90,7 @@ class AgentManager():
         self.csm.transition(trigger, locals())
 
         while self.csm.current_state.get_hpath() != "AwaitIPC":
+            set_call_context("AgentManager", self.csm.current_state.get_hpath())
 
             match self.csm.current_state.get_hpath():
 
@@ -98,10 +104,7 @@ class AgentManager():
                     agents_xmlstr = self.get_agents_xmlstr()
                     print(f"{self.PRINT_PREFIX} agents_str:\n{agents_xmlstr}")
 
-                    action_xml = dict2xml(action)
-                    print(f"{self.PRINT_PREFIX} action_xml:\n{action_xml}")
-
-                    action_xmlstr = xml2xmlstr(action_xml)
+                    action_xmlstr = dict2xmlstr(action)
                     print(f"{self.PRINT_PREFIX} action_xmlstr:\n{action_xmlstr}")
 
                     self.memory.prime_all_prompts(self.csm.current_state.get_hpath(), "AGTMGR_DIR", dynamic_metaprompt=None, user_frmt={"agents_str": agents_xmlstr, "task": action_xmlstr})
@@ -111,7 +114,8 @@ class AgentManager():
                                     prompts={'system': self.memory.get_system_prompt(),
                                             'messages': self.memory.get_messages()},
                                     stop_sequences=["</output>"],
-                                    temperature=0.0)
+                                    temperature=0.0,
+                                    hedge="AgentManager.RouteAction")
                     
                     self.memory.store_llm_response("<output>" + text + "</output>")
 
@@ -132,7 +136,8 @@ class AgentManager():
                                     prompts={'system': self.memory.get_system_prompt(),
                                              'messages': self.memory.get_messages()},
                                     stop_sequences=["</output>"],
-                                    temperature=0.7)
+                                    temperature=0.7,
+                                    hedge="AgentManager.CreateAgent")
                     
                     self.memory.store_llm_response("<output>" + text + "</output>")
 
@@ -179,8 +184,9 @@ class AgentManager():
                     print(f"[bold][red]{error_message}[/red][/bold]")
                     raise TypeError(error_message)
                     
-                task_xml = dict2xml(task)
-                task_str = xml2xmlstr(task_xml)
+                task_str = self.task_xmlstrs.get(id(task))
+                if task_str is None:
+                    task_str = self.task_xmlstrs[id(task)] = dict2xmlstr(task)
 
                 agents_xmlstr += task_str + "\n"
 
@@ -1,5 +1,7 @@
 import os
-from typing import Optional
+import re
+import sys
+from typing import Callable, Optional
 import dotenv
 
 from rich import print
@@ -10,14 +12,44 @@ from anthropic.types import TextBlock
 from agents.prompt_management import load_system_prompt, load_user_prompt, load_assistant_prefill, get_msg
 
 from utils.custom_types import Message
+from utils.messages import MessageSequence
 from utils.custom_exceptions import PromptError
 from utils.enums import Role
 from utils.parsing import files2dict
+from utils.tokens import estimate_prompt_tokens
+
+
+SUMMARY_LINE_CHARS = 160
+SUMMARY_MAX_CHARS = 4000
+
+Summarizer = Callable[[list[Message], Optional[str]], str]
+
+
+def summarize_turns(turns: list[Message], summary: Optional[str]) -> str:
+    # Local extractive digest of evicted turns: one clipped line per message, oldest lines
+    # dropped first once the digest outgrows SUMMARY_MAX_CHARS
+    lines = summary.splitlines() if summary else []
+
+    for message in turns:
+        text = re.sub(r"\s+", " ", message['content']).strip()
+        if len(text) > SUMMARY_LINE_CHARS:
+            text = text[:SUMMARY_LINE_CHARS - 3] + "..."
+        lines.append(f"{message['role']}: {text}")
+
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+
+    return "\n".join(lines)
+
+def get_env_int(key: str) -> Optional[int]:
+    value = os.environ.get(key)
+    return int(value) if value else None
+
 
 class Memory:
     PRINT_PREFIX = "[bold][MEMORY][/bold]"
 
-    def __init__(self, environ_path_key: Optional[str] = None, file_ext: str = ".xml", prefix: Optional[str] = None) -> None:
+    def __init__(self, environ_path_key: Optional[str] = None, file_ext: str = ".xml", prefix: Optional[str] = None, owner: Optional[str] = None, summarizer: Summarizer = summarize_turns) -> None:
         dotenv.load_dotenv()
 
         if prefix:
@@ -30,6 +62,20 @@ class Memory:
         self.conversation_history: list[Message] = []
         self.system_prompt_history: list[str] = []
 
+        # get_history() as a MessageSequence for fan-out prompts to extend; rebuilt only once the history changes
+        self.history_view: Optional[MessageSequence] = None
+
+        # History policy, read per owner from the environment, e.g. UI_HISTORY_TURNS:
+        # stateless owners only ever send their latest prompt, otherwise the last HISTORY_TURNS
+        # turns are kept verbatim (within HISTORY_TOKENS) and older ones are rolled into a summary
+        self.owner = owner
+        self.stateless = bool(owner) and os.environ.get(f"{owner}_HISTORY_STATELESS") == "True"
+        self.max_turns = get_env_int(f"{owner}_HISTORY_TURNS") if owner else None
+        self.max_tokens = get_env_int(f"{owner}_HISTORY_TOKENS") if owner else None
+
+        self.summarizer = summarizer
+        self.summary: Optional[str] = None
+
         if environ_path_key:
             environ_path = os.environ.get(environ_path_key)
             input_path = os.environ.get("INPUT_DIR")
@@ -82,9 +128,30 @@ class Memory:
             print(f"[red][bold]{error_message}[/bold][/red]")
             raise PromptError(error_message)
     
+    def get_history(self) -> list[Message]:
+        if self.summary and self.conversation_history and self.conversation_history[0]['role'] == Role.USER.value:
+            first_msg = self.conversation_history[0]
+            summarized_msg = get_msg(Role.USER, f"<earlier_conversation_summary>\n{self.summary}\n</earlier_conversation_summary>\n\n{first_msg['content']}")
+
+            return [summarized_msg] + self.conversation_history[1:]
+
+        return self.conversation_history
+
+    def get_history_view(self) -> MessageSequence:
+        if self.history_view is None:
+            self.history_view = MessageSequence(self.get_history())
+
+        return self.history_view
+
+    def clear_history(self) -> None:
+        # A full reset: a history rebuilt after this would otherwise have its evicted turns folded into the summary again
+        self.conversation_history = []
+        self.history_view = None
+        self.summary = None
+
     def get_messages(self) -> list[Message]:
         if len(self.conversation_history) > 0:
-            return self.conversation_history
+            return self.get_history()
         else:
             error_message = f"{self.PRINT_PREFIX} unprimed conversation history"
             print(f"[red][bold]{error_message}[/bold][/red]")
@@ -93,13 +160,47 @@ class Memory:
     def store_llm_response(self, result: str) -> None:
         if self.conversation_history[-1]["role"] == Role.ASSISTANT.value:
             self.conversation_history[-1]["content"] = result
+            self.history_view = None
         else:
             error_message = f"{self.PRINT_PREFIX} Unexpected role at end of conversation: {self.conversation_history[-1]['role']}"
             print(f"[red][bold]{error_message}[/bold][/red]")
             raise PromptError(error_message)
 
     def add_msg(self, msg: Message) -> None:
+        # A new user message starts a turn, so the finished turns before it are budgeted first
+        if msg['role'] == Role.USER.value:
+            self.apply_history_policy(incoming=msg)
+
         self.conversation_history.append(msg)
+        self.history_view = None
+
+    def apply_history_policy(self, incoming: Optional[Message] = None) -> None:
+        if self.stateless:
+            self.clear_history()
+            return
+
+        evicted: list[Message] = []
+
+        def turn_count() -> int:
+            # The turn the incoming message opens counts towards the limit
+            return len(self.conversation_history) // 2 + (1 if incoming else 0)
+
+        def over_budget() -> bool:
+            if self.max_tokens is None:
+                return False
+
+            pending = [incoming] if incoming else []
+            summary_tokens = estimate_prompt_tokens(self.summary or "", [])
+            return summary_tokens + estimate_prompt_tokens("", self.conversation_history + pending) > self.max_tokens  # type: ignore
+
+        while self.conversation_history and ((self.max_turns is not None and turn_count() > self.max_turns) or over_budget()):
+            evicted += self.conversation_history[:2]
+            self.conversation_history = self.conversation_history[2:]
+
+        if evicted:
+            self.history_view = None
+            self.summary = self.summarizer(evicted, self.summary)
+            print(f"{self.PRINT_PREFIX} rolled {len(evicted)} messages into the conversation summary")
 
     def add_msg_obj(self, msg_obj: AnthropicMessage, frmt: dict[str, str]):
         msg: str = ""
@@ -111,12 +212,14 @@ class Memory:
         if frmt:
             msg = msg.format(**frmt)
 
+        # Roles from the SDK are fresh strings per response; interned they share the one copy get_msg uses
         msg_item: Message = {
-            'role': msg_obj.role,
+            'role': sys.intern(msg_obj.role),
             'content': msg
         }
 
         self.conversation_history.append(msg_item)
+        self.history_view = None
 
     def add_result(self, result: dict):
         self.results[len(self.conversation_history)] = result
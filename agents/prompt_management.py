@@ -1,5 +1,9 @@
+from __future__ import annotations
+
 import os
-from typing import Optional
+import string
+from typing import Optional, Type
+from typing_extensions import Self
 import dotenv
 
 from rich import print
@@ -15,6 +19,116 @@ dotenv.load_dotenv()
 PRINT_PREFIX = "[bold][PROMPT_MGMT][/bold]"
 FILE_EXT = ".xml"
 
+# Prompt directories loaded up front; other environ_path_keys are loaded on first use
+PROMPT_DIR_KEYS = ("UI_DIR", "TOT_DIR", "AGTMGR_DIR")
+
+
+class PromptTemplate():
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.load()
+
+    def load(self) -> None:
+        # Imported here since utils.parsing imports this module
+        from utils.parsing import find_missing_format_items
+
+        with open(self.path, 'r', encoding="utf-8", errors='replace') as f:
+            self.text = f.read()
+
+        self.mtime = os.path.getmtime(self.path)
+        self.required_keys = set(find_missing_format_items(self.text) or [])
+
+        # (literal, field) pairs; anything beyond plain {name} fields (specs, conversions, indexing) renders through str.format
+        parsed = list(string.Formatter().parse(self.text))
+        self.compiled = [(literal, field_name) for literal, field_name, _, _ in parsed]
+        self.plain_fields = all(field_name is None or (field_name.isidentifier() and not format_spec and not conversion)
+                                for _, field_name, format_spec, conversion in parsed)
+
+    def render(self, frmt: dict[str, str]) -> str:
+        # An empty frmt leaves the template as written, {{ }} included
+        if not frmt:
+            return self.text
+
+        missing_keys = self.required_keys - frmt.keys()
+        if missing_keys:
+            error_message = f"{PRINT_PREFIX} {self.path} is missing format keys: {sorted(missing_keys)}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise KeyError(error_message)
+
+        if not self.plain_fields:
+            return self.text.format(**frmt)
+
+        return "".join(literal if field_name is None else literal + str(frmt[field_name]) for literal, field_name in self.compiled)
+
+
+class PromptRegistry():
+    """
+    Every prompt template, read and compiled once. With DEV_MODE set, templates whose file changed on disk
+    are reloaded when next rendered
+    """
+    _instance = None
+
+    def __new__(cls: Type[Self], *args, **kwargs) -> Self:
+        if cls._instance is None:
+            cls._instance = super(PromptRegistry, cls).__new__(cls)
+            cls._instance.__initialized = False
+
+        return cls._instance
+
+    def __init__(self) -> None:
+        if not self.__initialized:
+            self.dev_mode = os.environ.get("DEV_MODE") == "True"
+
+            self.prompt_dirs: dict[tuple[str, str], str] = {}
+            self.templates: dict[tuple[str, str, str], PromptTemplate] = {}
+
+            for environ_path_key in PROMPT_DIR_KEYS:
+                if not os.environ.get(environ_path_key):
+                    continue
+
+                for prompt_dir_key in ("SYS_PRMPT_DIR", "USR_PRMPT_DIR"):
+                    prompt_dir = self.get_prompt_dir(environ_path_key, prompt_dir_key)
+                    if not os.path.isdir(prompt_dir):
+                        continue
+
+                    for filename in sorted(os.listdir(prompt_dir)):
+                        if filename.endswith(FILE_EXT):
+                            self.get_template(environ_path_key, prompt_dir_key, filename[:-len(FILE_EXT)])
+
+            self.__initialized = True
+
+    def get_prompt_dir(self, environ_path_key: str, prompt_dir_key: str) -> str:
+        prompt_dir = self.prompt_dirs.get((environ_path_key, prompt_dir_key))
+        if prompt_dir is not None:
+            return prompt_dir
+
+        for key in (environ_path_key, "INPUT_DIR", prompt_dir_key):
+            if not os.environ.get(key):
+                error_message = f"{PRINT_PREFIX} {key} not set"
+                print(f"[red][bold]{error_message}[/bold][/red]")
+                raise KeyError(error_message)
+
+        prompt_dir = os.path.join(os.environ[environ_path_key], os.environ["INPUT_DIR"], os.environ[prompt_dir_key])
+        self.prompt_dirs[(environ_path_key, prompt_dir_key)] = prompt_dir
+
+        return prompt_dir
+
+    def get_template(self, environ_path_key: str, prompt_dir_key: str, state_path: str) -> PromptTemplate:
+        template = self.templates.get((environ_path_key, prompt_dir_key, state_path))
+
+        if template is None:
+            template = PromptTemplate(os.path.join(self.get_prompt_dir(environ_path_key, prompt_dir_key), state_path+FILE_EXT))
+            self.templates[(environ_path_key, prompt_dir_key, state_path)] = template
+
+        elif self.dev_mode and os.path.getmtime(template.path) != template.mtime:
+            print(f"{PRINT_PREFIX} Reloading {template.path}")
+            template.load()
+
+        return template
+
+    def render(self, environ_path_key: str, prompt_dir_key: str, state_path: str, frmt: dict[str, str]) -> str:
+        return self.get_template(environ_path_key, prompt_dir_key, state_path).render(frmt)
+
 
 def load_user_prompt(state_path: str, environ_path_key: str, dynamic_metaprompt: Optional[str], frmt: dict[str, str]) -> str:
     if dynamic_metaprompt:
@@ -37,66 +151,15 @@ def load_user_prompt(state_path: str, environ_path_key: str, dynamic_metaprompt:
             return "<input>" + user_input + "</input>"
 
     else:
-        environ_path = os.environ.get(environ_path_key)
-        if not environ_path:
-            error_message = f"{PRINT_PREFIX} {environ_path_key} not set"
-            print(f"[red][bold]{error_message}[/bold][/red]")
-            raise KeyError(error_message)
-        INPUT_DIR = os.environ.get("INPUT_DIR")
-        if not INPUT_DIR:
-            error_message = f"{PRINT_PREFIX} INPUT_DIR not set"
-            print(f"[red][bold]{error_message}[/bold][/red]")
-            raise KeyError(error_message)
-        USR_PRMPT_DIR = os.environ.get("USR_PRMPT_DIR")
-        if not USR_PRMPT_DIR:
-            error_message = f"{PRINT_PREFIX} USR_PRMPT_DIR not set"
-            print(f"[red][bold]{error_message}[/bold][/red]")
-            raise KeyError(error_message)
-            
-        user_prompt_dir = os.path.join(environ_path, INPUT_DIR, USR_PRMPT_DIR)
-        
-        if not os.path.exists(os.path.join(user_prompt_dir, state_path+FILE_EXT)):
+        try:
+            return PromptRegistry().render(environ_path_key, "USR_PRMPT_DIR", state_path, frmt)
+        except FileNotFoundError:
             error_message = f"{PRINT_PREFIX} user prompt file does not exist, and no prompt was provided as arg: {state_path+FILE_EXT}"
             print(f"[red][bold]{error_message}[/red][/bold]")
             raise FileNotFoundError(error_message)
 
-        else:
-            with open(os.path.join(user_prompt_dir, state_path+FILE_EXT), 'r', encoding="utf-8", errors='replace') as f:
-                user_prompt = f.read()
-
-            if frmt:
-                user_prompt = user_prompt.format(**frmt)
-                    
-            return user_prompt
-
 def load_system_prompt(state_path: str, environ_path_key: str, frmt: dict[str, str]) -> str:
-    environ_path = os.environ.get(environ_path_key)
-    if not environ_path:
-        error_message = f"{PRINT_PREFIX} {environ_path_key} not set"
-        print(f"[red][bold]{error_message}[/bold][/red]")
-        raise KeyError(error_message)
-
-    INPUT_DIR = os.environ.get("INPUT_DIR")
-    if not INPUT_DIR:
-        error_message = f"{PRINT_PREFIX} INPUT_DIR not set"
-        print(f"[red][bold]{error_message}[/bold][/red]")
-        raise KeyError(error_message)
-
-    SYS_PRMPT_DIR = os.environ.get("SYS_PRMPT_DIR")
-    if not SYS_PRMPT_DIR:
-        error_message = f"{PRINT_PREFIX} SYS_PRMPT_DIR not set"
-        print(f"[red][bold]{error_message}[/bold][/red]")
-        raise KeyError(error_message)
-
-    sys_prompt_dir = os.path.join(environ_path, INPUT_DIR, SYS_PRMPT_DIR)
-
-    with open(os.path.join(sys_prompt_dir, state_path+FILE_EXT), 'r', encoding="utf-8", errors='replace') as f:
-        sys_prompt = f.read()
-
-    if frmt:
-        sys_prompt = sys_prompt.format(**frmt)
-
-    return sys_prompt
+    return PromptRegistry().render(environ_path_key, "SYS_PRMPT_DIR", state_path, frmt)
 
 def load_assistant_prefill(prefill: str) -> Message:
     msg = get_msg(Role.ASSISTANT, prefill)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from copy import deepcopy
+import os
+import time
 import platform
+from collections import deque
 from typing import Optional
 
 import dotenv
@@ -19,6 +21,10 @@ from agents.tot.callbacks import *
 from agents.agent_manager.callbacks import *
 
 
+# Transitions remembered per state machine; older ones fall out of the ring buffer
+STATE_HISTORY_SIZE = int(os.environ.get("STATE_HISTORY_SIZE") or 1024)
+
+
 class ConversationState:
     PRINT_PREFIX = "[bold][CS][/bold]"
 
@@ -41,6 +47,10 @@ class ConversationState:
 
         self.parent = parent
 
+        # Assigned when a ConversationStateMachine compiles its transition table
+        self.id: int = -1
+        self.hpath: Optional[str] = None
+
         self.transitions: dict[str, ConversationState] = {}
         self.children = []
 
@@ -55,6 +65,7 @@ class ConversationState:
     def add_child(self, child_state):
         self.children.append(child_state)
         child_state.parent = self
+        child_state.hpath = None
 
     def get_next_state(self, response) -> Optional[ConversationState]:
         if response in self.transitions:
@@ -71,11 +82,16 @@ class ConversationState:
             return self
 
     def get_hpath(self) -> str:
+        if self.hpath is not None:
+            return self.hpath
+
         if isinstance(self.name, str):
             if self.parent and self.parent.name != "root":
-                return self.parent.get_hpath() + "_" + self.name
+                self.hpath = self.parent.get_hpath() + "_" + self.name
             else:
-                return self.name
+                self.hpath = self.name
+
+            return self.hpath
         else:
             error_message = f"{self.PRINT_PREFIX} self.name not assigned"
             print(f"[red][bold]{error_message}[/bold][/red]")
@@ -109,9 +125,13 @@ class ConversationStateMachine:
         
         self.initialize_conversation_states(state_data)
         self.initialize_transitions(transition_data)
+        self.compile_transitions(init_state_path)
 
         self.current_state: ConversationState = self.state_map[init_state_path]
-        self.state_history: list[ConversationState] = [self.current_state]
+
+        # (hpath of the state entered, trigger, time.time()) per transition, starting with the initial state
+        self.state_history: deque[tuple[str, Optional[str], float]] = deque(maxlen=STATE_HISTORY_SIZE)
+        self.state_history.append((self.current_state.get_hpath(), None, time.time()))
 
         self.print_state_hierarchy()
 
@@ -122,12 +142,14 @@ class ConversationStateMachine:
         self.print_current_state()
 
     def transition(self, trigger: str, locals) -> ConversationState:
-        if trigger and trigger in self.current_state.transitions:
+        next_state = self.get_next_state(trigger)
+
+        if next_state is not None:
             self.current_state.on_exit(self, locals)
 
-            self.state_history.append(deepcopy(self.current_state))
+            self.current_state = next_state
 
-            self.current_state = self.current_state.transitions[trigger]
+            self.state_history.append((self.current_state.get_hpath(), trigger, time.time()))
 
             self.current_state.on_enter(self, locals)
 
@@ -137,6 +159,25 @@ class ConversationStateMachine:
             print(f"[red][bold]{error_message}[/bold][/red]")
             raise ConversationEdgeError(error_message)
 
+    def get_next_state(self, trigger: str, state: Optional[ConversationState] = None) -> Optional[ConversationState]:
+        # Same resolution as ConversationState.get_next_state (own transitions, then the parents'), precomputed
+        state = state or self.current_state
+        trigger_id = self.trigger_ids.get(trigger)
+
+        if trigger_id is None or self.transition_table[state.id][trigger_id] < 0:
+            return None
+
+        return self.states[self.transition_table[state.id][trigger_id]]
+
+    def get_past_path(self, count: Optional[int] = None) -> list[str]:
+        # hpaths of the last count states entered, oldest first, as far back as the history reaches
+        past_path = [state_path for state_path, _, _ in self.state_history]
+
+        return past_path[-count:] if count else past_path
+
+    def get_past_states(self, count: Optional[int] = None) -> list[ConversationState]:
+        return [self.state_map[state_path] for state_path in self.get_past_path(count)]
+
     def initialize_conversation_states(self, state_data):
         def create_state(state_data, parent=None):
             state = ConversationState(name=state_data["name"],
@@ -167,6 +208,8 @@ class ConversationStateMachine:
 
         traverse_and_map_states(self.root_state)
 
+        dangling_transitions = []
+
         for transition in transition_data:
             trigger = transition["trigger"]
             source_paths = transition["source"]
@@ -176,14 +219,68 @@ class ConversationStateMachine:
                 source_paths = [source_paths]
 
             for source_path in source_paths:
-                source_path = source_path
                 source_state = self.find_state_by_path(source_path)
                 dest_state = self.find_state_by_path(dest_path)
 
                 if source_state and dest_state:
                     source_state.add_transition(trigger, dest_state)
                 else:
-                    print(f"[red]{self.PRINT_PREFIX} Warning: Invalid transition - Source: {source_path}, Destination: {dest_path}[/red]")
+                    dangling_transitions.append(f"{source_path} -[{trigger}]-> {dest_path}")
+
+        if dangling_transitions:
+            error_message = f"{self.PRINT_PREFIX} transitions to or from unknown states: {dangling_transitions}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ConversationEdgeError(error_message)
+
+    def compile_transitions(self, init_state_path: str) -> None:
+        """
+        Numbers the states and builds a dense transition_table[state id][trigger id] -> state id (-1 for none),
+        with transitions inherited from parent states already resolved, then checks every leaf state can be
+        reached from the initial state
+        """
+        if init_state_path not in self.state_map:
+            error_message = f"{self.PRINT_PREFIX} initial state {init_state_path} not found"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ConversationNodeError(error_message)
+
+        self.states: list[ConversationState] = list(self.state_map.values())
+        for state_id, state in enumerate(self.states):
+            state.id = state_id
+
+        self.trigger_ids: dict[str, int] = {}
+        for state in self.states:
+            for trigger in state.transitions:
+                self.trigger_ids.setdefault(trigger, len(self.trigger_ids))
+
+        self.transition_table: list[list[int]] = []
+        for state in self.states:
+            lineage = []
+            ancestor: Optional[ConversationState] = state
+            while ancestor is not None:
+                lineage.append(ancestor)
+                ancestor = ancestor.parent
+
+            # Outermost first, so a state's own transitions override the ones it inherits
+            row = [-1] * len(self.trigger_ids)
+            for ancestor in reversed(lineage):
+                for trigger, next_state in ancestor.transitions.items():
+                    row[self.trigger_ids[trigger]] = next_state.id
+
+            self.transition_table.append(row)
+
+        reachable = {self.state_map[init_state_path].id}
+        frontier = list(reachable)
+        while frontier:
+            for next_state_id in self.transition_table[frontier.pop()]:
+                if next_state_id >= 0 and next_state_id not in reachable:
+                    reachable.add(next_state_id)
+                    frontier.append(next_state_id)
+
+        unreachable_states = [state.get_hpath() for state in self.states if not state.children and state.id not in reachable]
+        if unreachable_states:
+            error_message = f"{self.PRINT_PREFIX} states unreachable from {init_state_path}: {unreachable_states}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ConversationNodeError(error_message)
 
     def visualize(self, filename: str) -> None:
         graph = pgv.AGraph(directed=True)
@@ -0,0 +1,35 @@
+import json
+
+
+class ToTStep():
+    """
+    One ToT step. Once the step is finalized only what step2str renders needs to stay in memory;
+    archive() moves the candidates and raw votes it was chosen from into the run log
+    """
+    __slots__ = ("best_plan", "best_proposition", "output", "error", "plan_candidates", "proposal_candidates", "exec_vote_strs", "vote_savings")
+
+    def __init__(self) -> None:
+        self.best_plan: str = ""
+        self.best_proposition: str = ""
+        self.output: str = ""
+        self.error: str = ""
+
+        self.plan_candidates: list[str] = []
+        self.proposal_candidates: list[str] = []
+        self.exec_vote_strs: list[str] | list[dict] = []
+        self.vote_savings: dict[str, dict[str, float]] = {}
+
+    def archive(self, path: str, step_num: int) -> None:
+        record = {"step": step_num,
+                  "plan_candidates": self.plan_candidates,
+                  "proposal_candidates": self.proposal_candidates,
+                  "exec_votes": self.exec_vote_strs,
+                  "vote_savings": self.vote_savings}
+
+        with open(path, 'a', encoding="utf-8", errors="replace") as archive_file:
+            archive_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        self.plan_candidates = []
+        self.proposal_candidates = []
+        self.exec_vote_strs = []
+        self.vote_savings = {}
@@ -2,7 +2,9 @@ import os
 import json
 import platform
 import random
-from typing import Optional
+import time
+import xml.etree.ElementTree as ET
+from typing import Callable, Optional
 
 from pynput import keyboard
 
@@ -17,14 +19,23 @@ from agents.execution_management.execution_management import CodeExecutor
 from agents.prompt_management import load_system_prompt, load_user_prompt, get_msg
 
 from agents.memory import Memory
+from agents.tot.step import ToTStep
 
 from remote.experience import get_remote_experiences, stage_experience
 from utils.context import get_platform_details
 from utils.custom_exceptions import ExecError
 from utils.enums import Role
 from utils.custom_types import FeedbackDict, PromptsDict
-from utils.parsing import dict2xml, xml2xmlstr, xmlstr2dict, extract_language_and_code, get_yes_no_input, remove_escape_key
-from utils.llm import llm_turns
+from utils.parsing import dict2xmlstr, xmlstr2dict, xmlstrs2dicts, extract_language_and_code, get_yes_no_input, remove_escape_key
+from utils.llm import llm_turn, llm_turns, llm_turns_indexed, llm_structured_indexed
+from utils.structured import get_tool
+from utils.xml_repair import get_repair_stats
+from utils.compaction import get_defined_names, truncate_middle
+from utils.similarity import cluster_candidates, dedupe_candidates
+from utils.voting import AGGREGATION_METHODS, aggregate, ballot_points, get_margin, majority_settled, scores_settled
+from utils.tokens import estimate_prompt_tokens
+from utils.cassette import get_seed
+from utils.telemetry import TELEMETRY_FILENAME, get_telemetry, set_call_context
 from utils.files import create_incrementing_directory
 from utils.constants import CLIENT_VERSION, FRIENDLY_COLOR, LOCAL_LOGS
 
@@ -35,15 +46,77 @@ PLAN_COUNT = int(os.environ.get("PLAN_COUNT", "5"))
 VOTER_COUNT = int(os.environ.get("VOTER_COUNT", "5"))
 PROPOSAL_COUNT = int(os.environ.get("PROPOSAL_COUNT", "5"))
 
+# Fan-outs return once this many candidates/votes are in (or QUORUM_DEADLINE seconds have passed
+# with at least one) and cancel the stragglers; unset waits for all of them
+PLAN_QUORUM = int(os.environ.get("PLAN_QUORUM") or PLAN_COUNT)
+VOTER_QUORUM = int(os.environ.get("VOTER_QUORUM") or VOTER_COUNT)
+PROPOSAL_QUORUM = int(os.environ.get("PROPOSAL_QUORUM") or PROPOSAL_COUNT)
+QUORUM_DEADLINE = float(os.environ.get("QUORUM_DEADLINE") or 0) or None
+
+# Plans at least this cosine-similar (hashed unigrams/bigrams) are collapsed into one before voting; 0 disables.
+# Code proposals are only collapsed when identical - a flipped operator barely moves the similarity
+CLUSTER_THRESHOLD = float(os.environ.get("CLUSTER_THRESHOLD") or 0)
+
+# Score head start per duplicate sample of a candidate (see reduce_scores)
+MULTIPLICITY_PRIOR = float(os.environ.get("MULTIPLICITY_PRIOR") or 0.5)
+
+# Votes come back through a forced tool call (Anthropic) / JSON schema (OpenAI) and are validated per ballot,
+# instead of being parsed from XML with LLM repair on failure
+STRUCTURED_VOTES = os.environ.get("STRUCTURED_VOTES", "True") == "True"
+
+EXEC_BALLOT_TOOL = get_tool("submit_evaluation",
+                            "Submit your evaluation of whether the task is complete and whether an error occurred.",
+                            {"type": "object",
+                             "properties": {"reasoning": {"type": "string"},
+                                            "complete": {"type": "string", "enum": ["yes", "no"]},
+                                            "error": {"type": "string", "enum": ["yes", "no"]}},
+                             "required": ["reasoning", "complete", "error"],
+                             "additionalProperties": False})
+
+# Tags an XML ballot may contain, for local repair of malformed votes; anything else inside them is text
+VOTE_TAGS = {"root": ["reasoning", "ranking", "best_candidate", "worst_candidate", "complete", "error"]}
+
+# How ranked ballots are combined: borda, kemeny or bradley_terry
+VOTE_AGGREGATION = os.environ.get("VOTE_AGGREGATION") or "borda"
+
+# Vote fan-outs are cut once the outstanding votes can no longer change the result, assuming up to this
+# fraction of them could swing it: 1.0 never changes the outcome, lower values save more calls at some risk
+VOTE_STOP_MARGIN = float(os.environ.get("VOTE_STOP_MARGIN") or 1.0)
+
+# XML ballots that still don't parse after the LLM fix rounds are left out of the tally instead of failing the step
+DROP_UNPARSEABLE_VOTES = os.environ.get("DROP_UNPARSEABLE_VOTES", "True") == "True"
+
 REMOTE_EXAMPLE_COUNT = int(os.environ.get("REMOTE_EXAMPLE_COUNT", "4"))
 
+# Step history compaction: stdout/stderr beyond STEP_OUTPUT_CHARS are cut to head and tail (the full
+# text is spilled to log_dir), only the last STEP_CODE_KEEP steps keep their code verbatim, and the
+# oldest steps are collapsed until the history fits STEP_HISTORY_TOKENS
+STEP_OUTPUT_CHARS = int(os.environ.get("STEP_OUTPUT_CHARS") or 2000)
+STEP_CODE_KEEP = int(os.environ.get("STEP_CODE_KEEP") or 2)
+STEP_HISTORY_TOKENS = int(os.environ.get("STEP_HISTORY_TOKENS") or 12000)
+
 EVAL_CATEGORIES = ["correctness", "elegance", "understandability", "specificity", "overall"]
 
 RESULT_FILENAME = "run_results.txt"
+STEP_ARCHIVE_FILENAME = "step_archive.jsonl"
 
 TEMP = 0.7
 
 
+def get_ranking_ballot_tool(candidate_count: int) -> dict:
+    # Built per fan-out so a candidate number that doesn't exist fails validation (and the ballot is re-requested)
+    # instead of reaching the tally
+    return get_tool("submit_ranking",
+                    "Submit your evaluation of the candidates, ranking every candidate number from best to worst.",
+                    {"type": "object",
+                     "properties": {"reasoning": {"type": "string"},
+                                    "ranking": {"type": "array",
+                                                "items": {"type": "integer", "minimum": 1, "maximum": candidate_count},
+                                                "minItems": 1}},
+                     "required": ["reasoning", "ranking"],
+                     "additionalProperties": False})
+
+
 class ToT(Agent):
     PRINT_PREFIX = "[blue][bold][ToT][/bold][/blue]"
 
@@ -58,6 +131,17 @@ class ToT(Agent):
 
         self.client = client
 
+        # Seeded from RANDOM_SEED (or the replayed cassette) so candidate order is reproducible
+        self.rng = random.Random(get_seed())
+
+        # Filled in by early-stop checks on the engine loop: state -> votes in hand when it settled
+        self.vote_stops: dict[str, int] = {}
+
+        if VOTE_AGGREGATION not in AGGREGATION_METHODS:
+            error_message = f"{self.PRINT_PREFIX} VOTE_AGGREGATION must be one of {AGGREGATION_METHODS}, got {VOTE_AGGREGATION} (check .env)"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ValueError(error_message)
+
         tot_dir, input_dir, output_dir = os.environ.get("TOT_DIR"), os.environ.get("INPUT_DIR"), os.environ.get("OUTPUT_DIR")
         if tot_dir is None:
             error_message = f"{self.PRINT_PREFIX} TOT_DIR environment variable not set (check .env)"
@@ -86,8 +170,8 @@ class ToT(Agent):
 
         self.code_executor = CodeExecutor(prefix=self.PRINT_PREFIX, owner_name=self.name)
 
-        self.unified_memory = Memory(prefix=self.PRINT_PREFIX)
-        self.unified_steps = []
+        self.unified_memory = Memory(prefix=self.PRINT_PREFIX, owner="TOT")
+        self.unified_steps: list[ToTStep] = []
 
         self.interrupt_listener = keyboard.Listener(on_press=self.on_press)
         self.interrupt_listener.start()
@@ -105,7 +189,7 @@ class ToT(Agent):
         self.interrupted = False
 
         try:
-            self.current_task: Optional[str] = xml2xmlstr(dict2xml(self.tasks[-1]))
+            self.current_task: Optional[str] = dict2xmlstr(self.tasks[-1])
 
             rprint(f"{self.PRINT_PREFIX}[yellow][bold] Press the escape key at any time to stop the agent[/bold][/yellow]")
 
@@ -139,12 +223,13 @@ class ToT(Agent):
             self.open_step_tag = f"<step_{self.step_num}>"
             self.close_step_tag = f"</step_{self.step_num}>"
 
-            self.unified_step: dict = {}
+            self.unified_step = ToTStep()
 
             while self.csm.current_state.name != "Done":
                 self.check_interrupt()
                 
                 state_path = self.csm.current_state.get_hpath()
+                set_call_context(self.name, state_path, os.path.basename(self.log_dir))
                                             
                 match state_path:
                     
@@ -160,22 +245,26 @@ class ToT(Agent):
                         start_seq = self.open_step_tag + "<plan>"
                         assistant_prompt = get_msg(Role.ASSISTANT, start_seq)
 
-                        messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                        messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
 
-                        # re-implement set() optimizaiton after verifying it doesn't interfere with shuffling logic                     
-                        plan_candidates: list[str] = llm_turns(client=self.client,
+                        raw_plans: list[str] = llm_turns(client=self.client,
                                                             prompts={"system": system_prompt,
                                                                      "messages": messages},
                                                             stop_sequences=["</plan>"],
                                                             temperature=TEMP,
-                                                            n=PLAN_COUNT)
-                        
-                        self.unified_step['plan_candidates'] = plan_candidates
+                                                            n=PLAN_COUNT,
+                                                            quorum=PLAN_QUORUM,
+                                                            deadline=QUORUM_DEADLINE)
+
+                        # Identical and near-identical samples are voted on once; how often each came up is kept as a prior for reduce_scores
+                        plan_candidates, plan_multiplicities = self.collapse_candidates(raw_plans)
+
+                        self.unified_step.plan_candidates = plan_candidates
 
-                        if len(self.unified_step['plan_candidates']) != 1:
+                        if len(self.unified_step.plan_candidates) != 1:
                             self.csm.transition("PlanVote", locals())
                         else:
-                            self.unified_step['best_plan'] = next(iter(self.unified_step['plan_candidates']))
+                            self.unified_step.best_plan = next(iter(self.unified_step.plan_candidates))
                             self.csm.transition("Propose", locals())
 
                     # TODO: Parallelize
@@ -198,30 +287,32 @@ class ToT(Agent):
                                                                                                             "task": self.current_task,
                                                                                                             "plan_candidates_str": plan_candidates_str,
                                                                                                             "suffix": ", taking into consideration the results of what you have already done in prior steps:" if self.step_num > 1 else ":"}))
-                            messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                            messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
 
                             prompts.append({"system": system_prompt,
                                             "messages": messages})
                             plan_index_maps.append(shuffled_indices)
 
-                        plan_votes = llm_turns(client=self.client,
-                                                prompts=prompts,
-                                                stop_sequences=["</evaluation>"],
-                                                temperature=TEMP,
-                                                n=None)
+                        vote_start = time.monotonic()
+                        plan_votes = self.collect_votes(prompts,
+                                                        get_ranking_ballot_tool(len(plan_candidates)),
+                                                        n=None,
+                                                        early_stop=self.scores_early_stop(state_path, plan_index_maps, plan_multiplicities))
+                        self.report_vote_savings(state_path, vote_start)
 
                         self.csm.transition("SumPlanVotes", locals())
 
                     case "SumPlanVotes":
                         plan_scores = self.reduce_scores(plan_candidates,
                                                          plan_votes,
-                                                         plan_index_maps)
+                                                         plan_index_maps,
+                                                         plan_multiplicities)
                         
                         self.csm.transition("ChoosePlan", locals())
 
                     case "ChoosePlan":
                         best_plan = self.choose(plan_candidates, plan_scores)
-                        self.unified_step['best_plan'] = best_plan
+                        self.unified_step.best_plan = best_plan
 
                         self.csm.transition("Propose", locals())
 
@@ -231,28 +322,30 @@ class ToT(Agent):
 
                         user_prompt = get_msg(Role.USER, load_user_prompt(state_path, "TOT_DIR", None, {"step_num": str(self.step_num),
                                                                                                         "task": self.current_task,
-                                                                                                        "plan": self.unified_step['best_plan'],
+                                                                                                        "plan": self.unified_step.best_plan,
                                                                                                         "suffix": ", taking into consideration the results of what you have already done in prior steps:" if self.step_num > 1 else ":"}))
                         
                         start_seq = self.open_step_tag + "<implementation>" + "\n" + "```python"
                         assistant_prompt = get_msg(Role.ASSISTANT, start_seq)
                         
-                        messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                        messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
 
-                        # re-implement set() optimizaiton after verifying it doesn't interfere with shuffling logic
                         raw_proposals: list[str] = llm_turns(client=self.client,
                                                              prompts={"system": system_prompt,
                                                                       "messages": messages},
                                                              stop_sequences=["```"],
                                                              temperature=TEMP,
-                                                             n=PROPOSAL_COUNT)
+                                                             n=PROPOSAL_COUNT,
+                                                             quorum=PROPOSAL_QUORUM,
+                                                             deadline=QUORUM_DEADLINE)
                             
-                        proposal_candidates = ["```python" + raw_proposal + "```" for raw_proposal in raw_proposals]
+                        proposal_candidates, proposal_multiplicities = self.collapse_candidates(["```python" + raw_proposal + "```" for raw_proposal in raw_proposals], threshold=0)
+                        self.unified_step.proposal_candidates = proposal_candidates
                         
                         if len(proposal_candidates) != 1:
                             self.csm.transition("ProposeVote", locals())
                         else:
-                            self.unified_step['best_proposition'] = next(iter(proposal_candidates))
+                            self.unified_step.best_proposition = next(iter(proposal_candidates))
                             self.csm.transition("Exec", locals())
 
                     # TODO: Parallelize
@@ -273,39 +366,41 @@ class ToT(Agent):
 
                             user_prompt = get_msg(Role.USER, load_user_prompt(state_path, "TOT_DIR", None, {"step_num": str(self.step_num),
                                                                                                             "task": self.current_task,
-                                                                                                            "plan": self.unified_step['best_plan'],
+                                                                                                            "plan": self.unified_step.best_plan,
                                                                                                             "proposal_candidates_str": proposal_candidates_str,
                                                                                                             "suffix": ", taking into consideration the results of what you have already done in prior steps:" if self.step_num > 1 else ":"}))
                             
-                            messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                            messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
                             
                             prompts.append({"system": system_prompt,
                                             "messages": messages})
                             proposal_index_maps.append(shuffled_indices)
 
-                        proposal_votes = llm_turns(client=self.client,
-                                                    prompts=prompts,
-                                                    stop_sequences=["</evaluation>"],
-                                                    temperature=TEMP,
-                                                    n=None)
+                        vote_start = time.monotonic()
+                        proposal_votes = self.collect_votes(prompts,
+                                                            get_ranking_ballot_tool(len(proposal_candidates)),
+                                                            n=None,
+                                                            early_stop=self.scores_early_stop(state_path, proposal_index_maps, proposal_multiplicities))
+                        self.report_vote_savings(state_path, vote_start)
 
                         self.csm.transition("SumProposeVotes", locals())
 
                     case "SumProposeVotes":
                         proposal_scores = self.reduce_scores(proposal_candidates,
                                                              proposal_votes,
-                                                             proposal_index_maps)
+                                                             proposal_index_maps,
+                                                             proposal_multiplicities)
 
                         self.csm.transition("ChooseProposition", locals())
 
                     case "ChooseProposition":
                         best_proposition = self.choose(proposal_candidates, proposal_scores)
-                        self.unified_step['best_proposition'] = best_proposition
+                        self.unified_step.best_proposition = best_proposition
 
                         self.csm.transition("Exec", locals())
 
                     case "Exec":
-                        fenced_code = self.unified_step['best_proposition']
+                        fenced_code = self.unified_step.best_proposition
                         
                         parsed_code = extract_language_and_code(fenced_code)
                         if not parsed_code:
@@ -327,15 +422,15 @@ class ToT(Agent):
                         rprint(f"{self.PRINT_PREFIX} stderr:")
                         print(stderr, end='')
 
-                        self.unified_step['output'] = stdout
-                        self.unified_step['error'] = stderr
+                        self.unified_step.output = self.compact_output(stdout, "stdout")
+                        self.unified_step.error = self.compact_output(stderr, "stderr")
 
                         self.csm.transition("ExecVote", locals())
 
                     case "PlanErrorFix":
                         previous_step = self.unified_steps[-1]
 
-                        frmt = {"step_num": str(self.step_num), "task": self.current_task, "error": previous_step['error'], "output": previous_step['output']}
+                        frmt = {"step_num": str(self.step_num), "task": self.current_task, "error": previous_step.error, "output": previous_step.output}
 
                         system_prompt = load_system_prompt(state_path, "TOT_DIR", frmt)      
                         user_prompt = get_msg(Role.USER, load_user_prompt(state_path, "TOT_DIR", None, frmt))
@@ -343,45 +438,51 @@ class ToT(Agent):
                         start_seq = self.open_step_tag + "<plan>"
                         assistant_prompt = get_msg(Role.ASSISTANT, start_seq)
 
-                        messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                        messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
                                                     
-                        plan_candidates: list[str] = llm_turns(client=self.client,
+                        raw_plans: list[str] = llm_turns(client=self.client,
                                                             prompts={"system": system_prompt,
                                                                     "messages": messages},
                                                             stop_sequences=["</plan>"],
                                                             temperature=TEMP,
-                                                            n=PLAN_COUNT)
-                        
-                        self.unified_step['plan_candidates'] = plan_candidates
+                                                            n=PLAN_COUNT,
+                                                            quorum=PLAN_QUORUM,
+                                                            deadline=QUORUM_DEADLINE)
+
+                        # Identical and near-identical samples are voted on once; how often each came up is kept as a prior for reduce_scores
+                        plan_candidates, plan_multiplicities = self.collapse_candidates(raw_plans)
 
-                        if len(self.unified_step['plan_candidates']) != 1:
+                        self.unified_step.plan_candidates = plan_candidates
+
+                        if len(self.unified_step.plan_candidates) != 1:
                             self.csm.transition("PlanVote", locals())
                         else:
-                            self.unified_step['best_plan'] = next(iter(self.unified_step['plan_candidates']))
+                            self.unified_step.best_plan = next(iter(self.unified_step.plan_candidates))
                             self.csm.transition("Propose", locals())
 
                     case "ExecVote":
                         system_prompt = load_system_prompt(state_path, "TOT_DIR", {"task": self.current_task})
                         user_prompt = get_msg(Role.USER, load_user_prompt(state_path, "TOT_DIR", None, {"step_num": str(self.step_num),
                                                                                                         "task": self.current_task,
-                                                                                                        "plan": self.unified_step['best_plan'],
-                                                                                                        "implementation": self.unified_step['best_proposition'],
-                                                                                                        "output": self.unified_step['output'],
-                                                                                                        "error": self.unified_step['error']}))
+                                                                                                        "plan": self.unified_step.best_plan,
+                                                                                                        "implementation": self.unified_step.best_proposition,
+                                                                                                        "output": self.unified_step.output,
+                                                                                                        "error": self.unified_step.error}))
                         
                         start_seq = self.open_step_tag + "<evaluation>"
                         assistant_prompt = get_msg(Role.ASSISTANT, start_seq)
 
-                        messages = self.unified_memory.conversation_history + [user_prompt, assistant_prompt]
+                        messages = self.unified_memory.get_history_view().extend(user_prompt, assistant_prompt)
                         
-                        exec_votes: list[str] = llm_turns(client=self.client,
-                                                          prompts={"system": system_prompt,
-                                                                   "messages": messages},
-                                                          stop_sequences=["</evaluation>"],
-                                                          temperature=TEMP,
-                                                          n=VOTER_COUNT)
+                        vote_start = time.monotonic()
+                        exec_votes = self.collect_votes({"system": system_prompt,
+                                                         "messages": messages},
+                                                        EXEC_BALLOT_TOOL,
+                                                        n=VOTER_COUNT,
+                                                        early_stop=self.make_early_stop(state_path, self.exec_votes_settled))
+                        self.report_vote_savings(state_path, vote_start)
                         
-                        self.unified_step['exec_vote_strs'] = exec_votes
+                        self.unified_step.exec_vote_strs = [exec_votes[i] for i in sorted(exec_votes)]
 
                         self.csm.transition("SumExecVote", locals())
 
@@ -405,7 +506,7 @@ class ToT(Agent):
     def finalize_task(self) -> None:
         if self.current_task:
             self.code_executor.condense_code_files(self.current_task)
-            
+
             PROVIDE_FEEDBACK = os.environ.get("PROVIDE_FEEDBACK") == "True"
             if PROVIDE_FEEDBACK:
                 feedback = self.get_feedback()
@@ -416,6 +517,14 @@ class ToT(Agent):
             else:
                 rprint(f"[yellow][bold]{self.PRINT_PREFIX} PROVIDE_FEEDBACK not set to \"True\" in .env - not collecting performance feedback[/bold][/yellow]")
 
+            # After the feedback, whose clarification calls are made under this task too
+            telemetry = get_telemetry()
+            call_records = telemetry.pop_records(task=os.path.basename(self.log_dir))
+            telemetry.print_summary(call_records, f"LLM calls for {os.path.basename(self.log_dir)}")
+            telemetry.dump(call_records, os.path.join(self.log_dir, TELEMETRY_FILENAME))
+            rprint(f"{self.PRINT_PREFIX} XML parse outcomes (process-wide): {get_repair_stats()}")
+            set_call_context(self.name, None)
+
             self.trace = ""
             self.current_task = None
 
@@ -426,18 +535,21 @@ class ToT(Agent):
             raise ExecError(error_message)   
     
     def next_step(self) -> None:
-        unified_user_str, unified_assistant_str = self.step2str()
-        self.log_step(unified_user_str, unified_assistant_str)
+        if self.unified_step.vote_savings:
+            saved_calls = sum(vote_savings['calls'] for vote_savings in self.unified_step.vote_savings.values())
+            saved_seconds = sum(vote_savings['seconds'] for vote_savings in self.unified_step.vote_savings.values())
+            rprint(f"{self.PRINT_PREFIX} step {self.step_num} vote early stopping saved {saved_calls} calls (~{saved_seconds:0.1f}s): {self.unified_step.vote_savings}")
 
-        unified_user_msg = get_msg(Role.USER, unified_user_str)
-        unified_assistant_msg = get_msg(Role.ASSISTANT, unified_assistant_str)
+        unified_user_str, unified_assistant_str = self.step2str(self.unified_step, self.step_num)
+        self.log_step(unified_user_str, unified_assistant_str)
 
-        self.unified_memory.add_msg(unified_user_msg)
-        self.unified_memory.add_msg(unified_assistant_msg)
+        # Finalized steps keep only what the history renders; candidates and votes go to the run log
+        self.unified_step.archive(os.path.join(self.log_dir, STEP_ARCHIVE_FILENAME), self.step_num)
+        self.unified_steps.append(self.unified_step)
+        self.rebuild_step_history()
 
         self.step_num += 1
-        self.unified_steps.append(self.unified_step)
-        self.unified_step: dict = {}
+        self.unified_step = ToTStep()
         self.open_step_tag = f"<step_{self.step_num}>"
         self.close_step_tag = f"</step_{self.step_num}>"
 
@@ -560,6 +672,8 @@ If you believe it was optimal, please indicate this."""
     
     # TODO: return the LLM's self-commentary
     def clarify_feedback(self, feedback: dict) -> Optional[str]:
+        set_call_context(self.name, "ClarifyFeedback", os.path.basename(self.log_dir))
+
         if self.current_task:
             with open(os.path.join(self.log_dir, RESULT_FILENAME), 'r') as logfile:
                 system_prompt = load_system_prompt("ClarifyFeedback", "TOT_DIR", {'task': self.current_task,
@@ -576,7 +690,7 @@ If you believe it was optimal, please indicate this."""
         
         messages = [user_prompt, assistant_prompt]
         
-        llm_response = llm_turns(self.client, {'system': system_prompt, 'messages': messages}, ["</reflection>"], TEMP, 1)[0]
+        llm_response = llm_turn(self.client, {'system': system_prompt, 'messages': messages}, ["</reflection>"], TEMP, hedge="ToT.ClarifyFeedback")
 
         correct_interpretation = get_yes_no_input(f"""\n[{FRIENDLY_COLOR}]Before your feedback is submitted, let's make sure the LLM understands your intentions.
 Here's how it interprets your feedback on the last run:[/{FRIENDLY_COLOR}]
@@ -597,7 +711,7 @@ Here's how it interprets your feedback on the last run:[/{FRIENDLY_COLOR}]
                 messages.append(get_msg(Role.ASSISTANT, """Here's a revised interpretation of your feedback based on your correction:
 <revised_reflection>"""))
                 
-                llm_response = llm_turns(self.client, {'system': system_prompt, 'messages': messages}, ["</revised_reflection>"], TEMP, 1)[0]
+                llm_response = llm_turn(self.client, {'system': system_prompt, 'messages': messages}, ["</revised_reflection>"], TEMP, hedge="ToT.ClarifyFeedback")
 
                 correct_interpretation = get_yes_no_input(f"""Here's a revised interpetation:
 {llm_response}
@@ -606,30 +720,86 @@ Here's how it interprets your feedback on the last run:[/{FRIENDLY_COLOR}]
             return llm_response
 
 
-    def step2str(self) -> tuple[str, str]:
-        if self.step_num > 1:
+    def step2str(self, unified_step: ToTStep, step_num: int, with_code: bool = True, with_output: bool = True) -> tuple[str, str]:
+        if step_num > 1:
             suffix = ", taking into consideration the results of what you have already done in prior steps:"
         else:
             suffix = ":"
         
-        unified_user_str = f"Plan and implement step {self.step_num}" + suffix
+        unified_user_str = f"Plan and implement step {step_num}" + suffix
+
+        if with_code:
+            implementation = unified_step.best_proposition
+        else:
+            implementation = self.code_reference(unified_step, step_num)
 
-        unified_assistant_str = f"""<plan>{self.unified_step['best_plan']}</plan>
+        unified_assistant_str = f"""<plan>{unified_step.best_plan}</plan>
 <implementation>
-{self.unified_step['best_proposition']}
-</implementation>
+{implementation}
+</implementation>"""
+
+        if with_output:
+            unified_assistant_str += f"""
 <stdout>
-{self.unified_step['output']}
+{unified_step.output}
 </stdout>
 <stderr>
-{self.unified_step['error']}
+{unified_step.error}
 </stderr>"""
 
         return unified_user_str, unified_assistant_str
 
+    def code_reference(self, unified_step: ToTStep, step_num: int) -> str:
+        # Stands in for the code of an older step: it has already run, so only what it left defined matters.
+        # Step files stay in CODE_DIR until finalize_task condenses them into prior_code.py
+        reference = f"```python\n# step_{step_num} already executed - its code is in {os.path.join(self.code_executor.CODE_DIR, f'step_{step_num}.py')}\n"
+
+        parsed_code = extract_language_and_code(unified_step.best_proposition)
+        defined_names = get_defined_names(parsed_code[1]) if parsed_code else None
+        if defined_names:
+            reference += f"# still defined: {', '.join(defined_names)}\n"
+
+        return reference + "```"
+
+    def compact_output(self, text: str, name: str) -> str:
+        if len(text) <= STEP_OUTPUT_CHARS:
+            return text
+
+        spill_filename = f"step_{self.step_num}_{name}.txt"
+        with open(os.path.join(self.log_dir, spill_filename), 'w', errors="replace") as spill_file:
+            spill_file.write(text)
+
+        return truncate_middle(text, STEP_OUTPUT_CHARS, note=f"full {name} in {spill_filename}")
+
+    def rebuild_step_history(self) -> None:
+        step_count = len(self.unified_steps)
+
+        rendered_steps = [self.step2str(unified_step, i + 1, with_code=i >= step_count - STEP_CODE_KEEP)
+                          for i, unified_step in enumerate(self.unified_steps)]
+
+        def history_tokens() -> int:
+            return sum(estimate_prompt_tokens(user_str, [get_msg(Role.ASSISTANT, assistant_str)]) for user_str, assistant_str in rendered_steps)
+
+        # Oldest steps go down to their plan first, then are dropped; the latest step is always kept whole
+        for i in range(step_count - 1):
+            if history_tokens() <= STEP_HISTORY_TOKENS:
+                break
+            rendered_steps[i] = self.step2str(self.unified_steps[i], i + 1, with_code=False, with_output=False)
+
+        while len(rendered_steps) > 1 and history_tokens() > STEP_HISTORY_TOKENS:
+            rendered_steps.pop(0)
+
+        if len(rendered_steps) < step_count:
+            rprint(f"{self.PRINT_PREFIX} step history over {STEP_HISTORY_TOKENS} tokens - dropped the oldest {step_count - len(rendered_steps)} steps")
+
+        self.unified_memory.clear_history()
+        for unified_user_str, unified_assistant_str in rendered_steps:
+            self.unified_memory.add_msg(get_msg(Role.USER, unified_user_str))
+            self.unified_memory.add_msg(get_msg(Role.ASSISTANT, unified_assistant_str))
+
     def format_candidates(self, candidates: list[str]):
         shuffled_indices = [i for i in range(len(candidates))]
-        random.shuffle(shuffled_indices)
+        self.rng.shuffle(shuffled_indices)
 
         formatted_candidates: str = "<candidates>\n"
 
@@ -642,53 +812,87 @@ Here's how it interprets your feedback on the last run:[/{FRIENDLY_COLOR}]
 
         return shuffled_indices, formatted_candidates
     
-    def choose(self, candidates: list[str], scores: list[int]) -> str:
+    def collapse_candidates(self, candidates: list[str], threshold: float = CLUSTER_THRESHOLD) -> tuple[list[str], list[int]]:
+        unique_candidates, multiplicities = cluster_candidates(*dedupe_candidates(candidates), threshold=threshold)
+
+        if len(unique_candidates) < len(candidates):
+            rprint(f"{self.PRINT_PREFIX} collapsed {len(candidates)} candidates into {len(unique_candidates)}: {multiplicities}")
+
+        return unique_candidates, multiplicities
+
+    def choose(self, candidates: list[str], scores: list[float]) -> str:
         best_plan = candidates[np.argmax(scores)]
         rprint(f"{self.PRINT_PREFIX} best_plan:\n{best_plan}")
 
         return best_plan
     
-    def reduce_scores(self, plan_candidates: list[str], candidate_votes: list[str], index_maps: list[list[int]]) -> list[int]:
-        scores = [0] * len(plan_candidates)
-
-        assert len(candidate_votes) == len(index_maps)
-
-        for vote_i, vote in enumerate(candidate_votes):
-            parsed_scores = xmlstr2dict(vote, self.client)
-
-            best_candidate_shuffled_idx = int(parsed_scores['best_candidate'])
-            worst_candidate_shuffled_idx = int(parsed_scores['worst_candidate'])
-
-            index_map = index_maps[vote_i]
-
-            best_candidate_abs_idx = index_map[best_candidate_shuffled_idx-1]
-            worst_candidate_abs_idx = index_map[worst_candidate_shuffled_idx-1]
-
-            scores[best_candidate_abs_idx] += 1
-            scores[worst_candidate_abs_idx] -= 1
-
-        rprint(f"{self.PRINT_PREFIX} scores: {scores}")
+    def collect_votes(self, prompts: PromptsDict | list[PromptsDict], tool: dict, n: Optional[int], early_stop: Optional[Callable]) -> dict[int, str] | dict[int, dict]:
+        if STRUCTURED_VOTES:
+            # A forced tool call can't continue a prefilled assistant turn, so the <evaluation> prefill is dropped
+            prompt_list = [prompts] if isinstance(prompts, dict) else prompts
+            structured_prompts = [{"system": prompt['system'], "messages": prompt['messages'][:-1]} for prompt in prompt_list]
+
+            return llm_structured_indexed(client=self.client,
+                                          prompts=structured_prompts[0] if isinstance(prompts, dict) else structured_prompts,  # type: ignore
+                                          tool=tool,
+                                          temperature=TEMP,
+                                          n=n,
+                                          quorum=VOTER_QUORUM,
+                                          deadline=QUORUM_DEADLINE,
+                                          early_stop=early_stop)
+
+        return llm_turns_indexed(client=self.client,
+                                 prompts=prompts,
+                                 stop_sequences=["</evaluation>"],
+                                 temperature=TEMP,
+                                 n=n,
+                                 quorum=VOTER_QUORUM,
+                                 deadline=QUORUM_DEADLINE,
+                                 early_stop=early_stop)
+
+    def parse_vote(self, vote: str | dict, client: Optional[Anthropic]) -> dict:
+        # Structured ballots arrive already parsed and validated
+        return vote if isinstance(vote, dict) else xmlstr2dict(vote, client, expected_tags=VOTE_TAGS)
+
+    def parse_votes(self, votes: dict[int, str] | dict[int, dict]) -> dict[int, dict]:
+        # XML ballots are parsed as a batch, so malformed ones share each LLM fix round instead of queueing behind each other
+        parsed_votes = {vote_i: vote for vote_i, vote in votes.items() if isinstance(vote, dict)}
+        parsed_votes.update(xmlstrs2dicts({vote_i: vote for vote_i, vote in votes.items() if isinstance(vote, str)},
+                                          self.client,
+                                          expected_tags=VOTE_TAGS,
+                                          drop_failed=DROP_UNPARSEABLE_VOTES))
+
+        return dict(sorted(parsed_votes.items()))
+
+    def reduce_scores(self, plan_candidates: list[str], candidate_votes: dict[int, str] | dict[int, dict], index_maps: list[list[int]], multiplicities: list[int]) -> list[float]:
+        parsed_votes = self.parse_votes(candidate_votes)
+        scores = self.tally_scores(parsed_votes, index_maps, multiplicities)
+
+        rprint(f"{self.PRINT_PREFIX} {VOTE_AGGREGATION} scores: {scores}")
+        rprint(f"{self.PRINT_PREFIX} margin: {get_margin(np.array(scores), len(parsed_votes)):0.2f}")
 
         return scores
 
-    def reduce_scores_exec(self, unified_step: dict[str, str | list[str]]) -> tuple[float, float]:
-        sum_yes_votes = 0
-        avg_yes_votes = 0
+    def tally_scores(self, parsed_votes: dict[int, dict], index_maps: list[list[int]], multiplicities: list[int]) -> list[float]:
+        # parsed_votes is keyed by voter, so each ballot is read against the shuffle that voter saw.
+        # Candidates sampled more than once start ahead (in rank positions), so repeated agreement breaks close votes
+        prior = np.array([(count - 1) * MULTIPLICITY_PRIOR for count in multiplicities])
 
-        sum_error_votes = 0
-        avg_error_votes = 0
+        if not parsed_votes:
+            return prior.tolist()
 
-        for exec_vote_str in unified_step['exec_vote_strs']:
-            parsed_scores = xmlstr2dict(exec_vote_str, self.client)
+        points = np.stack([ballot_points(parsed_scores, index_maps[vote_i]) for vote_i, parsed_scores in parsed_votes.items()])
 
-            if parsed_scores['complete'] == "yes":
-                sum_yes_votes += 1
+        return (aggregate(points, VOTE_AGGREGATION) + prior).tolist()
 
-            if parsed_scores['error'] == "yes":
-                sum_error_votes += 1
+    def reduce_scores_exec(self, unified_step: ToTStep) -> tuple[float, float]:
+        parsed_votes = list(self.parse_votes(dict(enumerate(unified_step.exec_vote_strs))).values())
+        sum_yes_votes, sum_error_votes = self.tally_exec_votes(parsed_votes)
 
-        avg_yes_votes = sum_yes_votes / VOTER_COUNT
-        avg_error_votes = sum_error_votes / VOTER_COUNT
+        # Averaged over the votes that actually arrived and parsed, which may be fewer than VOTER_COUNT
+        vote_count = max(1, len(parsed_votes))
+        avg_yes_votes = sum_yes_votes / vote_count
+        avg_error_votes = sum_error_votes / vote_count
         
         rprint(f"{self.PRINT_PREFIX} sum_yes_votes: {sum_yes_votes}")
         rprint(f"{self.PRINT_PREFIX} avg_yes_votes: {avg_yes_votes}")
@@ -696,4 +900,65 @@ Here's how it interprets your feedback on the last run:[/{FRIENDLY_COLOR}]
         rprint(f"{self.PRINT_PREFIX} sum_error_votes: {sum_error_votes}")
         rprint(f"{self.PRINT_PREFIX} avg_error_votes: {avg_error_votes}")
         
-        return avg_yes_votes, avg_error_votes
\ No newline at end of file
+        return avg_yes_votes, avg_error_votes
+
+    def tally_exec_votes(self, parsed_votes: list[dict]) -> tuple[int, int]:
+        sum_yes_votes = sum(parsed_scores['complete'] == "yes" for parsed_scores in parsed_votes)
+        sum_error_votes = sum(parsed_scores['error'] == "yes" for parsed_scores in parsed_votes)
+
+        return sum_yes_votes, sum_error_votes
+
+    def exec_votes_settled(self, parsed_votes: dict[int, dict], remaining: int) -> bool:
+        sum_yes_votes, sum_error_votes = self.tally_exec_votes(list(parsed_votes.values()))
+
+        return majority_settled(sum_yes_votes, len(parsed_votes), remaining, VOTE_STOP_MARGIN) and \
+               majority_settled(sum_error_votes, len(parsed_votes), remaining, VOTE_STOP_MARGIN)
+
+    def scores_early_stop(self, state: str, index_maps: list[list[int]], multiplicities: list[int]) -> Optional[Callable[[dict[int, str] | dict[int, dict], int], bool]]:
+        # The bound only holds for Borda's additive scores - Kemeny and Bradley-Terry can reorder on any ballot
+        if VOTE_AGGREGATION != "borda":
+            return None
+
+        return self.make_early_stop(state, lambda parsed_votes, remaining: scores_settled(self.tally_scores(parsed_votes, index_maps, multiplicities),
+                                                                                          remaining,
+                                                                                          VOTE_STOP_MARGIN,
+                                                                                          vote_range=len(multiplicities) - 1))
+
+    def make_early_stop(self, state: str, settled: Callable[[dict[int, dict], int], bool]) -> Callable[[dict[int, str] | dict[int, dict], int], bool]:
+        # Runs on the engine loop as votes arrive, so votes are parsed without the LLM fix; any that
+        # don't parse (yet) are counted as outstanding
+        def early_stop(votes: dict[int, str] | dict[int, dict], remaining: int) -> bool:
+            parsed_votes = {}
+            for vote_i, vote in votes.items():
+                try:
+                    parsed_votes[vote_i] = self.parse_vote(vote, None)
+                except ET.ParseError:
+                    pass
+
+            try:
+                stop = settled(parsed_votes, remaining + len(votes) - len(parsed_votes))
+            except (KeyError, ValueError, IndexError, TypeError):
+                return False
+
+            if stop:
+                self.vote_stops[state] = len(votes)
+
+            return stop
+
+        return early_stop
+
+    def report_vote_savings(self, state: str, start: float) -> None:
+        received = self.vote_stops.pop(state, None)
+        if received is None:
+            return
+
+        requested = min(VOTER_COUNT, VOTER_QUORUM)
+        elapsed = time.monotonic() - start
+
+        # Votes run in parallel and arrive roughly evenly spread, so waiting for the rest is estimated
+        # to have taken requested / received times as long
+        vote_savings = {"calls": requested - received,
+                        "seconds": elapsed * (requested / received - 1)}
+        self.unified_step.vote_savings[os.path.basename(state)] = vote_savings
+
+        rprint(f"{self.PRINT_PREFIX} {os.path.basename(state)} settled after {received} of {requested} votes, saving {vote_savings['calls']} calls (~{vote_savings['seconds']:0.1f}s)")
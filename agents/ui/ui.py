@@ -3,9 +3,11 @@ from __future__ import annotations
 import json
 
 import os
+import threading
 import sounddevice as sd
 
 from rich import print
+from rich.markup import escape
 
 from agents.agent import Agent
 from agents.memory import Memory
@@ -15,9 +17,10 @@ from agents.state_management import ConversationStateMachine
 from utils.custom_exceptions import UIError
 from utils.constants import FRIENDLY_COLOR
 
-from utils.parsing import xmlstr2dict
+from utils.parsing import XMLStreamParser, get_tag_delta
 from utils.tts import tts
-from utils.llm import llm_turn
+from utils.llm import llm_stream
+from utils.telemetry import set_call_context
 
 from anthropic import Anthropic
 
@@ -80,7 +83,7 @@ class UI(Agent):
 
         self.csm = ConversationStateMachine(state_data=state_data, transition_data=transition_data, init_state_path='Start', prefix=self.PRINT_PREFIX, owner_class_name="UI")
 
-        self.memory = Memory(environ_path_key="UI_DIR", prefix=self.PRINT_PREFIX)
+        self.memory = Memory(environ_path_key="UI_DIR", prefix=self.PRINT_PREFIX, owner="UI")
         self.agent_manager = AgentManager()
         self.agent_manager.register_agent(self)
 
@@ -91,6 +94,7 @@ class UI(Agent):
 
         while self.csm.current_state.get_hpath() != "Exit":
             print(f"{self.PRINT_PREFIX} At: {self.csm.current_state.get_hpath()}")
+            set_call_context(self.name, self.csm.current_state.get_hpath())
                 
             match self.csm.current_state.get_hpath():
 
@@ -100,19 +104,40 @@ class UI(Agent):
                 case "PrintUIMessage":
                     self.memory.prime_all_prompts(self.csm.current_state.get_hpath(), "UI_DIR", dynamic_metaprompt=" > ")
 
-                    text = llm_turn(client=self.client,
-                                    prompts={'system': self.memory.get_system_prompt(),
-                                             'messages': self.memory.get_messages()},
-                                    stop_sequences=["</output>"],
-                                    temperature=0.7)
-                    
+                    # The <response> is printed as it streams in and goes to TTS as soon as it closes,
+                    # while the <action> is still being generated
+                    text, emitted = "", 0
+                    parser = XMLStreamParser()
+                    tts_thread = None
+                    for delta in llm_stream(client=self.client,
+                                            prompts={'system': self.memory.get_system_prompt(),
+                                                     'messages': self.memory.get_messages()},
+                                            stop_sequences=["</output>"],
+                                            temperature=0.7,
+                                            hedge="UI.PrintUIMessage"):
+                        text += delta
+
+                        response_delta, emitted = get_tag_delta(text, "response", emitted)
+                        if response_delta:
+                            print(f"[{FRIENDLY_COLOR}]{escape(response_delta)}[/{FRIENDLY_COLOR}]", end="")
+
+                        for path, value in parser.feed(delta):
+                            if path == "response" and value and os.environ.get("USE_TTS") == "True":
+                                tts_thread = threading.Thread(target=tts, args=(value,), daemon=True)
+                                tts_thread.start()
+
+                    if emitted:
+                        print()
+
                     self.memory.store_llm_response("<output>" + text + "</output>")
 
-                    parsed_response = xmlstr2dict(text, self.client)
+                    parsed_response = parser.close(self.client)
                     print(f"{self.PRINT_PREFIX} parsed_response:")
                     print(parsed_response)
 
-                    if os.environ.get("USE_TTS") == "True":
+                    if tts_thread is not None:
+                        tts_thread.join()
+                    elif os.environ.get("USE_TTS") == "True":
                         tts(parsed_response["response"])
 
                     if "action" in parsed_response and parsed_response["action"]:
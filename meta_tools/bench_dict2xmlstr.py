@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from rich import print
+
+from utils.parsing import dict2xml, dict2xmlstr, xml2xmlstr
+
+
+# Serializes N task dicts the way AgentManager.get_agents_xmlstr does, through the ElementTree path and directly.
+#   python meta_tools/bench_dict2xmlstr.py [repeats]
+
+REPEATS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+TASK_COUNTS = [10, 100, 1000]
+
+
+def get_task(i: int) -> dict:
+    return {"task": f"Summarize report_{i}.csv & plot the totals",
+            "details": {"input_file": f"~/data/report_{i}.csv",
+                        "columns": "date, region, total",
+                        "chart": {"kind": "bar", "title": f"Totals <{i}>"}}}
+
+def time_path(serialize, tasks: list[dict]) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        "\n".join(serialize(task) for task in tasks)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+def main():
+    print(f"repeats={REPEATS}")
+
+    for task_count in TASK_COUNTS:
+        tasks = [get_task(i) for i in range(task_count)]
+
+        assert all(dict2xmlstr(task) == xml2xmlstr(dict2xml(task)) for task in tasks)
+
+        etree_time = time_path(lambda task: xml2xmlstr(dict2xml(task)), tasks)
+        direct_time = time_path(dict2xmlstr, tasks)
+
+        print(f"{task_count:>5} tasks: etree {etree_time*1e3:8.3f} ms | direct {direct_time*1e3:8.3f} ms | "
+              f"{etree_time / direct_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
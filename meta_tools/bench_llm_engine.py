@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import random
+import statistics
+import concurrent.futures
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+os.environ.setdefault("ANTHROPIC_PROMPT_CACHING", "False")
+
+from rich import print
+
+import utils.llm
+from utils.llm import llm_turns, anthropic_message_to_text
+from utils.llm_stub import StubLLM
+
+
+# Compares the asyncio engine behind llm_turns() against the ThreadPoolExecutor
+# fan-out it replaced, using a stub client with randomised per-request latency.
+#   python meta_tools/bench_llm_engine.py [fan_out] [steps]
+
+FAN_OUT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+STEPS = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+LATENCY_MEAN = 0.05
+
+
+def thread_llm_turns(client, prompts, stop_sequences, temperature, n, max_tokens=4000):
+    texts = [None] * n
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n) as executor:
+        futures = [executor.submit(client.messages.create,
+                                   model=os.environ["ANTHROPIC_MODEL"],
+                                   max_tokens=max_tokens,
+                                   temperature=temperature,
+                                   system=prompts['system'],
+                                   messages=prompts['messages'],
+                                   stop_sequences=stop_sequences) for _ in range(n)]
+        concurrent.futures.wait(futures)
+
+        for i, future in enumerate(futures):
+            texts[i] = anthropic_message_to_text(future.result())
+
+    return [text for text in texts if text is not None]
+
+def run(label, turns_fn, client):
+    prompts = {"system": "You are a stub.", "messages": [{"role": "user", "content": "Plan step 1:"}, {"role": "assistant", "content": "<plan>"}]}
+
+    step_times = []
+    for _ in range(STEPS):
+        start = time.perf_counter()
+        texts = turns_fn(client, prompts, ["</plan>"], 0.7, n=FAN_OUT)
+        step_times.append(time.perf_counter() - start)
+
+        assert len(texts) == FAN_OUT
+
+    print(f"{label:>8}: mean {statistics.mean(step_times)*1000:7.2f} ms | "
+          f"p95 {sorted(step_times)[int(0.95*len(step_times))-1]*1000:7.2f} ms | "
+          f"min {min(step_times)*1000:7.2f} ms")
+
+def main():
+    # Fixed latency isolates the per-call scheduling overhead of each engine
+    stub = StubLLM(latency=LATENCY_MEAN)
+    client = stub.anthropic()
+
+    # Silence per-response logging so it doesn't dominate the measurement
+    utils.llm.print = lambda *args, **kwargs: None
+
+    print(f"fan_out={FAN_OUT} steps={STEPS} latency={LATENCY_MEAN*1000:.0f} ms")
+
+    run("threads", thread_llm_turns, client)
+    run("asyncio", llm_turns, client)
+
+    random.seed(0)
+    stub.latency = lambda request: random.expovariate(1 / LATENCY_MEAN)
+    print("exponential latency:")
+    run("threads", thread_llm_turns, client)
+    run("asyncio", llm_turns, client)
+
+
+if __name__ == "__main__":
+    main()
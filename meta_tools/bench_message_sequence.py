@@ -0,0 +1,83 @@
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from rich import print
+
+import agents.memory
+from agents.memory import Memory
+from agents.prompt_management import get_msg
+from utils.enums import Role
+
+
+# Peak memory and allocations of the prompts ToT builds over a 30-step task, with the history copied into
+# each prompt (get_history() + [...]) and as shared MessageSequence views.
+#   python meta_tools/bench_message_sequence.py [steps]
+
+STEPS = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+VOTER_COUNT = 5
+STEP_CHARS = 6000
+
+# Plan, PlanVote, Propose, ProposeVote and ExecVote prompts of one step
+FAN_OUT = [1, VOTER_COUNT, 1, VOTER_COUNT, 1]
+
+
+def build_prompts(memory: Memory, shared: bool) -> list[dict]:
+    prompts = []
+    for stage, voter_count in enumerate(FAN_OUT):
+        for voter in range(voter_count):
+            user_prompt = get_msg(Role.USER, f"stage {stage} voter {voter}: rank the candidates")
+            assistant_prompt = get_msg(Role.ASSISTANT, "<evaluation>")
+
+            if shared:
+                messages = memory.get_history_view().extend(user_prompt, assistant_prompt)
+            else:
+                messages = memory.get_history() + [user_prompt, assistant_prompt]
+
+            prompts.append({"system": "system", "messages": messages})
+
+    return prompts
+
+def run(shared: bool) -> tuple[int, int]:
+    memory = Memory(owner="BENCH")
+
+    tracemalloc.start()
+    peak, blocks = 0, 0
+
+    for step in range(STEPS):
+        tracemalloc.reset_peak()
+        before_size = tracemalloc.get_traced_memory()[0]
+        before = tracemalloc.take_snapshot()
+
+        # All of a step's prompts are alive together, as they are until the fan-out returns
+        prompts = build_prompts(memory, shared)
+
+        after = tracemalloc.take_snapshot()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before_size)
+        blocks += sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+        del prompts
+
+        memory.add_msg(get_msg(Role.USER, f"<step_{step}>" + "u" * STEP_CHARS))
+        memory.add_msg(get_msg(Role.ASSISTANT, "a" * STEP_CHARS + f"</step_{step}>"))
+
+    tracemalloc.stop()
+
+    return peak, blocks
+
+def main():
+    # A token budget so the history is summarized, as for ToT's own history
+    os.environ["BENCH_HISTORY_TOKENS"] = "30000"
+    agents.memory.print = lambda *args, **kwargs: None
+
+    print(f"steps={STEPS} prompts/step={sum(FAN_OUT)}")
+
+    for shared in (False, True):
+        peak, blocks = run(shared)
+        print(f"{'shared view' if shared else 'list copy':>12}: peak {peak / 1024:9.1f} KiB | {blocks:7d} blocks allocated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import time
+import tempfile
+from copy import deepcopy
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from rich import print
+
+import agents.state_management
+from agents.state_management import ConversationStateMachine
+
+
+# Per-transition cost of ConversationStateMachine.transition over ToT's state graph, with the history kept as
+# deep copies of the exited state (as it used to be) and as the ring buffer of (hpath, trigger, time) records.
+#   python meta_tools/bench_state_history.py [steps]
+
+STEPS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+TOT_INPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "agents", "tot", "data", "input")
+
+# One ToT step that goes through both votes
+STEP_TRIGGERS = ["PlanVote", "SumPlanVotes", "ChoosePlan", "Propose", "ProposeVote", "SumProposeVotes", "ChooseProposition", "Exec", "ExecVote", "SumExecVote", "Plan"]
+
+
+def get_csm() -> ConversationStateMachine:
+    with open(os.path.join(TOT_INPUT_DIR, "states.json")) as file:
+        state_data = json.load(file)
+    with open(os.path.join(TOT_INPUT_DIR, "transitions.json")) as file:
+        transition_data = json.load(file)
+
+    return ConversationStateMachine(state_data=state_data, transition_data=transition_data, init_state_path="Plan", prefix="", owner_class_name="bench")
+
+def run(csm: ConversationStateMachine, deepcopy_history: bool) -> float:
+    copies = []
+
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        for trigger in STEP_TRIGGERS:
+            if deepcopy_history:
+                copies.append(deepcopy(csm.current_state))
+            csm.transition(trigger, {})
+
+    return (time.perf_counter() - start) / (STEPS * len(STEP_TRIGGERS))
+
+def main():
+    os.environ.setdefault("OUTPUT_DIR", tempfile.mkdtemp())
+
+    csm = get_csm()
+    agents.state_management.print = lambda *args, **kwargs: None
+
+    # Callbacks print on every enter/exit; they run either way, so they are silenced for both
+    for state in csm.state_map.values():
+        state.callback = None
+
+    print(f"steps={STEPS} transitions={STEPS * len(STEP_TRIGGERS)}")
+
+    deepcopy_time = run(csm, deepcopy_history=True)
+    ring_time = run(csm, deepcopy_history=False)
+
+    print(f"    deepcopy: {deepcopy_time*1e6:9.1f} us/transition")
+    print(f" ring buffer: {ring_time*1e6:9.1f} us/transition | {deepcopy_time / ring_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import time
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from rich import print
+
+import utils.parsing
+from utils.parsing import xmlstr2dict
+from utils.xml_repair import get_repair_stats
+
+
+# Times local repair over the broken-output corpus used by tests/test_utils/test_xml_repair.py.
+# Each of these used to cost at least one LLM round trip in xmlstr2dict.
+#   python meta_tools/bench_xml_repair.py [repeats]
+
+REPEATS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "test_utils", "data", "xml_repair_corpus.jsonl")
+
+
+def main():
+    with open(CORPUS_PATH, 'r') as corpus_file:
+        corpus = [json.loads(line) for line in corpus_file if line.strip()]
+
+    # Cases without an expected result are left to the LLM fix, which this doesn't measure
+    corpus = [case for case in corpus if case['expected'] is not None]
+
+    # Silence the per-repair notice so it doesn't dominate the measurement
+    utils.parsing.print = lambda *args, **kwargs: None
+
+    print(f"cases={len(corpus)} repeats={REPEATS}")
+
+    for case in corpus:
+        case_times = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            xmlstr2dict(case['xml'], None, expected_tags=case['expected_tags'])
+            case_times.append(time.perf_counter() - start)
+
+        print(f"{case['name']:>24}: mean {statistics.mean(case_times)*1e6:8.1f} us | "
+              f"max {max(case_times)*1e6:8.1f} us")
+
+    print(f"outcomes: {get_repair_stats()}")
+
+
+if __name__ == "__main__":
+    main()
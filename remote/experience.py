@@ -70,7 +70,7 @@ def get_remote_experiences(target_vector_name: str, target_vector_query: str, li
                 result += f"<example idx={i+1}>\n\n"
 
                 result += experience['task'] + "\n"
-                result += f"<os_type>{experience['os_family']}<os_type>" + "\n"
+                result += f"<os_type>{experience['os_family']}</os_type>" + "\n"
 
                 result += experience['trace'] + "\n"
 
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.enums import Role
+from utils.tokens import estimate_prompt_tokens
+
+from agents.memory import Memory
+from agents.prompt_management import get_msg
+
+
+def run_turns(memory: Memory, count: int, length: int = 10) -> None:
+    for i in range(count):
+        memory.add_msg(get_msg(Role.USER, f"user {i} " + "u" * length))
+        memory.add_msg(get_msg(Role.ASSISTANT, f"assistant {i} " + "a" * length))
+
+@pytest.mark.parametrize("env, expected_messages", [
+    ({}, 12),
+    ({"TEST_HISTORY_TURNS": "2"}, 4),
+    ({"TEST_HISTORY_STATELESS": "True"}, 2),
+])
+def test_history_policy(monkeypatch, env: dict[str, str], expected_messages: int):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+
+    memory = Memory(owner="TEST")
+    run_turns(memory, 6)
+
+    assert len(memory.conversation_history) == expected_messages
+    assert memory.get_history()[-1]['content'].startswith("assistant 5")
+
+def test_summary_and_token_budget(monkeypatch):
+    monkeypatch.setenv("TEST_HISTORY_TOKENS", "300")
+
+    memory = Memory(owner="TEST")
+    run_turns(memory, 10, length=200)
+
+    history = memory.get_history()
+
+    assert memory.summary and "user 0" in memory.summary
+    assert history[0]['role'] == Role.USER.value
+    assert history[0]['content'].startswith("<earlier_conversation_summary>")
+    assert estimate_prompt_tokens("", memory.conversation_history) <= 300
+
+def test_history_view(monkeypatch):
+    monkeypatch.setenv("TEST_HISTORY_TOKENS", "300")
+
+    memory = Memory(owner="TEST")
+    run_turns(memory, 10, length=200)
+
+    view = memory.get_history_view()
+
+    assert view == memory.get_history()
+    assert memory.get_history_view() is view
+
+    run_turns(memory, 1)
+
+    assert memory.get_history_view() is not view
+    assert memory.get_history_view() == memory.get_history()
+
+def test_clear_history_resets_summary(monkeypatch):
+    monkeypatch.setenv("TEST_HISTORY_TURNS", "2")
+
+    memory = Memory(owner="TEST")
+    run_turns(memory, 4)
+    summary = memory.summary
+
+    # Rebuilding the same history (as ToT does every step) rolls the same turns into the summary once
+    memory.clear_history()
+    run_turns(memory, 4)
+
+    assert summary and memory.summary == summary
+    assert memory.summary.count("user 0") == 1
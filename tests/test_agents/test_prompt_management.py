@@ -8,7 +8,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".
 from utils.enums import Role
 from utils.custom_types import Message
 
-from agents.prompt_management import get_msg
+from agents.prompt_management import PromptRegistry, PromptTemplate, get_msg, load_system_prompt, load_user_prompt
 
 
 @pytest.mark.parametrize("role, content, expected", [
@@ -16,4 +16,54 @@ from agents.prompt_management import get_msg
     (Role.ASSISTANT, "I am an AI assistant.", {"role": "assistant", "content": "I am an AI assistant."})                                         
 ])
 def test_get_msg(role: Role, content: str, expected: Message):
-    assert get_msg(role, content) == expected
\ No newline at end of file
+    assert get_msg(role, content) == expected
+
+@pytest.fixture
+def prompt_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOT_DIR", str(tmp_path))
+    monkeypatch.setenv("INPUT_DIR", "input")
+    monkeypatch.setenv("SYS_PRMPT_DIR", "system_prompts")
+    monkeypatch.setenv("USR_PRMPT_DIR", "user_prompts")
+    monkeypatch.setattr(PromptRegistry, "_instance", None)
+
+    for prompt_dir_name in ("system_prompts", "user_prompts"):
+        (tmp_path / "input" / prompt_dir_name).mkdir(parents=True)
+        (tmp_path / "input" / prompt_dir_name / "Plan.xml").write_text("<task>{task}</task> step {step_num}, {{literal}}")
+
+    return tmp_path / "input"
+
+@pytest.mark.parametrize("text, frmt", [
+    ("<task>{task}</task>\n<step>{step_num}</step>", {"task": "Plot <data> & more", "step_num": "3"}),
+    ("{{not a field}} {task}{task}", {"task": "x", "unused": "y"}),
+    ("{step_num:>4} {task!r}", {"task": "x", "step_num": "7"}),
+    ("no fields at all", {"task": "x"}),
+])
+def test_prompt_template_render(tmp_path, text: str, frmt: dict[str, str]):
+    (tmp_path / "Prompt.xml").write_text(text)
+
+    assert PromptTemplate(str(tmp_path / "Prompt.xml")).render(frmt) == text.format(**frmt)
+    assert PromptTemplate(str(tmp_path / "Prompt.xml")).render({}) == text
+
+def test_prompt_registry(prompt_dir, monkeypatch):
+    assert ("TOT_DIR", "USR_PRMPT_DIR", "Plan") in PromptRegistry().templates
+
+    assert load_system_prompt("Plan", "TOT_DIR", {"task": "a", "step_num": "1"}) == "<task>a</task> step 1, {literal}"
+
+    with pytest.raises(KeyError):
+        load_user_prompt("Plan", "TOT_DIR", None, {"task": "a"})
+    with pytest.raises(FileNotFoundError):
+        load_user_prompt("Missing", "TOT_DIR", None, {})
+
+@pytest.mark.parametrize("dev_mode, expected", [
+    ("True", "edited a"),
+    ("False", "<task>a</task> step 1, {literal}"),
+])
+def test_prompt_registry_hot_reload(prompt_dir, monkeypatch, dev_mode: str, expected: str):
+    monkeypatch.setenv("DEV_MODE", dev_mode)
+    load_system_prompt("Plan", "TOT_DIR", {"task": "a", "step_num": "1"})
+
+    prompt_path = prompt_dir / "system_prompts" / "Plan.xml"
+    prompt_path.write_text("edited {task}")
+    os.utime(prompt_path, (0, os.path.getmtime(prompt_path) + 10))
+
+    assert load_system_prompt("Plan", "TOT_DIR", {"task": "a", "step_num": "1"}) == expected
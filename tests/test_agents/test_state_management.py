@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import agents.state_management
+from agents.state_management import ConversationStateMachine
+from utils.custom_exceptions import ConversationEdgeError, ConversationNodeError
+
+
+STATE_DATA = {"name": "root", "children": [{"name": "Plan"}, {"name": "Propose"}, {"name": "Exec"}]}
+TRANSITION_DATA = [{"trigger": "Propose", "source": "Plan", "dest": "Propose"},
+                   {"trigger": "Exec", "source": "Propose", "dest": "Exec"},
+                   {"trigger": "Plan", "source": "Exec", "dest": "Plan"}]
+
+
+@pytest.fixture
+def csm(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(agents.state_management, "STATE_HISTORY_SIZE", 5)
+
+    return ConversationStateMachine(state_data=STATE_DATA, transition_data=TRANSITION_DATA, init_state_path="Plan", prefix="", owner_class_name="Test")
+
+def test_state_history(csm: ConversationStateMachine):
+    for trigger in ["Propose", "Exec", "Plan"]:
+        csm.transition(trigger, {})
+
+    assert csm.get_past_path() == ["Plan", "Propose", "Exec", "Plan"]
+    assert csm.get_past_path(2) == ["Exec", "Plan"]
+    assert csm.get_past_states(1) == [csm.state_map["Plan"]]
+    assert [trigger for _, trigger, _ in csm.state_history] == [None, "Propose", "Exec", "Plan"]
+
+def test_state_history_bounded(csm: ConversationStateMachine):
+    for _ in range(4):
+        for trigger in ["Propose", "Exec", "Plan"]:
+            csm.transition(trigger, {})
+
+    assert len(csm.state_history) == 5
+    assert csm.get_past_path() == ["Exec", "Plan", "Propose", "Exec", "Plan"]
+
+def test_invalid_trigger(csm: ConversationStateMachine):
+    with pytest.raises(ConversationEdgeError):
+        csm.transition("Exec", {})
+
+    assert csm.get_past_path() == ["Plan"]
+
+NESTED_STATE_DATA = {"name": "root", "children": [{"name": "Start"},
+                                                  {"name": "Work", "children": [{"name": "Plan"}, {"name": "Exec"}]},
+                                                  {"name": "Done"}]}
+NESTED_TRANSITION_DATA = [{"trigger": "Plan", "source": "Start", "dest": "Work_Plan"},
+                          {"trigger": "Exec", "source": "Work_Plan", "dest": "Work_Exec"},
+                          {"trigger": "Done", "source": "Work", "dest": "Done"},
+                          {"trigger": "Done", "source": "Work_Exec", "dest": "Work_Plan"}]
+
+def test_compiled_transitions(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path))
+
+    csm = ConversationStateMachine(state_data=NESTED_STATE_DATA, transition_data=NESTED_TRANSITION_DATA, init_state_path="Start", prefix="", owner_class_name="Test")
+
+    assert csm.state_map["Work_Plan"].get_hpath() is csm.state_map["Work_Plan"].get_hpath()
+
+    # Work_Plan inherits Done from Work, Work_Exec overrides it
+    assert csm.get_next_state("Done", csm.state_map["Work_Plan"]) is csm.state_map["Done"]
+    assert csm.get_next_state("Done", csm.state_map["Work_Exec"]) is csm.state_map["Work_Plan"]
+    assert csm.get_next_state("Exec", csm.state_map["Start"]) is None
+
+    for trigger in ["Plan", "Exec", "Done", "Done"]:
+        csm.transition(trigger, {})
+
+    assert csm.get_past_path() == ["Start", "Work_Plan", "Work_Exec", "Work_Plan", "Done"]
+
+@pytest.mark.parametrize("transition_data, error", [
+    (TRANSITION_DATA + [{"trigger": "Review", "source": "Exec", "dest": "Review"}], ConversationEdgeError),
+    (TRANSITION_DATA[:1], ConversationNodeError),
+])
+def test_invalid_graph(tmp_path, monkeypatch, transition_data: list[dict], error: type):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path))
+
+    with pytest.raises(error):
+        ConversationStateMachine(state_data=STATE_DATA, transition_data=transition_data, init_state_path="Plan", prefix="", owner_class_name="Test")
@@ -0,0 +1,118 @@
+import os
+import sys
+import re
+import json
+import shutil
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import agents.tot.tot
+from agents.tot.tot import ToT, get_ranking_ballot_tool
+from agents.prompt_management import PromptRegistry
+from utils.llm import llm_structured_indexed
+from utils.llm_stub import StubLLM
+from utils.telemetry import TELEMETRY_FILENAME, get_telemetry
+
+
+TOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "agents", "tot"))
+
+
+@pytest.fixture
+def tot_env(tmp_path, monkeypatch):
+    # Run against a copy of ToT's input so the state graph and run logs are written under tmp_path
+    shutil.copytree(os.path.join(TOT_DIR, "data", "input"), tmp_path / "tot" / "data" / "input")
+
+    # The state diagram is drawn to OUTPUT_DIR relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    monkeypatch.setenv("TOT_DIR", str(tmp_path / "tot"))
+    monkeypatch.setenv("INPUT_DIR", "data/input/")
+    monkeypatch.setenv("OUTPUT_DIR", "data/output/")
+    monkeypatch.setenv("SESSIONS_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setenv("SYS_PRMPT_DIR", "system_prompts/")
+    monkeypatch.setenv("USR_PRMPT_DIR", "user_prompts/")
+    monkeypatch.setenv("ANTHROPIC_MODEL", "stub")
+    monkeypatch.setenv("PROVIDE_FEEDBACK", "False")
+    monkeypatch.setattr(PromptRegistry, "_instance", None)
+    monkeypatch.setattr(agents.tot.tot, "get_remote_experiences", lambda **kwargs: "")
+
+    return tmp_path
+
+def get_text(content) -> str:
+    return content if isinstance(content, str) else "".join(block['text'] for block in content)
+
+def test_exec_error_goes_to_plan_error_fix(tot_env, monkeypatch):
+    # Older steps are rendered as a reference to their step file, which must exist while the task runs
+    monkeypatch.setattr(agents.tot.tot, "STEP_CODE_KEEP", 0)
+    referenced_files: dict[str, bool] = {}
+
+    def responder(request: dict) -> str:
+        for message in request['messages']:
+            for path in re.findall(r"its code is in (\S+)", get_text(message['content'])):
+                referenced_files[path] = os.path.exists(path)
+
+        # Structured votes are sent without the assistant prefill, so the prompt is the last user message
+        user_text = next(get_text(message['content']) for message in reversed(request['messages']) if message['role'] == "user")
+
+        if request.get("tool_choice"):
+            if "division by zero" in user_text:
+                return json.dumps({"reasoning": "it raised", "complete": "no", "error": "yes"})
+            return json.dumps({"reasoning": "done", "complete": "yes", "error": "no"})
+        if request.get("stop_sequences") == ["```"]:
+            return "\nprint(1 / 1)\n" if "Divide one by one" in user_text else "\nprint(1 / 0)\n"
+        return "Divide one by one" if "you encountered an error" in get_text(request['system']) else "Divide one by zero"
+
+    stub = StubLLM(responder=responder)
+    tot = ToT(client=stub.anthropic(), name="tot_test", description="test", tasks=[{"task": "Divide one by zero"}])
+
+    tot.run()
+
+    error_fix_systems = [get_text(request['system']) for request in stub.requests if "you encountered an error" in get_text(request['system'])]
+
+    assert error_fix_systems and all("<stderr>\ndivision by zero\n</stderr>" in system for system in error_fix_systems)
+    assert [step.error for step in tot.unified_steps] == ["division by zero", ""]
+    assert tot.csm.current_state.name == "Done"
+    assert referenced_files and all(referenced_files.values())
+
+    # The task's telemetry is dumped to its log dir and no longer held in memory
+    assert os.path.exists(os.path.join(tot.log_dir, TELEMETRY_FILENAME))
+    assert not get_telemetry().get_records(task=os.path.basename(tot.log_dir))
+
+def test_ranking_ballot_out_of_range_is_dropped(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_MODEL", "stub")
+
+    def responder(request: dict) -> str:
+        voter = get_text(request['messages'][-1]['content'])
+        return json.dumps({"reasoning": "", "ranking": [7] if voter == "voter 0" else [2, 1]})
+
+    stub = StubLLM(responder=responder)
+    prompts = [{"system": "system", "messages": [{"role": "user", "content": f"voter {i}"}]} for i in range(3)]
+
+    votes = llm_structured_indexed(stub.anthropic(), prompts, get_ranking_ballot_tool(2), temperature=0.7, n=None)
+
+    assert votes == {1: {"reasoning": "", "ranking": [2, 1]}, 2: {"reasoning": "", "ranking": [2, 1]}}
+    assert len([request for request in stub.requests if get_text(request['messages'][-1]['content']) == "voter 0"]) == 3
+
+def test_feedback_calls_are_dumped_with_the_task(tot_env, monkeypatch):
+    monkeypatch.setenv("PROVIDE_FEEDBACK", "True")
+    monkeypatch.setattr(agents.tot.tot, "get_yes_no_input", lambda prompt: True)
+    monkeypatch.setattr(ToT, "get_feedback", lambda self: {"success": True, "details": "ok", "elaboration": self.clarify_feedback({"success": True, "details": "ok"})})
+    monkeypatch.setattr(ToT, "log_feedback", lambda self, feedback: None)
+
+    def responder(request: dict) -> str:
+        if request.get("tool_choice"):
+            return json.dumps({"reasoning": "done", "complete": "yes", "error": "no"})
+        if request.get("stop_sequences") == ["```"]:
+            return "\nprint(1)\n"
+        return "Print one"
+
+    tot = ToT(client=StubLLM(responder=responder).anthropic(), name="tot_test", description="test", tasks=[{"task": "Print one"}])
+    tot.run()
+
+    with open(os.path.join(tot.log_dir, TELEMETRY_FILENAME)) as telemetry_file:
+        dumped = json.load(telemetry_file)
+
+    assert "ClarifyFeedback" in dumped['by_state']
+    assert not get_telemetry().get_records(task=os.path.basename(tot.log_dir))
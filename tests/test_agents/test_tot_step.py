@@ -0,0 +1,29 @@
+import os
+import sys
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from agents.tot.step import ToTStep
+
+
+def test_archive(tmp_path):
+    step = ToTStep()
+    step.best_plan = "Load the CSV"
+    step.plan_candidates = ["Load the CSV", "Read the CSV with the csv module"]
+    step.exec_vote_strs = [{"complete": "yes", "error": "no"}]
+    step.vote_savings = {"PlanVote": {"calls": 2, "seconds": 1.5}}
+
+    archive_path = tmp_path / "step_archive.jsonl"
+    step.archive(str(archive_path), 1)
+    ToTStep().archive(str(archive_path), 2)
+
+    records = [json.loads(line) for line in archive_path.read_text().splitlines()]
+
+    assert [record['step'] for record in records] == [1, 2]
+    assert records[0]['plan_candidates'] == ["Load the CSV", "Read the CSV with the csv module"]
+    assert records[0]['exec_votes'] == [{"complete": "yes", "error": "no"}]
+
+    assert step.best_plan == "Load the CSV"
+    assert not (step.plan_candidates or step.proposal_candidates or step.exec_vote_strs or step.vote_savings)
+    assert not hasattr(step, "__dict__")
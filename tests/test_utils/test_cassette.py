@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import random
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import utils.cassette
+from utils.llm import llm_turns, llm_turns_indexed
+from utils.llm_stub import StubLLM
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+
+PROMPTS = {"system": "vote", "messages": [{"role": "user", "content": "<candidates>...</candidates>"}]}
+
+
+@pytest.fixture
+def cassette_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CASSETTE_PATH", str(tmp_path / "run.jsonl"))
+    monkeypatch.setenv("ANTHROPIC_PROMPT_CACHING", "False")
+    monkeypatch.setenv("RANDOM_SEED", "7")
+
+    yield tmp_path / "run.jsonl"
+
+    monkeypatch.setattr(utils.cassette, "_cassette", None)
+
+def use_mode(monkeypatch, mode):
+    if utils.cassette._cassette:
+        utils.cassette._cassette.close()
+
+    monkeypatch.setenv("LLM_CASSETTE_MODE", mode)
+    monkeypatch.setattr(utils.cassette, "_cassette", None)
+
+@pytest.mark.parametrize("latency", ["simulate", "zero"])
+def test_replay_matches_recording(cassette_path, monkeypatch, latency):
+    monkeypatch.setenv("LLM_CASSETTE_LATENCY", latency)
+
+    use_mode(monkeypatch, "record")
+    counter = iter(range(100))
+    live = StubLLM(responder=lambda request: f"<vote>{next(counter)}</vote>")
+    recorded = llm_turns(live.anthropic(), PROMPTS, [], 0.7, n=4)
+
+    use_mode(monkeypatch, "replay")
+    offline = StubLLM()
+    replayed = llm_turns(offline.anthropic(), PROMPTS, [], 0.7, n=4)
+
+    assert replayed == recorded
+    assert len(offline.requests) == 0
+    assert utils.cassette.get_seed() == 7
+
+def test_replay_without_recording_fails(cassette_path, monkeypatch):
+    use_mode(monkeypatch, "record")
+    llm_turns(StubLLM().anthropic(), PROMPTS, [], 0.7, n=1)
+
+    use_mode(monkeypatch, "replay")
+    other = {"system": "vote", "messages": [{"role": "user", "content": "something else"}]}
+
+    assert llm_turns(StubLLM().anthropic(), other, [], 0.7, n=1) == []
+
+def test_record_without_seed(cassette_path, monkeypatch):
+    monkeypatch.delenv("RANDOM_SEED")
+
+    def get_prompts() -> list[dict]:
+        # Shuffled like ToT's candidates, so replay only matches if it runs with the recorded seed
+        order = list(range(4))
+        random.Random(utils.cassette.get_seed()).shuffle(order)
+        return [{"system": "vote", "messages": [{"role": "user", "content": f"<candidates>{order}</candidates>"}]}]
+
+    use_mode(monkeypatch, "record")
+    seed = utils.cassette.get_seed()
+    assert seed is not None
+
+    recorded = llm_turns(StubLLM(responder=lambda request: "<vote>1</vote>").anthropic(), get_prompts(), [], 0.7, n=None)
+
+    with open(cassette_path, "r") as cassette_file:
+        assert json.loads(cassette_file.readline())['seed'] == seed
+
+    use_mode(monkeypatch, "replay")
+    offline = StubLLM()
+
+    assert utils.cassette.get_seed() == seed
+    assert llm_turns(offline.anthropic(), get_prompts(), [], 0.7, n=None) == recorded
+    assert len(offline.requests) == 0
+
+def test_replay_skips_failed_calls(cassette_path, monkeypatch):
+    use_mode(monkeypatch, "record")
+
+    def responder(request: dict) -> str:
+        i = len(live.requests) - 1
+        if i == 1:
+            raise ValueError("call 1 failed")
+        return f"<vote>{i}</vote>"
+
+    live = StubLLM(responder=responder)
+    recorded = llm_turns_indexed(live.anthropic(), PROMPTS, [], 0.7, n=3)
+
+    with open(cassette_path, "r") as cassette_file:
+        header, *entries = [json.loads(line) for line in cassette_file]
+
+    assert [(entry['seq'], entry['error']) for entry in entries if "response" not in entry] == [(1, "ValueError")]
+
+    use_mode(monkeypatch, "replay")
+
+    # The gap at seq 1 is not filled with seq 2's response
+    assert llm_turns_indexed(StubLLM().anthropic(), PROMPTS, [], 0.7, n=3) == recorded == {0: "<vote>0</vote>", 2: "<vote>2</vote>"}
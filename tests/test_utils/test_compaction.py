@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.compaction import get_defined_names, truncate_middle
+
+
+@pytest.mark.parametrize("text, max_chars", [
+    ("short", 100),
+    ("\n".join(f"row {i}" for i in range(1000)), 200),
+    ("x" * 5000, 100),
+])
+def test_truncate_middle(text: str, max_chars: int):
+    truncated = truncate_middle(text, max_chars, note="full stdout in step_1_stdout.txt")
+
+    if len(text) <= max_chars:
+        assert truncated == text
+    else:
+        assert len(truncated) < max_chars + 100
+        assert truncated.startswith(text[:10])
+        assert truncated.endswith(text[-10:])
+        assert "step_1_stdout.txt" in truncated
+
+@pytest.mark.parametrize("code, expected", [
+    ("import pandas as pd\ndf = pd.DataFrame()\ndef load():\n    x = 1\nclass Model: pass", ["pd", "df", "load()", "Model()"]),
+    ("a, b = 1, 2\nprint(a)", ["a", "b"]),
+    ("def broken(:", None),
+])
+def test_get_defined_names(code: str, expected):
+    assert get_defined_names(code) == expected
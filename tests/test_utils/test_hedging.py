@@ -0,0 +1,66 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import utils.hedging
+from utils.hedging import Hedger
+from utils.llm import llm_stream, llm_turn
+from utils.llm_stub import StubLLM
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+
+PROMPTS = {"system": "system", "messages": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "<output>"}]}
+
+
+@pytest.fixture
+def hedger(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGING", "True")
+
+    hedger = Hedger(percentile=50, budget=1.0)
+    for _ in range(5):
+        hedger.tracker.record("UI.PrintUIMessage", 0.02)
+
+    monkeypatch.setattr(utils.hedging, "_hedger", hedger)
+
+    return hedger
+
+def slow_then_fast(slow: float, fast: float):
+    latencies = itertools.chain([slow], itertools.repeat(fast))
+    return lambda request: next(latencies)
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_hedge_wins(hedger, stream: bool):
+    stub = StubLLM(responder=lambda request: "<response>hi</response>", latency=slow_then_fast(1.0, 0.01))
+    client = stub.anthropic()
+
+    if stream:
+        text = "".join(llm_stream(client, PROMPTS, ["</output>"], 0.7, hedge="UI.PrintUIMessage"))
+    else:
+        text = llm_turn(client, PROMPTS, ["</output>"], 0.7, hedge="UI.PrintUIMessage")
+
+    assert text == "<response>hi</response>"
+    assert hedger.get_stats()['hedge_wins'] == 1
+
+    # The cancelled primary never finished, so it adds no latency sample
+    assert len(hedger.tracker.samples["UI.PrintUIMessage"]) == 5
+
+def test_hedge_budget(hedger):
+    hedger.budget = 0.0
+
+    stub = StubLLM(latency=slow_then_fast(0.1, 0.01))
+    llm_turn(stub.anthropic(), PROMPTS, ["</output>"], 0.7, hedge="UI.PrintUIMessage")
+
+    assert len(stub.requests) == 1
+    assert hedger.get_stats()['over_budget'] == 1
+
+def test_unhedged_without_history(hedger):
+    stub = StubLLM(latency=0.05)
+    llm_turn(stub.anthropic(), PROMPTS, ["</output>"], 0.7, hedge="AgentManager.RouteAction")
+
+    assert hedger.get_stats() == {"calls": 1, "hedges": 0, "hedge_wins": 0, "over_budget": 0}
+    assert list(hedger.tracker.samples["AgentManager.RouteAction"]) == [pytest.approx(0.05, abs=0.04)]
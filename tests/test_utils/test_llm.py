@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import utils.llm
+from utils.llm import llm_turn, llm_turns, allm_turns, get_async_client, llm_stream, llm_turns_indexed, llm_structured_indexed
+from utils.structured import get_tool
+from utils.llm_stub import StubLLM
+from utils.rate_limit import RateLimiter
+from utils.tokens import estimate_tokens
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+os.environ.setdefault("OPENAI_MODEL", "stub")
+
+PROMPTS = {"system": "system", "messages": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "<output>"}]}
+PROMPTS_NO_PREFILL = {"system": "system", "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_llm_turns_fan_out(provider: str):
+    stub = StubLLM(responder=lambda request: "ok", latency=0.01)
+    client = getattr(stub, provider)()
+
+    assert llm_turns(client, PROMPTS, ["</output>"], 0.7, n=5) == ["ok"] * 5
+    assert llm_turn(client, PROMPTS, ["</output>"], 0.7) == "ok"
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_llm_turns_prompt_list(provider: str):
+    stub = StubLLM(responder=lambda request: request['messages'][-1]['content'])
+    client = getattr(stub, provider)()
+
+    prompts = [{"system": "system", "messages": [{"role": "user", "content": str(i)}]} for i in range(4)]
+
+    assert llm_turns(client, prompts, [], 0.7, n=None) == ["0", "1", "2", "3"]
+
+def test_allm_turns_concurrent():
+    stub = StubLLM(responder=lambda request: "ok", latency=0.05)
+    client = stub.anthropic()
+
+    async def fan_out():
+        return await asyncio.gather(*[allm_turns(client, PROMPTS, [], 0.7, n=5) for _ in range(4)])
+
+    results = asyncio.run(fan_out())
+
+    assert results == [["ok"] * 5] * 4
+    assert len(stub.requests) == 20
+    assert get_async_client(client) is get_async_client(client)
+
+def test_llm_turns_invalid_n():
+    client = StubLLM().anthropic()
+
+    with pytest.raises(ValueError):
+        llm_turns(client, PROMPTS, [], 0.7, n=0)
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 8, 100])
+def test_llm_stream_until(chunk_size: int):
+    stub = StubLLM(responder=lambda request: "<plan>a</plan><plan>b</plan>", chunk_size=chunk_size)
+    timings: dict = {}
+
+    text = "".join(llm_stream(stub.anthropic(), PROMPTS, ["</output>"], 0.7, until=["</plan>"], timings=timings))
+
+    assert text == "<plan>a</plan>"
+    assert timings['stop'] == "until"
+    assert timings['ttft'] <= timings['total']
+
+def test_llm_stream_until_releases_unused_output(monkeypatch):
+    limiter = RateLimiter("test", output_tokens_per_min=1000)
+    limiter.output_estimate = 1000
+    monkeypatch.setattr(utils.llm, "get_rate_limiter", lambda provider: limiter)
+
+    stub = StubLLM(responder=lambda request: "<plan>a</plan>" + "x" * 1000, chunk_size=4)
+
+    text = "".join(llm_stream(stub.anthropic(), PROMPTS, ["</output>"], 0.7, until=["</plan>"]))
+
+    # Only the output streamed before the `until` match stays debited
+    assert limiter.reserve(0, 1000 - estimate_tokens(text) - 5) == 0.0
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_llm_stream_complete(provider: str):
+    stub = StubLLM(responder=lambda request: "<response>hello</response>", chunk_size=4)
+
+    assert "".join(llm_stream(getattr(stub, provider)(), PROMPTS, ["</output>"], 0.7)) == "<response>hello</response>"
+
+@pytest.mark.parametrize("quorum, deadline, expected", [
+    (2, None, {0: "0.01", 1: "0.02"}),
+    (None, 0.05, {0: "0.01", 1: "0.02", 2: "0.03"}),
+    (None, None, {0: "0.01", 1: "0.02", 2: "0.03", 3: "1.0"}),
+])
+def test_llm_turns_quorum(quorum, deadline, expected):
+    stub = StubLLM(responder=lambda request: request['messages'][-1]['content'],
+                   latency=lambda request: float(request['messages'][-1]['content']))
+    client = stub.anthropic()
+
+    prompts = [{"system": "system", "messages": [{"role": "user", "content": latency}]} for latency in ["0.01", "0.02", "0.03", "1.0"]]
+
+    assert llm_turns_indexed(client, prompts, [], 0.7, n=None, quorum=quorum, deadline=deadline) == expected
+
+def test_llm_turns_early_stop():
+    stub = StubLLM(responder=lambda request: request['messages'][-1]['content'],
+                   latency=lambda request: float(request['messages'][-1]['content']))
+    client = stub.anthropic()
+
+    prompts = [{"system": "system", "messages": [{"role": "user", "content": latency}]} for latency in ["0.01", "0.02", "0.03", "1.0"]]
+    seen_remaining = []
+
+    def early_stop(texts: dict[int, str], remaining: int) -> bool:
+        seen_remaining.append(remaining)
+        return len(texts) == 2
+
+    assert llm_turns_indexed(client, prompts, [], 0.7, n=None, early_stop=early_stop) == {0: "0.01", 1: "0.02"}
+    assert seen_remaining == [3, 2]
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_llm_structured_indexed(provider: str):
+    # The second prompt answers with invalid output until its third attempt; only that slot is retried
+    attempts: dict[str, int] = {}
+
+    def responder(request: dict) -> str:
+        content = request['messages'][-1]['content']
+        attempts[content] = attempts.get(content, 0) + 1
+        if content == "flaky" and attempts[content] < 3:
+            return '{"ranking": "not a list"}'
+        return '{"reasoning": "r", "ranking": [2, 1]}'
+
+    stub = StubLLM(responder=responder)
+    tool = get_tool("submit_ranking", "Rank", {"type": "object",
+                                               "properties": {"reasoning": {"type": "string"}, "ranking": {"type": "array", "items": {"type": "integer"}}},
+                                               "required": ["reasoning", "ranking"],
+                                               "additionalProperties": False})
+    prompts = [{"system": "system", "messages": [{"role": "user", "content": content}]} for content in ["steady", "flaky"]]
+
+    ballots = llm_structured_indexed(getattr(stub, provider)(), prompts, tool, 0.7, n=None)
+
+    assert ballots == {0: {"reasoning": "r", "ranking": [2, 1]}, 1: {"reasoning": "r", "ranking": [2, 1]}}
+    assert attempts == {"steady": 1, "flaky": 3}
+
+def test_llm_structured_indexed_gives_up():
+    stub = StubLLM(responder=lambda request: "not json")
+    tool = get_tool("submit_ranking", "Rank", {"type": "object", "properties": {"ranking": {"type": "array"}}, "required": ["ranking"]})
+
+    assert llm_structured_indexed(stub.anthropic(), PROMPTS_NO_PREFILL, tool, 0.7, n=2, retries=1) == {}
+    assert len(stub.requests) == 4
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.messages import MessageSequence
+
+
+HISTORY = [{"role": "user", "content": f"user {i}"} if i % 2 == 0 else {"role": "assistant", "content": f"assistant {i}"} for i in range(4)]
+TAIL = [{"role": "user", "content": "vote"}, {"role": "assistant", "content": "<evaluation>"}]
+
+
+def test_extend_shares_prefix():
+    history = MessageSequence(HISTORY)
+    prompts = [history.extend(*TAIL) for _ in range(3)]
+
+    assert all(prompt == HISTORY + TAIL for prompt in prompts)
+    assert all(prompt.prefix is history for prompt in prompts)
+    assert prompts[0].shared_prefix_len(prompts[1]) == len(HISTORY)
+    assert prompts[0].shared_prefix_len(MessageSequence(HISTORY)) == 0
+
+@pytest.mark.parametrize("index", [0, 3, 4, -1, -6, slice(None, -1), slice(2, 5), slice(None, None, 2), slice(None, 2)])
+def test_indexing(index: int | slice):
+    sequence = MessageSequence(HISTORY).extend(*TAIL)
+    expected = (HISTORY + TAIL)[index]
+
+    assert sequence[index] == expected
+
+def test_slice_keeps_prefix():
+    history = MessageSequence(HISTORY)
+
+    assert history.extend(*TAIL)[:-1].prefix is history
+
+def test_index_out_of_range():
+    with pytest.raises(IndexError):
+        MessageSequence(HISTORY).extend(*TAIL)[6]
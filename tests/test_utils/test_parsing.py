@@ -1,12 +1,14 @@
 import sys
 import os
-from xml.etree.ElementTree import tostring
+from xml.etree.ElementTree import ParseError, tostring
 
 import pytest
 
+import utils.parsing
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-from utils.parsing import xmlstr2dict, dict2xml
+from utils.parsing import XMLStreamParser, xmlstr2dict, xmlstrs2dicts, dict2xml, dict2xmlstr, xml2xmlstr, get_tag_delta
 from utils.custom_types import NestedStrDict
 
 
@@ -74,4 +76,90 @@ def test_xmlstr2dict(xmlstr, client, expected):
     ],
 )
 def test_dict2xml(d: NestedStrDict, expected_xml: str, tag: str):
-    assert tostring(dict2xml(d, tag=tag)).decode() == expected_xml
\ No newline at end of file
+    assert tostring(dict2xml(d, tag=tag)).decode() == expected_xml
+
+@pytest.mark.parametrize("d, tag", [
+    ({"task": "Write a story", "details": {"title": "Here Kitty Kitty", "to": "tim.jones@mail.com"}}, "root"),
+    ({"code": "if a < b && c > d:\n    print('<done>')", "empty": "", "none": None, "count": 3}, "root"),
+    ({"nested": {}, "deeper": {"a": {"b": {"c": "  spaced  "}}}}, "task"),
+    ({"root": "same tag as the root"}, "root"),
+    ({"outer": {"root": {"x": "y"}}}, "root"),
+    ({}, "root"),
+])
+def test_dict2xmlstr(d: NestedStrDict, tag: str):
+    assert dict2xmlstr(d, tag) == xml2xmlstr(dict2xml(d, tag))
+
+@pytest.mark.parametrize("chunks, expected", [
+    (["<response>hel", "lo</resp", "onse>"], "hello"),
+    (["<resp", "onse>a<", "/b></response>"], "a</b>"),
+    (["<action>REST</action>"], ""),
+])
+def test_get_tag_delta(chunks: list[str], expected: str):
+    text, emitted, streamed = "", 0, ""
+    for chunk in chunks:
+        text += chunk
+        delta, emitted = get_tag_delta(text, "response", emitted)
+        streamed += delta
+
+    assert streamed == expected
+
+@pytest.mark.parametrize("text", [
+    "<response>Opening Spotify now.</response>\n<action>\n<task>Play music</task>\n<details>\n<playlist>Focus</playlist>\n</details>\n</action>",
+    "<response>Sounds good. Talk later!</response><action>REST</action>",
+    "<response>Bye</response><action>None</action>",
+])
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_xml_stream_parser(text: str, chunk_size: int):
+    parser = XMLStreamParser()
+
+    fields = {}
+    for i in range(0, len(text), chunk_size):
+        for path, value in parser.feed(text[i:i + chunk_size]):
+            fields[path] = value
+
+            # A field is handed out as soon as its closing tag is in
+            assert text[:i + chunk_size].count(f"</{path.split('/')[-1]}>") >= 1
+
+    assert fields['response'] == xmlstr2dict(text, None)['response']
+    assert parser.close(None) == xmlstr2dict(text, None)
+
+def test_xml_stream_parser_malformed():
+    parser = XMLStreamParser()
+
+    assert parser.feed("<response>Fish & chips</response>") == []
+    assert parser.feed("<action>REST</action>") == []
+    assert parser.close(None) == {"response": "Fish & chips", "action": "REST"}
+
+@pytest.mark.parametrize("fixes, drop_failed, expected", [
+    # One round fixes both malformed votes at once
+    ({"<best_candidate>2&#0;</best_candidate>": "<best_candidate>2</best_candidate>",
+      "<best_candidate>&#0;3</best_candidate>": "<best_candidate>3</best_candidate>"},
+     False, {0: {"best_candidate": "1"}, 1: {"best_candidate": "2"}, 2: {"best_candidate": "3"}}),
+    # The LLM keeps returning the broken vote, which is dropped
+    ({}, True, {0: {"best_candidate": "1"}}),
+])
+def test_xmlstrs2dicts(monkeypatch, fixes: dict[str, str], drop_failed: bool, expected: dict):
+    rounds = []
+
+    def fake_llm_turns_indexed(client, prompts, stop_sequences, temperature, n, max_tokens):
+        rounds.append(len(prompts))
+        broken = [prompt['messages'][0]['content'].split("<root>")[1].split("</root>")[0] for prompt in prompts]
+        return {i: fixes.get(xml_string, xml_string) for i, xml_string in enumerate(broken)}
+
+    monkeypatch.setattr(utils.parsing, "llm_turns_indexed", fake_llm_turns_indexed)
+
+    xml_strings = {0: "<best_candidate>1</best_candidate>",
+                   1: "<best_candidate>2&#0;</best_candidate>",
+                   2: "<best_candidate>&#0;3</best_candidate>"}
+
+    assert xmlstrs2dicts(xml_strings, "client", drop_failed=drop_failed) == expected  # type: ignore
+    assert rounds[0] == 2
+    assert len(rounds) == (1 if fixes else utils.parsing.XML_FIX_ATTEMPTS)
+
+def test_xmlstrs2dicts_without_client():
+    xml_strings = {0: "<best_candidate>1</best_candidate>", 1: "<best_candidate>&#0;</best_candidate>"}
+
+    assert xmlstrs2dicts(xml_strings, None, drop_failed=True) == {0: {"best_candidate": "1"}}
+
+    with pytest.raises(ParseError):
+        xmlstrs2dicts(xml_strings, None)
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.llm import llm_turns
+from utils.llm_stub import StubLLM
+from utils.prompt_cache import get_shared_prefix_len, MIN_CACHEABLE_TOKENS
+from utils.messages import MessageSequence
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+
+SYSTEM = "You are overseeing the use of a PC. " * (MIN_CACHEABLE_TOKENS // 4)
+HISTORY = [{"role": "user", "content": "Plan and implement step 1:"},
+           {"role": "assistant", "content": "<plan>Import modules</plan>"}]
+PREFILL = {"role": "assistant", "content": "<step_2><plan>"}
+SHARED_HISTORY = MessageSequence(HISTORY)
+
+
+def get_breakpoints(request: dict) -> list[int]:
+    return [i for i, message in enumerate(request['messages']) if isinstance(message['content'], list) and "cache_control" in message['content'][0]]
+
+def test_fan_out_caches_system_and_user_prompt():
+    stub = StubLLM(responder=lambda request: "plan")
+    client = stub.anthropic()
+
+    messages = HISTORY + [{"role": "user", "content": "Plan and implement step 2:"}, PREFILL]
+    llm_turns(client, {"system": SYSTEM, "messages": messages}, ["</plan>"], 0.7, n=3)
+
+    # One priming request, then the fan-out
+    assert len(stub.requests) == 4
+    assert stub.requests[0]['max_tokens'] == 1
+
+    for request in stub.requests:
+        assert "cache_control" in request['system'][0]
+        assert get_breakpoints(request) == [2]
+        assert isinstance(request['messages'][3]['content'], str)
+
+    usages = [stub.anthropic_usage(request, "") for request in stub.requests[1:]]
+    assert all(usage['cache_creation_input_tokens'] == 0 for usage in usages)
+
+@pytest.mark.parametrize("get_messages", [
+    lambda i: HISTORY + [{"role": "user", "content": f"Candidates in order {i}"}, PREFILL],
+    lambda i: SHARED_HISTORY.extend({"role": "user", "content": f"Candidates in order {i}"}, PREFILL),
+])
+def test_vote_fan_out_caches_shared_history(get_messages):
+    stub = StubLLM(responder=lambda request: "vote")
+    client = stub.anthropic()
+
+    prompts = [{"system": SYSTEM, "messages": get_messages(i)} for i in range(3)]
+
+    assert get_shared_prefix_len(prompts) == 2
+
+    llm_turns(client, prompts, ["</evaluation>"], 0.7, n=None)
+
+    for request in stub.requests:
+        assert get_breakpoints(request) == [1]
+
+def test_single_call_not_primed():
+    stub = StubLLM(responder=lambda request: "response")
+    client = stub.anthropic()
+
+    llm_turns(client, {"system": "short", "messages": [{"role": "user", "content": "hi"}, PREFILL]}, [], 0.7, n=1)
+
+    assert len(stub.requests) == 1
+    assert get_breakpoints(stub.requests[0]) == [0]
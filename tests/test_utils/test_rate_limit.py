@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from anthropic import RateLimitError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.rate_limit import RateLimiter
+from utils.llm import _acreate_anthropic
+
+
+def test_requests_per_min_queues_excess():
+    limiter = RateLimiter("test", requests_per_min=60)
+
+    waits = [limiter.reserve(0, 0) for _ in range(62)]
+
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0, abs=0.05)
+    assert waits[61] == pytest.approx(2.0, abs=0.05)
+
+def test_input_tokens_per_min_queues_large_requests():
+    limiter = RateLimiter("test", input_tokens_per_min=6000)
+
+    assert limiter.reserve(4000, 0) == 0.0
+    assert limiter.reserve(4000, 0) == pytest.approx(20.0, abs=0.05)
+
+def test_settle_refunds_overestimate():
+    limiter = RateLimiter("test", output_tokens_per_min=1000)
+
+    limiter.reserve(0, 1000)
+    limiter.settle(0, 0, 1000, 100)
+
+    assert limiter.reserve(0, 900) == 0.0
+
+def test_settle_smooths_output_per_choice():
+    limiter = RateLimiter("test")
+    limiter.output_estimate = 100
+
+    limiter.settle(0, 0, 500, 500, n=5)
+
+    assert limiter.output_estimate == 100
+
+def test_unconfigured_limiter_never_waits():
+    limiter = RateLimiter("test")
+
+    assert all(limiter.reserve(100000, 100000) == 0.0 for _ in range(100))
+
+def test_retries_reserve_once():
+    limiter = RateLimiter("test", input_tokens_per_min=6000)
+    responses = iter([RateLimitError("rate limited", response=httpx.Response(429, request=httpx.Request("POST", "https://api.anthropic.com")), body=None), "ok"])
+
+    class Messages:
+        async def create(self, **kwargs):
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    class Client:
+        messages = Messages()
+
+    call_record = {"attempts": 0}
+
+    assert asyncio.run(_acreate_anthropic(Client(), limiter, (4000, 0), call_record)) == "ok"
+    assert call_record['attempts'] == 2
+    assert limiter.reserve(2000, 0) == 0.0
+
+def test_cancelled_call_releases_output():
+    limiter = RateLimiter("test", input_tokens_per_min=1000, output_tokens_per_min=1000)
+
+    class Messages:
+        async def create(self, **kwargs):
+            await asyncio.sleep(10)
+
+    class Client:
+        messages = Messages()
+
+    async def cancel_call():
+        task = asyncio.ensure_future(_acreate_anthropic(Client(), limiter, (1000, 1000), {"attempts": 0}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel_call())
+
+    # The prompt counts as sent, but none of the output estimate was generated
+    assert limiter.reserve(0, 1000) == 0.0
+    assert limiter.reserve(1000, 0) > 0.0
+
+def test_cancelled_queued_call_releases_reservation():
+    limiter = RateLimiter("test", requests_per_min=60)
+    for _ in range(60):
+        limiter.reserve(0, 0)
+
+    async def cancel_acquire():
+        task = asyncio.ensure_future(limiter.acquire(0, 0))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel_acquire())
+
+    # Queued behind the full bucket, not behind the cancelled call as well
+    assert limiter.reserve(0, 0) == pytest.approx(1.0, abs=0.05)
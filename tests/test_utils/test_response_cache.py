@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import utils.response_cache
+from utils.response_cache import ResponseCache, get_cache_key
+from utils.llm import llm_turn
+from utils.llm_stub import StubLLM
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+
+PROMPTS = {"system": "route", "messages": [{"role": "user", "content": "<task>email</task>"}, {"role": "assistant", "content": "<output>"}]}
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_RESPONSE_CACHE", "True")
+    monkeypatch.setenv("LLM_RESPONSE_CACHE_PATH", str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(utils.response_cache, "_response_cache", None)
+
+    yield utils.response_cache.get_response_cache()
+
+    monkeypatch.setattr(utils.response_cache, "_response_cache", None)
+
+def test_deterministic_calls_hit_cache(response_cache):
+    stub = StubLLM(responder=lambda request: "<name>ToT</name>")
+    client = stub.anthropic()
+
+    assert llm_turn(client, PROMPTS, ["</output>"], 0.0) == "<name>ToT</name>"
+    assert llm_turn(client, PROMPTS, ["</output>"], 0.0) == "<name>ToT</name>"
+
+    assert len(stub.requests) == 1
+    assert response_cache.get_stats()['hits'] == 1
+
+def test_sampled_calls_bypass_cache(response_cache):
+    stub = StubLLM(responder=lambda request: "<name>ToT</name>")
+    client = stub.anthropic()
+
+    llm_turn(client, PROMPTS, ["</output>"], 0.7)
+    llm_turn(client, PROMPTS, ["</output>"], 0.7)
+
+    assert len(stub.requests) == 2
+    assert response_cache.get_stats()['entries'] == 0
+
+def test_key_covers_request_fields():
+    base = get_cache_key("anthropic", "model", "system", PROMPTS['messages'], ["</output>"], 4000)
+
+    assert base == get_cache_key("anthropic", "model", "system", PROMPTS['messages'], ["</output>"], 4000)
+    assert base != get_cache_key("anthropic", "other", "system", PROMPTS['messages'], ["</output>"], 4000)
+    assert base != get_cache_key("anthropic", "model", "system", PROMPTS['messages'], [], 4000)
+    assert base != get_cache_key("anthropic", "model", "system", PROMPTS['messages'], ["</output>"], 100)
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "lru.sqlite"), max_bytes=30)
+
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.put("c", "x" * 10)
+
+    cache.get("a")
+    cache.put("d", "x" * 10)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get_stats()['bytes'] <= 30
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.similarity import cluster_candidates, dedupe_candidates, hash_vectorize
+
+
+@pytest.mark.parametrize("candidates, expected_unique, expected_multiplicities", [
+    (["a", "b", "c"], ["a", "b", "c"], [1, 1, 1]),
+    (["plan one", "plan one  \n", "plan two", "\nplan one"], ["plan one", "plan two"], [3, 1]),
+    (["if x:\n    a()\n\n\n    b()", "if x:\n    a()  \n\n    b()\n", "if x:\n    a()\nb()"], ["if x:\n    a()\n\n\n    b()", "if x:\n    a()\nb()"], [2, 1]),
+    (["for f in files:\n    big.append(f)", "for f in files:\n  big.append(f)", "for f in files: big.append(f)"],
+     ["for f in files:\n    big.append(f)", "for f in files:\n  big.append(f)", "for f in files: big.append(f)"], [1, 1, 1]),
+    (["same", "same", "same"], ["same"], [3]),
+    ([], [], []),
+])
+def test_dedupe_candidates(candidates: list[str], expected_unique: list[str], expected_multiplicities: list[int]):
+    unique, multiplicities = dedupe_candidates(candidates)
+
+    assert unique == expected_unique
+    assert multiplicities == expected_multiplicities
+    assert sum(multiplicities) == len(candidates)
+
+def test_hash_vectorize():
+    vectors = hash_vectorize(["load the csv", "load the csv", "plot a histogram", ""])
+
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert np.isclose(vectors[0] @ vectors[1], 1.0)
+    assert vectors[0] @ vectors[2] < 0.5
+    assert not vectors[3].any()
+
+    greater, less = hash_vectorize(["getsize(f) > limit", "getsize(f) < limit"])
+    assert greater @ less < 1.0
+
+@pytest.mark.parametrize("candidates, multiplicities, threshold, expected_unique, expected_multiplicities", [
+    (["First, load the CSV with pandas.", "first load the csv with pandas", "Plot a histogram."], [1, 2, 1], 0.9,
+     ["First, load the CSV with pandas.", "Plot a histogram."], [3, 1]),
+    (["First, load the CSV with pandas.", "first load the csv with pandas"], [1, 1], 0.0,
+     ["First, load the CSV with pandas.", "first load the csv with pandas"], [1, 1]),
+    (["print(df.head())", "print(df.tail())"], [1, 1], 0.9,
+     ["print(df.head())", "print(df.tail())"], [1, 1]),
+    (["If os.path.getsize(f) > limit, append f to big.", "If os.path.getsize(f) < limit, append f to big."], [1, 1], 0.9,
+     ["If os.path.getsize(f) > limit, append f to big.", "If os.path.getsize(f) < limit, append f to big."], [1, 1]),
+    (["if os.path.getsize(f) > limit:\n    big.append(f)", "if os.path.getsize(f) < limit:\n    big.append(f)"], [1, 1], 0.0,
+     ["if os.path.getsize(f) > limit:\n    big.append(f)", "if os.path.getsize(f) < limit:\n    big.append(f)"], [1, 1]),
+    (["only"], [4], 0.9, ["only"], [4]),
+])
+def test_cluster_candidates(candidates: list[str], multiplicities: list[int], threshold: float, expected_unique: list[str], expected_multiplicities: list[int]):
+    assert cluster_candidates(candidates, multiplicities, threshold) == (expected_unique, expected_multiplicities)
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.structured import get_response_format, get_tool, validate_schema
+
+
+SCHEMA = {"type": "object",
+          "properties": {"reasoning": {"type": "string"},
+                         "ranking": {"type": "array", "items": {"type": "integer"}},
+                         "complete": {"type": "string", "enum": ["yes", "no"]}},
+          "required": ["reasoning", "ranking"],
+          "additionalProperties": False}
+
+
+@pytest.mark.parametrize("value, error_count", [
+    ({"reasoning": "ok", "ranking": [2, 1, 3]}, 0),
+    ({"reasoning": "ok", "ranking": [2, 1], "complete": "yes"}, 0),
+    ({"reasoning": "ok"}, 1),
+    ({"reasoning": "ok", "ranking": ["2", True]}, 2),
+    ({"reasoning": "ok", "ranking": [], "complete": "maybe"}, 1),
+    ({"reasoning": "ok", "ranking": [], "extra": 1}, 1),
+    ([], 1),
+])
+def test_validate_schema(value, error_count: int):
+    assert len(validate_schema(value, SCHEMA)) == error_count
+
+@pytest.mark.parametrize("ranking, error_count", [
+    ([2, 1, 3], 0),
+    ([7], 1),
+    ([0, 1], 1),
+    ([], 1),
+])
+def test_validate_schema_bounds(ranking: list[int], error_count: int):
+    schema = {"type": "array", "items": {"type": "integer", "minimum": 1, "maximum": 3}, "minItems": 1}
+
+    assert len(validate_schema(ranking, schema)) == error_count
+
+def test_get_response_format():
+    tool = get_tool("submit_ranking", "Rank the candidates", SCHEMA)
+    response_format = get_response_format(tool)
+
+    assert response_format['json_schema']['name'] == "submit_ranking"
+    assert response_format['json_schema']['schema'] is SCHEMA
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import utils.telemetry
+from utils.llm import llm_turns
+from utils.llm_stub import StubLLM
+from utils.telemetry import Telemetry, get_telemetry, set_call_context
+
+
+os.environ.setdefault("ANTHROPIC_MODEL", "stub")
+
+PROMPTS = {"system": "system", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_records_carry_caller_state():
+    set_call_context("ToT", "PlanVote", "telemetry_test")
+    llm_turns(StubLLM(responder=lambda request: "x" * 40).anthropic(), PROMPTS, [], 0.7, n=3)
+    set_call_context(None, None)
+
+    call_records = get_telemetry().get_records(task="telemetry_test")
+
+    assert len(call_records) == 3
+    assert all(call_record['state'] == "PlanVote" and call_record['agent'] == "ToT" for call_record in call_records)
+    assert all(call_record['output_tokens'] == 10 and call_record['retries'] == 0 for call_record in call_records)
+
+def test_summary_and_dump(tmp_path):
+    telemetry = Telemetry()
+
+    for state in ["Plan", "Plan", "ExecVote"]:
+        set_call_context("ToT", state, "task")
+        call_record = telemetry.start_call("anthropic", "stub")
+        telemetry.finish_call(call_record, error=ValueError("bad") if state == "ExecVote" else None)
+    set_call_context(None, None)
+
+    summary = telemetry.summarize(telemetry.get_records(), "state")
+    assert summary['Plan']['calls'] == 2
+    assert summary['ExecVote']['errors'] == 1
+
+    telemetry.dump(telemetry.get_records(), str(tmp_path / "telemetry.json"))
+    with open(tmp_path / "telemetry.json") as file:
+        dumped = json.load(file)
+
+    assert dumped['by_agent']['ToT']['calls'] == 3
+    assert len(dumped['calls']) == 3
+
+def test_pop_records():
+    telemetry = Telemetry()
+
+    for task in ["task_1", "task_2", "task_1"]:
+        set_call_context("ToT", "Plan", task)
+        telemetry.finish_call(telemetry.start_call("anthropic", "stub"))
+    set_call_context(None, None)
+
+    assert len(telemetry.pop_records("task_1")) == 2
+    assert [call_record['task'] for call_record in telemetry.get_records()] == ["task_2"]
+    assert telemetry.pop_records("task_1") == []
+
+def test_untasked_records_are_bounded(monkeypatch):
+    monkeypatch.setattr(utils.telemetry, "UNTASKED_RECORD_LIMIT", 3)
+    telemetry = Telemetry()
+
+    for i in range(5):
+        set_call_context("UI", f"state_{i}")
+        telemetry.finish_call(telemetry.start_call("anthropic", "stub"))
+    set_call_context("ToT", "Plan", "task")
+    telemetry.finish_call(telemetry.start_call("anthropic", "stub"))
+    set_call_context(None, None)
+
+    assert [call_record['state'] for call_record in telemetry.get_records()] == ["Plan", "state_2", "state_3", "state_4"]
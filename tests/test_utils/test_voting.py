@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.voting import aggregate, ballot_points, get_margin, majority_settled, parse_ranking, scores_settled
+
+
+@pytest.mark.parametrize("scores, remaining, margin, expected", [
+    ([3, -3, 0], 1, 1.0, True),
+    ([2, 0, -2], 1, 1.0, False),
+    ([2, 0, -2], 0, 1.0, True),
+    ([2, 2, -4], 0, 1.0, False),
+    ([3, -1, -2], 2, 0.5, True),
+    ([1.5], 5, 1.0, True),
+])
+def test_scores_settled(scores: list[float], remaining: int, margin: float, expected: bool):
+    assert scores_settled(scores, remaining, margin) == expected
+
+@pytest.mark.parametrize("count, received, remaining, expected", [
+    (3, 3, 2, True),
+    (0, 3, 2, True),
+    (2, 3, 2, False),
+    (1, 4, 1, True),
+    (2, 4, 1, False),
+    (0, 0, 5, False),
+])
+def test_majority_settled(count: int, received: int, remaining: int, expected: bool):
+    assert majority_settled(count, received, remaining) == expected
+
+@pytest.mark.parametrize("ranking, expected", [
+    ("3, 1, 2", [3, 1, 2]),
+    ("candidate_2 > candidate_2 > candidate_1", [2, 1]),
+    ("", []),
+])
+def test_parse_ranking(ranking: str, expected: list[int]):
+    assert parse_ranking(ranking) == expected
+
+@pytest.mark.parametrize("parsed_ballot, index_map, expected", [
+    ({"ranking": "1, 2, 3"}, [2, 0, 1], [0.0, -1.0, 1.0]),
+    ({"ranking": "2"}, [0, 1, 2], [-0.5, 1.0, -0.5]),
+    ({"best_candidate": "1", "worst_candidate": "3"}, [0, 1, 2], [1.0, 0.0, -1.0]),
+    ({"best_candidate": "2", "worst_candidate": "1"}, [0, 1, 2, 3], [-1.5, 1.5, 0.0, 0.0]),
+])
+def test_ballot_points(parsed_ballot: dict, index_map: list[int], expected: list[float]):
+    assert ballot_points(parsed_ballot, index_map).tolist() == expected
+
+@pytest.mark.parametrize("method", ["borda", "kemeny", "bradley_terry"])
+def test_aggregate(method: str):
+    # Candidate 1 is preferred by most ballots; every method should put it first and candidate 2 last
+    points = np.stack([ballot_points({"ranking": ranking}, [0, 1, 2]) for ranking in ["2, 1, 3", "2, 3, 1", "1, 2, 3", "2, 1, 3"]])
+    scores = aggregate(points, method)
+
+    assert np.argmax(scores) == 1
+    assert np.argmin(scores) == 2
+    assert 0 < get_margin(scores, len(points)) <= 1
+
+def test_aggregate_unknown_method():
+    with pytest.raises(ValueError):
+        aggregate(np.zeros((1, 2)), "plurality")
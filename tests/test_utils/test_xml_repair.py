@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+
+import pytest
+
+import xml.etree.ElementTree as ET
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.parsing import xmlstr2dict
+from utils.xml_repair import get_repair_stats, repair_xml
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "xml_repair_corpus.jsonl")
+
+with open(CORPUS_PATH, 'r') as corpus_file:
+    CORPUS = [json.loads(line) for line in corpus_file if line.strip()]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case['name'] for case in CORPUS])
+def test_xml_repair_corpus(case: dict):
+    # Entries with an expected result are repaired locally; the rest must be left to the LLM fix.
+    # No client is passed, so an LLM fix raises instead
+    stats_before = get_repair_stats()
+
+    if case['expected'] is None:
+        with pytest.raises(ET.ParseError):
+            xmlstr2dict(case['xml'], None, expected_tags=case['expected_tags'])
+    else:
+        assert xmlstr2dict(case['xml'], None, expected_tags=case['expected_tags']) == case['expected']
+
+    stats_after = get_repair_stats()
+    assert stats_after['repaired'] == stats_before['repaired'] + (case['expected'] is not None)
+    assert stats_after['failed'] == stats_before['failed'] + (case['expected'] is None)
+    assert stats_after['llm'] == stats_before['llm']
+
+@pytest.mark.parametrize("xml_string, expected_tags, expected", [
+    ("<root><a>1</a></root>", None, "<root><a>1</a></root>"),
+    ("<root><a>x]]>y &amp; z</a></root>", None, "<root><a>x]]&gt;y &amp; z</a></root>"),
+    ("<root><a>```x]]>y```</a></root>", None, "<root><a><![CDATA[```x]]]]><![CDATA[>y```]]></a></root>"),
+    ("<root><a>1<b>2</a>", ["root", "a"], "<root><a>1&lt;b&gt;2</a></root>"),
+])
+def test_repair_xml(xml_string: str, expected_tags, expected: str):
+    assert repair_xml(xml_string, expected_tags) == expected
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from typing import Optional
+
+import dotenv
+
+from rich import print
+
+
+dotenv.load_dotenv()
+
+
+PRINT_PREFIX = "[bold][Cassette][/bold]"
+
+CASSETTE_VERSION = 1
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class Cassette:
+    PRINT_PREFIX = PRINT_PREFIX
+
+    def __init__(self, path: str, mode: str, simulate_latency: bool = True, seed: Optional[int] = None) -> None:
+        self.path = path
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+
+        self.lock = threading.Lock()
+        self.next_seq = 0
+
+        if mode == RECORD:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            # Replay needs the seed the run was recorded with (candidate shuffles are part of the prompts),
+            # so an unseeded recording gets one of its own
+            self.seed = seed if seed is not None else secrets.randbits(32)
+            self.file = open(path, "w", encoding="utf-8")
+            self.write({"version": CASSETTE_VERSION, "seed": self.seed})
+
+            print(f"{self.PRINT_PREFIX} recording LLM calls to {path} (seed {self.seed})")
+
+        elif mode == REPLAY:
+            with open(path, "r", encoding="utf-8") as file:
+                header, *entries = [json.loads(line) for line in file if line.strip()]
+
+            self.seed = header.get("seed") if seed is None else seed
+
+            # Fan-out calls finish (and are written) out of order, so replay follows the
+            # issue order recorded in "seq", falling back to request-key order on a mismatch.
+            # Calls that failed or were cancelled leave a marker instead of a response
+            self.entries: list[dict] = sorted((entry for entry in entries if "response" in entry), key=lambda entry: entry['seq'])
+            self.entries_by_seq: dict[int, dict] = {entry['seq']: entry for entry in self.entries}
+            self.unfinished_by_seq: dict[int, dict] = {entry['seq']: entry for entry in entries if "response" not in entry}
+            self.entries_by_key: dict[str, deque[dict]] = {}
+            for entry in self.entries:
+                self.entries_by_key.setdefault(entry['key'], deque()).append(entry)
+
+            self.replayed: set[int] = set()
+
+            print(f"{self.PRINT_PREFIX} replaying {len(self.entries)} LLM calls from {path}")
+
+        else:
+            error_message = f"{self.PRINT_PREFIX} invalid cassette mode: {mode}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ValueError(error_message)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def write(self, line: dict) -> None:
+        self.file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def issue(self) -> int:
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            return seq
+
+    def record(self, seq: int, provider: str, key: str, response: str, latency: float) -> None:
+        with self.lock:
+            self.write({"seq": seq, "provider": provider, "key": key, "latency": latency, "response": response})
+
+    def record_unfinished(self, seq: int, provider: str, key: str, exception: BaseException) -> None:
+        with self.lock:
+            outcome = {"cancelled": True} if isinstance(exception, asyncio.CancelledError) else {"error": type(exception).__name__}
+            self.write({"seq": seq, "provider": provider, "key": key, **outcome})
+
+    def replay(self, seq: int, key: str) -> tuple[str, float]:
+        with self.lock:
+            unfinished = self.unfinished_by_seq.get(seq)
+            if unfinished and unfinished['key'] == key:
+                outcome = "was cancelled" if unfinished.get("cancelled") else f"failed ({unfinished.get('error')})"
+                error_message = f"{self.PRINT_PREFIX} call {seq} {outcome} in the recording"
+                print(f"[red][bold]{error_message}[/bold][/red]")
+                raise CassetteError(error_message)
+
+            entry = self.entries_by_seq.get(seq)
+
+            if entry is None or entry['key'] != key or entry['seq'] in self.replayed:
+                print(f"[yellow]{self.PRINT_PREFIX} call {seq} diverged from the recording - matching by request instead[/yellow]")
+
+                queue = self.entries_by_key.get(key)
+                while queue and queue[0]['seq'] in self.replayed:
+                    queue.popleft()
+
+                if not queue:
+                    error_message = f"{self.PRINT_PREFIX} no recorded response for call {seq} (key {key[:12]}...)"
+                    print(f"[red][bold]{error_message}[/bold][/red]")
+                    raise CassetteError(error_message)
+
+                entry = queue.popleft()
+
+            self.replayed.add(entry['seq'])
+
+        latency = entry['latency'] if self.simulate_latency else 0.0
+
+        return entry['response'], latency
+
+    def close(self) -> None:
+        if self.recording:
+            self.file.close()
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_seed() -> Optional[int]:
+    cassette = get_cassette()
+    if cassette and cassette.seed is not None:
+        return cassette.seed
+
+    seed = os.environ.get("RANDOM_SEED")
+    return int(seed) if seed else None
+
+def get_cassette() -> Optional[Cassette]:
+    global _cassette
+
+    mode = os.environ.get("LLM_CASSETTE_MODE")
+    if mode not in (RECORD, REPLAY):
+        return None
+
+    with _cassette_lock:
+        if _cassette is None:
+            path = os.environ.get("LLM_CASSETTE_PATH")
+            if not path:
+                error_message = f"{PRINT_PREFIX} LLM_CASSETTE_PATH not set"
+                print(f"[red][bold]{error_message}[/bold][/red]")
+                raise KeyError(error_message)
+
+            seed = os.environ.get("RANDOM_SEED")
+
+            _cassette = Cassette(path=path,
+                                 mode=mode,
+                                 simulate_latency=os.environ.get("LLM_CASSETTE_LATENCY", "simulate") == "simulate",
+                                 seed=int(seed) if seed else None)
+
+        return _cassette
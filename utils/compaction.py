@@ -0,0 +1,42 @@
+import ast
+from typing import Optional
+
+
+def truncate_middle(text: str, max_chars: int, note: str = "") -> str:
+    # Keeps the head and tail of long output (where headers and final errors/results usually are),
+    # cutting on line boundaries where possible
+    if len(text) <= max_chars:
+        return text
+
+    head_end = text.rfind("\n", 0, max_chars // 2)
+    if head_end <= 0:
+        head_end = max_chars // 2
+
+    tail_start = text.find("\n", len(text) - max_chars // 2)
+    if tail_start == -1 or tail_start < head_end:
+        tail_start = len(text) - max_chars // 2
+
+    omitted = tail_start - head_end
+    marker = f"\n[... {omitted} characters omitted{' - ' + note if note else ''} ...]\n"
+
+    return text[:head_end] + marker + text[tail_start:].lstrip("\n")
+
+def get_defined_names(code: str) -> Optional[list[str]]:
+    # Top-level names a code step leaves behind in the execution context (functions and classes marked with ())
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    names: list[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.append(f"{node.name}()")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                names += [name.id for name in ast.walk(target) if isinstance(name, ast.Name)]
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names += [alias.asname or alias.name.split(".")[0] for alias in node.names]
+
+    return list(dict.fromkeys(names))
@@ -39,6 +39,11 @@ class APIKeyError(Exception):
         super().__init__(self.message)
 
 class TestError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class StructuredOutputError(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import dotenv
+import numpy as np
+
+from rich import print
+
+
+dotenv.load_dotenv()
+
+
+PRINT_PREFIX = "[bold][Hedge][/bold]"
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_BUDGET = 0.1
+LATENCY_WINDOW = 50
+MIN_SAMPLES = 5
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_SAMPLES) -> None:
+        self.window = window
+        self.min_samples = min_samples
+
+        self.samples: dict[str, deque[float]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, key: str, latency: float) -> None:
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+
+            return float(np.percentile(samples, percentile))
+
+
+class Hedger:
+    PRINT_PREFIX = PRINT_PREFIX
+
+    def __init__(self, percentile: float = DEFAULT_PERCENTILE, budget: float = DEFAULT_BUDGET, tracker: Optional[LatencyTracker] = None) -> None:
+        self.percentile = percentile
+        self.budget = budget
+        self.tracker = tracker or LatencyTracker()
+
+        self.lock = threading.Lock()
+        self.stats: dict[str, int] = {"calls": 0, "hedges": 0, "hedge_wins": 0, "over_budget": 0}
+
+    def allow_hedge(self) -> bool:
+        # Hedges are capped at `budget` extra requests per hedgeable call
+        with self.lock:
+            if self.stats['hedges'] + 1 > self.budget * self.stats['calls']:
+                self.stats['over_budget'] += 1
+                return False
+
+            self.stats['hedges'] += 1
+            return True
+
+    async def run(self, key: str, make_call: Callable[[], Awaitable[T]], discard: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+        """
+        Await make_call(), sending a duplicate if it outlasts the key's latency percentile; the first to finish wins
+        """
+        with self.lock:
+            self.stats['calls'] += 1
+
+        delay = self.tracker.percentile(key, self.percentile)
+        start = time.monotonic()
+
+        tasks = [asyncio.ensure_future(make_call())]
+
+        # Only the primary's own latency is recorded, timed to when it finishes: a hedge's latency is
+        # measured from a later start, and a primary cancelled in favour of a hedge never finished at all
+        tasks[0].add_done_callback(lambda task: self.record_latency(key, start, task))
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            if not done and self.allow_hedge():
+                print(f"{self.PRINT_PREFIX} {key} exceeded p{self.percentile:g} latency ({delay:0.2f}s) - sending a hedged request")
+                tasks.append(asyncio.ensure_future(make_call()))
+
+            winner = None
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in sorted(done, key=tasks.index):
+                    if winner is None and task.exception() is None:
+                        winner = task
+                    elif discard and task.exception() is None:
+                        await discard(task.result())
+
+            if winner is None:
+                raise tasks[0].exception()  # type: ignore
+
+        finally:
+            stragglers = [task for task in tasks if not task.done()]
+            for task in stragglers:
+                task.cancel()
+
+            # A straggler can complete before its cancellation lands, so its result still has to be released
+            for result in await asyncio.gather(*stragglers, return_exceptions=True):
+                if discard and not isinstance(result, BaseException):
+                    await discard(result)
+
+        if winner is not tasks[0]:
+            with self.lock:
+                self.stats['hedge_wins'] += 1
+                hedge_wins, hedges = self.stats['hedge_wins'], self.stats['hedges']
+
+            print(f"{self.PRINT_PREFIX} hedged request won for {key} ({hedge_wins} of {hedges} hedges)")
+
+        return winner.result()
+
+    def record_latency(self, key: str, start: float, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is None:
+            self.tracker.record(key, time.monotonic() - start)
+
+    def get_stats(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Optional[Hedger]:
+    global _hedger
+
+    if os.environ.get("LLM_HEDGING") != "True":
+        return None
+
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(percentile=float(os.environ.get("LLM_HEDGE_PERCENTILE") or DEFAULT_PERCENTILE),
+                             budget=float(os.environ.get("LLM_HEDGE_BUDGET") or DEFAULT_BUDGET))
+
+        return _hedger
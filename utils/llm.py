@@ -1,23 +1,34 @@
+import asyncio
+import contextvars
+import functools
+import threading
 import time
-from typing import Iterable, Optional
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Iterable, Iterator, Optional, TypeVar
 
 import os
 import backoff
 
-import concurrent.futures
-
-from utils.constants import CLIENT_VERSION
-from utils.custom_exceptions import LLMAPIInternalServerError, LLMAPIRateLimitError
+from utils.custom_exceptions import LLMAPIInternalServerError, LLMAPIRateLimitError, StructuredOutputError
 from utils.custom_types import Message, PromptsDict
-
-from anthropic import Anthropic
+from utils.messages import MessageSequence
+from utils.rate_limit import RateLimiter, get_rate_limiter, get_retry_after
+from utils.tokens import estimate_prompt_tokens, estimate_tokens
+from utils.response_cache import get_cache_key, get_response_cache
+from utils.cassette import Cassette, get_cassette
+from utils.hedging import get_hedger
+from utils.telemetry import get_telemetry
+from utils.structured import anthropic_message_to_tool_input, get_response_format, openai_completion_to_json, validate_schema
+from utils.prompt_cache import add_cache_breakpoints, get_shared_prefix_len, prompt_caching_enabled, record_cache_usage, should_prime_cache
+
+from anthropic import Anthropic, AsyncAnthropic
 from anthropic.types import Message as AnthropicMessage
 from anthropic.types import ContentBlock as AnthropicContentBlock
 from anthropic.types import TextBlock as AnthropicTextBlock
 from anthropic.types import MessageParam as AnthropicMessageParam
 from anthropic import RateLimitError, InternalServerError
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from openai.types.chat.chat_completion import ChatCompletion as OpenAIChatCompletion
 from openai.types.chat.chat_completion_message import ChatCompletionMessage as OpenAIChatCompletionMessage
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
@@ -25,6 +36,8 @@ from openai.types.chat.chat_completion_user_message_param import ChatCompletionU
 from openai.types.chat.chat_completion_assistant_message_param import ChatCompletionAssistantMessageParam
 from openai.types.chat.chat_completion_system_message_param import ChatCompletionSystemMessageParam
 from openai.types.chat.chat_completion import Choice
+from openai import RateLimitError as OpenAIRateLimitError
+from openai import InternalServerError as OpenAIInternalServerError
 
 from rich import print
 
@@ -33,6 +46,88 @@ from utils.enums import Role
 
 PRINT_PREFIX = "[bold][LLM][/bold]"
 
+T = TypeVar("T")
+
+SyncClient = Anthropic | OpenAI
+AsyncClient = AsyncAnthropic | AsyncOpenAI
+
+# One event loop (on a daemon thread) serves every fan-out in the process, so
+# connection pools are reused and no threads are spun up per llm_turns() call
+_engine_loop: Optional[asyncio.AbstractEventLoop] = None
+_engine_thread: Optional[threading.Thread] = None
+_engine_lock = threading.Lock()
+
+_async_clients: "weakref.WeakKeyDictionary[SyncClient, AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_engine_loop() -> asyncio.AbstractEventLoop:
+    global _engine_loop, _engine_thread
+
+    with _engine_lock:
+        if _engine_loop is None or _engine_loop.is_closed():
+            _engine_loop = asyncio.new_event_loop()
+            _engine_thread = threading.Thread(target=_engine_loop.run_forever, name="llm-engine", daemon=True)
+            _engine_thread.start()
+
+        return _engine_loop
+
+def run_coroutine(coro: Coroutine[Any, Any, T]) -> T:
+    loop = get_engine_loop()
+
+    if threading.current_thread() is _engine_thread:
+        coro.close()
+        error_message = f"{PRINT_PREFIX} blocking LLM call made from inside the engine loop - await the async variant instead"
+        print(f"[red][bold]{error_message}[/bold][/red]")
+        raise RuntimeError(error_message)
+
+    return asyncio.run_coroutine_threadsafe(in_context(contextvars.copy_context(), coro), loop).result()
+
+async def in_context(context: contextvars.Context, coro: Coroutine[Any, Any, T]) -> T:
+    # Tasks on the engine loop would otherwise see the engine thread's context variables, not the caller's
+    for var, value in context.items():
+        var.set(value)
+
+    return await coro
+
+def register_async_client(client: SyncClient, async_client: AsyncClient) -> None:
+    _async_clients[client] = async_client
+
+def get_async_client(client: SyncClient | AsyncClient) -> AsyncClient:
+    if isinstance(client, (AsyncAnthropic, AsyncOpenAI)):
+        return client
+
+    if client in _async_clients:
+        return _async_clients[client]
+
+    if isinstance(client, Anthropic):
+        async_client: AsyncClient = AsyncAnthropic(api_key=client.api_key,
+                                                   auth_token=client.auth_token,
+                                                   base_url=client.base_url,
+                                                   timeout=client.timeout,
+                                                   max_retries=client.max_retries)
+    elif isinstance(client, OpenAI):
+        async_client = AsyncOpenAI(api_key=client.api_key,
+                                   organization=client.organization,
+                                   base_url=client.base_url,
+                                   timeout=client.timeout,
+                                   max_retries=client.max_retries)
+    else:
+        error_message = f"{PRINT_PREFIX} unsupported client type: {type(client)}"
+        print(f"[red][bold]{error_message}[/bold][/red]")
+        raise TypeError(error_message)
+
+    register_async_client(client, async_client)
+
+    return async_client
+
+def get_model(env_key: str) -> str:
+    model = os.environ.get(env_key)
+    if model is None:
+        error_message = f"{PRINT_PREFIX} {env_key} not set"
+        print(f"[red][bold]{error_message}[/bold][/red]")
+        raise KeyError(error_message)
+
+    return model
 
 def cast_messages_anthropic(messages: Iterable[Message]) -> list[AnthropicMessageParam]:
     casted_messages = []
@@ -49,27 +144,153 @@ def cast_messages_anthropic(messages: Iterable[Message]) -> list[AnthropicMessag
 def on_backoff_anthropic(details):
     print(f"[red][bold]{PRINT_PREFIX} Anthropic API error - backing off {details['wait']:0.1f} seconds after {details['tries']} tries\n{details['exception']}[/bold][/red]")
 
+def on_backoff_openai(details):
+    print(f"[red][bold]{PRINT_PREFIX} OpenAI API error - backing off {details['wait']:0.1f} seconds after {details['tries']} tries\n{details['exception']}[/bold][/red]")
+
+def estimate_request(limiter: RateLimiter, system: str, messages: list[Message], max_tokens: int, n: int = 1) -> tuple[int, int]:
+    return estimate_prompt_tokens(system, messages), limiter.estimate_output(max_tokens) * n
+
+def settle_request(limiter: RateLimiter, estimate: tuple[int, int], usage, n: int = 1) -> None:
+    if usage is None:
+        return
+
+    input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0
+    output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None) or 0
+
+    limiter.settle(estimate[0], input_tokens, estimate[1], output_tokens, n)
+
+def lookup_response_cache(provider: str, model: str, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, max_tokens: int, n: int = 1, tool: Optional[dict] = None) -> tuple[Optional[str], Optional[str]]:
+    # Only deterministic (temperature 0) calls are served from the on-disk cache
+    if temperature != 0.0:
+        return None, None
+
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None, None
+
+    cache_key = get_cache_key(provider, model, system, messages, stop_sequences, max_tokens, n, tool=tool)
+
+    return cache_key, response_cache.get(cache_key)
+
+def store_response_cache(cache_key: Optional[str], response: AnthropicMessage | OpenAIChatCompletion) -> None:
+    response_cache = get_response_cache()
+    if cache_key and response_cache:
+        response_cache.put(cache_key, response.model_dump_json())
+
+def release_request(limiter: RateLimiter, estimate: tuple[int, int], exception: BaseException) -> None:
+    # A cancelled call may already have sent its prompt, while an error that outlasted the backoff used nothing
+    if isinstance(exception, asyncio.CancelledError):
+        limiter.release(0, estimate[1])
+    else:
+        limiter.release(*estimate)
+
+def on_rate_limit(limiter: RateLimiter, exception: Exception) -> None:
+    retry_after = get_retry_after(exception)
+    if retry_after:
+        limiter.block(retry_after)
+
+async def use_cassette(cassette: Cassette, provider: str, key: str, response_type: type, call: Callable[[], Awaitable[T]], call_record: dict) -> T:
+    # The sequence number is taken before the first await, so it follows issue order rather than completion order
+    seq = cassette.issue()
+
+    if cassette.replaying:
+        call_record['source'] = "cassette"
+        response, latency = cassette.replay(seq, key)
+        if latency:
+            await asyncio.sleep(latency)
+
+        return response_type.model_validate_json(response)
+
+    start = time.monotonic()
+    try:
+        result = await call()
+    except BaseException as e:
+        cassette.record_unfinished(seq, provider, key, e)
+        raise
+
+    cassette.record(seq, provider, key, result.model_dump_json(), time.monotonic() - start)  # type: ignore
+
+    return result
+
+async def _acreate_anthropic(client: AsyncAnthropic, limiter: RateLimiter, estimate: tuple[int, int], call_record: dict, **kwargs) -> AnthropicMessage:
+    # Reserved once per call, so backoff retries of a rejected request don't debit the estimate again
+    await limiter.acquire(*estimate)
+    try:
+        return await _acreate_anthropic_attempts(client, limiter, call_record, **kwargs)
+    except BaseException as e:
+        release_request(limiter, estimate, e)
+        raise
+
 @backoff.on_exception(backoff.expo,
                       (RateLimitError, InternalServerError),
                       max_tries=10,
                       on_backoff=on_backoff_anthropic)
-def llm_call_anthropic(client: Anthropic, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, max_tokens: int) -> AnthropicMessage:
-    model = os.environ.get("ANTHROPIC_MODEL")
-    if model is None:
-        error_message = f"{PRINT_PREFIX} ANTHROPIC_MODEL not set"
-        print(f"[red][bold]{error_message}[/bold][/red]")
-        raise KeyError(error_message)
-    
+async def _acreate_anthropic_attempts(client: AsyncAnthropic, limiter: RateLimiter, call_record: dict, **kwargs) -> AnthropicMessage:
+    call_record['attempts'] += 1
+    await limiter.wait_unblocked()
+
+    try:
+        return await client.messages.create(**kwargs)
+    except RateLimitError as e:
+        on_rate_limit(limiter, e)
+        raise
+
+async def allm_call_anthropic(client: AsyncAnthropic, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, max_tokens: int, cache_prefix_len: Optional[int] = None, tool: Optional[dict] = None) -> AnthropicMessage:
+    model = get_model("ANTHROPIC_MODEL")
+
+    telemetry = get_telemetry()
+    call_record = telemetry.start_call("anthropic", model)
+
+    try:
+        cassette = get_cassette()
+        if cassette is None:
+            message = await _allm_call_anthropic(client, model, system, messages, stop_sequences, temperature, max_tokens, cache_prefix_len, call_record, tool)
+        else:
+            cassette_key = get_cache_key("anthropic", model, system, messages, stop_sequences, max_tokens, temperature=temperature, tool=tool)
+            message = await use_cassette(cassette, "anthropic", cassette_key, AnthropicMessage,
+                                         lambda: _allm_call_anthropic(client, model, system, messages, stop_sequences, temperature, max_tokens, cache_prefix_len, call_record, tool),
+                                         call_record)
+    except BaseException as e:
+        telemetry.finish_call(call_record, error=e)
+        raise
+
+    telemetry.finish_call(call_record, message.usage, message.stop_reason)
+
+    return message
+
+async def _allm_call_anthropic(client: AsyncAnthropic, model: str, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, max_tokens: int, cache_prefix_len: Optional[int], call_record: dict, tool: Optional[dict] = None) -> AnthropicMessage:
+    cache_key, cached_response = lookup_response_cache("anthropic", model, system, messages, stop_sequences, temperature, max_tokens, tool=tool)
+    if cached_response:
+        call_record['source'] = "cache"
+        return AnthropicMessage.model_validate_json(cached_response)
+
     anthropic_messages = cast_messages_anthropic(messages)
-    
+
+    if prompt_caching_enabled():
+        anthropic_system, anthropic_messages = add_cache_breakpoints(system, anthropic_messages, cache_prefix_len)
+    else:
+        anthropic_system = system
+
+    limiter = get_rate_limiter("anthropic")
+    estimate = estimate_request(limiter, system, messages, max_tokens)
+
+    # A forced tool call returns its input already shaped by the tool's JSON schema
+    tool_kwargs = {"tools": [tool], "tool_choice": {"type": "tool", "name": tool['name']}} if tool else {}
+
+    # Retries happen inside _acreate_anthropic; only errors that outlast the backoff are translated
     try:
-        message = client.messages.create(
+        message = await _acreate_anthropic(
+            client,
+            limiter,
+            estimate,
+            call_record,
             model=model,
             max_tokens=max_tokens,
             temperature=temperature,
-            system=system,
+            system=anthropic_system,
             messages=anthropic_messages,
             stop_sequences=stop_sequences,
+            **tool_kwargs,
         )
     except RateLimitError as e:
         error_message = f"{PRINT_PREFIX} Anthropic RateLimitError: {e}"
@@ -79,25 +300,22 @@ def llm_call_anthropic(client: Anthropic, system: str, messages: list[Message],
         error_message = f"{PRINT_PREFIX} Anthropic InternalServerError: {e}"
         print(f"[red][bold]{error_message}[/bold][/red]")
         raise LLMAPIInternalServerError(error_message)
-    
+
+    settle_request(limiter, estimate, message.usage)
+    record_cache_usage(message.usage)
+    store_response_cache(cache_key, message)
+
     return message
 
-def llm_call_anthropic_futures_to_texts(texts, futures):
-    for i, future in enumerate(futures):
-        try:
-            llm_response = future.result()
-            print(f"{PRINT_PREFIX} llm_response[{i}]: {llm_response}")
+def llm_call_anthropic(client: Anthropic | AsyncAnthropic, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, max_tokens: int, cache_prefix_len: Optional[int] = None, tool: Optional[dict] = None) -> AnthropicMessage:
+    return run_coroutine(allm_call_anthropic(get_async_client(client), system, messages, stop_sequences, temperature, max_tokens, cache_prefix_len, tool))  # type: ignore
 
-            anthropic_content: AnthropicContentBlock = llm_response.content[0]
-            if isinstance(anthropic_content, AnthropicTextBlock):
-                text: str = anthropic_content.text
-                texts[i] = text
-            else:
-                texts[i] = None
-                                
-        except Exception as exc:
-            print(f"{PRINT_PREFIX} Error obtaining future result: {exc}")
-            texts[i] = None
+def anthropic_message_to_text(llm_response: AnthropicMessage) -> Optional[str]:
+    anthropic_content: AnthropicContentBlock = llm_response.content[0]
+    if isinstance(anthropic_content, AnthropicTextBlock):
+        return anthropic_content.text
+    else:
+        return None
 
 def cast_messages_openai(messages: Iterable[Message]) -> list[ChatCompletionMessageParam]:
     casted_messages = []
@@ -115,133 +333,502 @@ def cast_messages_openai(messages: Iterable[Message]) -> list[ChatCompletionMess
 
     return casted_messages
 
-def llm_call_openai(client: OpenAI, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, n: int, max_tokens: int) -> OpenAIChatCompletion:
-    model = os.environ.get("OPENAI_MODEL")
-    if model is None:
-        error_message = f"{PRINT_PREFIX} OPENAI_MODEL not set"
-        print(f"[red][bold]{error_message}[/bold][/red]")
-        raise KeyError(error_message)
-    
+async def _acreate_openai(client: AsyncOpenAI, limiter: RateLimiter, estimate: tuple[int, int], call_record: dict, **kwargs) -> OpenAIChatCompletion:
+    # Reserved once per call, so backoff retries of a rejected request don't debit the estimate again
+    await limiter.acquire(*estimate)
+    try:
+        return await _acreate_openai_attempts(client, limiter, call_record, **kwargs)
+    except BaseException as e:
+        release_request(limiter, estimate, e)
+        raise
+
+@backoff.on_exception(backoff.expo,
+                      (OpenAIRateLimitError, OpenAIInternalServerError),
+                      max_tries=10,
+                      on_backoff=on_backoff_openai)
+async def _acreate_openai_attempts(client: AsyncOpenAI, limiter: RateLimiter, call_record: dict, **kwargs) -> OpenAIChatCompletion:
+    call_record['attempts'] += 1
+    await limiter.wait_unblocked()
+
+    try:
+        return await client.chat.completions.create(**kwargs)
+    except OpenAIRateLimitError as e:
+        on_rate_limit(limiter, e)
+        raise
+
+async def allm_call_openai(client: AsyncOpenAI, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, n: int, max_tokens: int, tool: Optional[dict] = None) -> OpenAIChatCompletion:
+    model = get_model("OPENAI_MODEL")
+
+    telemetry = get_telemetry()
+    call_record = telemetry.start_call("openai", model)
+
+    try:
+        cassette = get_cassette()
+        if cassette is None:
+            response = await _allm_call_openai(client, model, system, messages, stop_sequences, temperature, n, max_tokens, call_record, tool)
+        else:
+            cassette_key = get_cache_key("openai", model, system, messages, stop_sequences, max_tokens, n, temperature=temperature, tool=tool)
+            response = await use_cassette(cassette, "openai", cassette_key, OpenAIChatCompletion,
+                                          lambda: _allm_call_openai(client, model, system, messages, stop_sequences, temperature, n, max_tokens, call_record, tool),
+                                          call_record)
+    except BaseException as e:
+        telemetry.finish_call(call_record, error=e)
+        raise
+
+    telemetry.finish_call(call_record, response.usage, ",".join(str(choice.finish_reason) for choice in response.choices))
+
+    return response
+
+async def _allm_call_openai(client: AsyncOpenAI, model: str, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, n: int, max_tokens: int, call_record: dict, tool: Optional[dict] = None) -> OpenAIChatCompletion:
+    cache_key, cached_response = lookup_response_cache("openai", model, system, messages, stop_sequences, temperature, max_tokens, n, tool=tool)
+    if cached_response:
+        call_record['source'] = "cache"
+        return OpenAIChatCompletion.model_validate_json(cached_response)
+
     openai_system: Message = {'role': Role.SYSTEM.value, 'content': system}
-    openai_messages: list[Message] = [openai_system] + messages
+    openai_messages: list[Message] = [openai_system, *messages]
 
     casted_messages = cast_messages_openai(openai_messages)
 
-    response = client.chat.completions.create(
+    limiter = get_rate_limiter("openai")
+    estimate = estimate_request(limiter, system, messages, max_tokens, n)
+
+    response = await _acreate_openai(
+        client,
+        limiter,
+        estimate,
+        call_record,
         model=model,
         messages=casted_messages,
         stop=stop_sequences,
         temperature=temperature,
         n=n,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        **({"response_format": get_response_format(tool)} if tool else {})
     )
 
+    settle_request(limiter, estimate, response.usage, n)
+    store_response_cache(cache_key, response)
+
     return response
 
-def llm_turn(client: Anthropic | OpenAI, prompts: PromptsDict, stop_sequences: list[str], temperature: float, max_tokens: int = 4000) -> str:
-    return llm_turns(client, prompts, stop_sequences, temperature, n=1, max_tokens=max_tokens)[0]
+def llm_call_openai(client: OpenAI | AsyncOpenAI, system: str, messages: list[Message], stop_sequences: list[str], temperature: float, n: int, max_tokens: int, tool: Optional[dict] = None) -> OpenAIChatCompletion:
+    return run_coroutine(allm_call_openai(get_async_client(client), system, messages, stop_sequences, temperature, n, max_tokens, tool))  # type: ignore
+
+def openai_completion_to_texts(llm_response: OpenAIChatCompletion) -> list[str]:
+    texts: list[str] = []
+
+    choices: list[Choice] = llm_response.choices
+
+    for choice in choices:
+        message: OpenAIChatCompletionMessage = choice.message
+        openai_content: Optional[str] = message.content
 
-def llm_turns(client: Anthropic | OpenAI, prompts: PromptsDict | list[PromptsDict], stop_sequences: list[str], temperature: float, n: Optional[int], max_tokens: int = 4000) -> list[str]:    
+        if openai_content is not None:
+            texts.append(openai_content)
+        else:
+            error_message = f"{PRINT_PREFIX} empty openai_content: {llm_response}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise ValueError(error_message)
+
+    return texts
+
+def validate_prompts(prompts: PromptsDict | list[PromptsDict], n: Optional[int]) -> list[PromptsDict]:
     if isinstance(prompts, dict):
         if not isinstance(n, int) or n < 1:
             error_message = f"{PRINT_PREFIX} n must be a positive integer if prompts is a dictionary"
             print(f"[red][bold]{error_message}[/bold][/red]")
             raise ValueError(error_message)
-        
-        if isinstance(prompts['system'], str) and isinstance(prompts['messages'], list):
-            texts: list[Optional[str]] = [None] * n
-
-            if isinstance(client, Anthropic):
-                with concurrent.futures.ThreadPoolExecutor(max_workers=n) as executor:
-                    futures = [
-                        executor.submit(
-                            llm_call_anthropic, 
-                            client, 
-                            prompts['system'], 
-                            prompts['messages'], 
-                            stop_sequences, 
-                            temperature,
-                            max_tokens=max_tokens
-                        ) for _ in range(n)
-                    ]
-                    
-                    concurrent.futures.wait(futures)
-
-                    llm_call_anthropic_futures_to_texts(texts, futures)
-
-            elif isinstance(client, OpenAI):
-                llm_response = llm_call_openai(client, prompts['system'], prompts['messages'], stop_sequences, temperature, n, max_tokens)
-
-                print(f"{PRINT_PREFIX} llm_response[0:{n}]: {llm_response}")
-
-                choices: list[Choice] = llm_response.choices
-
-                for choice in choices:
-                    message: OpenAIChatCompletionMessage = choice.message
-                    openai_content: Optional[str] = message.content
-                    
-                    if openai_content is not None:
-                        texts.append(openai_content)
-                    else:
-                        error_message = f"{PRINT_PREFIX} empty openai_content: {llm_response}"
-                        print(f"[red][bold]{error_message}[/bold][/red]")
-                        raise ValueError(error_message)
-
-            result = [text for text in texts if text is not None]
-            return result
-            
-        else:
-            error_message = f"""
-    {PRINT_PREFIX} expected prompts['system'] to be str and prompts['messages'] to be list,
-    got {type(prompts['system'])} and {type(prompts['messages'])} respectively instead
-    """.strip()
 
-            print(f"[red][bold]{error_message}[/bold][/red]")
-            raise TypeError(error_message)
-        
+        prompt_list = [prompts]
+
     elif isinstance(prompts, list):
-        n = len(prompts)
+        prompt_list = prompts
 
-        for prompt in prompts:
-            if not (isinstance(prompt['system'], str) and isinstance(prompt['messages'], list)):
-                error_message = f"""
-{PRINT_PREFIX} expected prompt['system'] to be str and prompt['messages'] to be list,
-got {type(prompt['system'])} and {type(prompt['messages'])} respectively instead
-""".strip()
-                print(f"[red][bold]{error_message}[/bold][/red]")
-                raise TypeError(error_message)
-            
-        texts: list[Optional[str]] = [None] * n
-
-        if isinstance(client, Anthropic):
-            with concurrent.futures.ThreadPoolExecutor(max_workers=n) as executor:
-
-                futures = []
-                for i in range(n):
-                    future = executor.submit(
-                        llm_call_anthropic,
-                        client,
-                        prompts[i]['system'],  # type: ignore
-                        prompts[i]['messages'],  # type: ignore
-                        stop_sequences,
-                        temperature,
-                        max_tokens=max_tokens
-                    )
-                    futures.append(future)
-                    
-                    if i < n - 1:  # Don't delay after the last submission
-                        time.sleep(0.1)
-                    
-                concurrent.futures.wait(futures)
-                llm_call_anthropic_futures_to_texts(texts, futures)
-
-        elif isinstance(client, OpenAI):
-            raise NotImplementedError(f"OpenAI not supported for prompt list paralellization in this version ({CLIENT_VERSION})")
-
-        result = [text for text in texts if text is not None]
-        return result
-            
     else:
         error_message = f"{PRINT_PREFIX} expected prompts to be dict or list, got {type(prompts)} instead"
         print(f"[red][bold]{error_message}[/bold][/red]")
-        raise TypeError(error_message)
\ No newline at end of file
+        raise TypeError(error_message)
+
+    for prompt in prompt_list:
+        if not (isinstance(prompt['system'], str) and isinstance(prompt['messages'], (list, MessageSequence))):
+            error_message = f"""
+{PRINT_PREFIX} expected prompt['system'] to be str and prompt['messages'] to be list or MessageSequence,
+got {type(prompt['system'])} and {type(prompt['messages'])} respectively instead
+""".strip()
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise TypeError(error_message)
+
+    return prompt_list
+
+async def prime_prompt_cache(client: AsyncAnthropic, prompt: PromptsDict, stop_sequences: list[str], temperature: float, cache_prefix_len: int) -> None:
+    try:
+        await allm_call_anthropic(client,
+                                  prompt['system'],  # type: ignore
+                                  prompt['messages'],  # type: ignore
+                                  stop_sequences,
+                                  temperature,
+                                  max_tokens=1,
+                                  cache_prefix_len=cache_prefix_len)
+    except Exception as e:
+        print(f"{PRINT_PREFIX} prompt cache priming failed, continuing uncached: {e}")
+
+def hedge_call(hedge: Optional[str], make_call: Callable[[], Awaitable[T]], discard: Optional[Callable[[T], Awaitable[None]]] = None) -> Awaitable[T]:
+    # `hedge` names the latency history (usually agent + state) a slow call is judged against.
+    # Replayed and recorded runs are never hedged, so cassettes stay one entry per call
+    hedger = get_hedger() if hedge and get_cassette() is None else None
+    if hedger is None:
+        return make_call()
+
+    return hedger.run(hedge, make_call, discard)  # type: ignore
+
+async def allm_turn(client: SyncClient | AsyncClient, prompts: PromptsDict, stop_sequences: list[str], temperature: float, max_tokens: int = 4000, hedge: Optional[str] = None) -> str:
+    return (await allm_turns(client, prompts, stop_sequences, temperature, n=1, max_tokens=max_tokens, hedge=hedge))[0]
+
+async def gather_quorum(coros: list[Coroutine[Any, Any, T]], quorum: Optional[int] = None, deadline: Optional[float] = None, early_stop: Optional[Callable[[dict[int, T], int], bool]] = None) -> dict[int, T]:
+    # Returns once `quorum` calls have succeeded, `deadline` seconds have passed with at least one
+    # success in hand, or early_stop(results, remaining) says the outstanding results can't change
+    # the outcome; whatever is still in flight at that point is cancelled
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    task_idxs = {task: i for i, task in enumerate(tasks)}
+
+    if quorum is None:
+        quorum = len(tasks)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    results: dict[int, T] = {}
+    pending = set(tasks)
+
+    try:
+        while pending and len(results) < quorum:
+            timeout = max(0.0, start + deadline - loop.time()) if deadline is not None and results else None
+
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+
+            for task in sorted(done, key=task_idxs.get):  # type: ignore
+                if task.exception() is not None:
+                    print(f"{PRINT_PREFIX} Error obtaining result: {task.exception()}")
+                else:
+                    results[task_idxs[task]] = task.result()
+
+            if early_stop and pending and results and early_stop(results, min(len(pending), quorum - len(results))):
+                print(f"{PRINT_PREFIX} outcome settled after {len(results)} of {len(tasks)} results in {loop.time() - start:0.2f}s")
+                break
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if pending:
+        print(f"{PRINT_PREFIX} cancelled {len(pending)} straggling calls after {len(results)} of {len(tasks)} results in {loop.time() - start:0.2f}s")
+
+    return results
+
+async def allm_turns_indexed(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], stop_sequences: list[str], temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, str], int], bool]] = None) -> dict[int, str]:
+    prompt_list = validate_prompts(prompts, n)
+    async_client = get_async_client(client)
+
+    # A single prompt is sampled n times, a list of prompts is sampled once each
+    if isinstance(prompts, dict):
+        prompt_list = prompt_list * n  # type: ignore
+
+    texts: dict[int, str] = {}
+
+    if isinstance(async_client, AsyncAnthropic):
+        cache_prefix_len = get_shared_prefix_len(prompt_list)
+
+        if prompt_caching_enabled() and should_prime_cache(prompt_list, cache_prefix_len):
+            await prime_prompt_cache(async_client, prompt_list[0], stop_sequences, temperature, cache_prefix_len)
+
+        results = await gather_quorum([
+            hedge_call(hedge, functools.partial(allm_call_anthropic,
+                                                async_client,
+                                                prompt['system'],  # type: ignore
+                                                prompt['messages'],  # type: ignore
+                                                stop_sequences,
+                                                temperature,
+                                                max_tokens=max_tokens,
+                                                cache_prefix_len=cache_prefix_len))
+            for prompt in prompt_list
+        ], quorum, deadline, early_stop and (lambda results, remaining: early_stop({i: text for i, result in results.items() if (text := anthropic_message_to_text(result)) is not None}, remaining)))
+
+        for i, result in sorted(results.items()):
+            print(f"{PRINT_PREFIX} llm_response[{i}]: {result}")
+
+            text = anthropic_message_to_text(result)
+            if text is not None:
+                texts[i] = text
+
+    elif isinstance(prompts, dict):
+        # OpenAI samples n completions of the same prompt in a single request, so there are no stragglers to cut
+        llm_response = await hedge_call(hedge, functools.partial(allm_call_openai, async_client, prompts['system'], prompts['messages'], stop_sequences, temperature, n, max_tokens))  # type: ignore
+
+        print(f"{PRINT_PREFIX} llm_response[0:{n}]: {llm_response}")
+
+        texts = dict(enumerate(openai_completion_to_texts(llm_response)))
+
+    else:
+        results = await gather_quorum([
+            hedge_call(hedge, functools.partial(allm_call_openai,
+                                                async_client,
+                                                prompt['system'],  # type: ignore
+                                                prompt['messages'],  # type: ignore
+                                                stop_sequences,
+                                                temperature,
+                                                1,
+                                                max_tokens))
+            for prompt in prompt_list
+        ], quorum, deadline, early_stop and (lambda results, remaining: early_stop({i: openai_completion_to_texts(result)[0] for i, result in results.items()}, remaining)))
+
+        for i, result in sorted(results.items()):
+            print(f"{PRINT_PREFIX} llm_response[{i}]: {result}")
+            texts[i] = openai_completion_to_texts(result)[0]
+
+    return texts
+
+async def allm_turns(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], stop_sequences: list[str], temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, str], int], bool]] = None) -> list[str]:
+    texts = await allm_turns_indexed(client, prompts, stop_sequences, temperature, n, max_tokens, quorum, deadline, hedge, early_stop)
+    return [texts[i] for i in sorted(texts)]
+
+def llm_turn(client: SyncClient | AsyncClient, prompts: PromptsDict, stop_sequences: list[str], temperature: float, max_tokens: int = 4000, hedge: Optional[str] = None) -> str:
+    return llm_turns(client, prompts, stop_sequences, temperature, n=1, max_tokens=max_tokens, hedge=hedge)[0]
+
+def llm_turns(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], stop_sequences: list[str], temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, str], int], bool]] = None) -> list[str]:
+    return run_coroutine(allm_turns(client, prompts, stop_sequences, temperature, n, max_tokens, quorum, deadline, hedge, early_stop))
+
+def llm_turns_indexed(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], stop_sequences: list[str], temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, str], int], bool]] = None) -> dict[int, str]:
+    # Keyed by prompt (or sample) index, so callers can line results up with per-prompt state after failures or a quorum cut
+    return run_coroutine(allm_turns_indexed(client, prompts, stop_sequences, temperature, n, max_tokens, quorum, deadline, hedge, early_stop))
+
+async def allm_structured_call(client: AsyncClient, prompt: PromptsDict, tool: dict, temperature: float, max_tokens: int, cache_prefix_len: Optional[int] = None, hedge: Optional[str] = None, retries: int = 2) -> dict:
+    # One slot of a structured fan-out: output that fails the schema is re-requested here, without touching the other slots
+    for attempt in range(retries + 1):
+        if isinstance(client, AsyncAnthropic):
+            llm_response = await hedge_call(hedge, functools.partial(allm_call_anthropic, client, prompt['system'], prompt['messages'], [], temperature, max_tokens, cache_prefix_len, tool))  # type: ignore
+            value = anthropic_message_to_tool_input(llm_response, tool['name'])
+        else:
+            llm_response = await hedge_call(hedge, functools.partial(allm_call_openai, client, prompt['system'], prompt['messages'], [], temperature, 1, max_tokens, tool))  # type: ignore
+            value = openai_completion_to_json(llm_response)
+
+        errors = validate_schema(value, tool['input_schema']) if value is not None else ["no structured output in response"]
+        if not errors:
+            return value  # type: ignore
+
+        print(f"{PRINT_PREFIX} [yellow]{tool['name']} output failed validation (attempt {attempt + 1} of {retries + 1}): {errors}[/yellow]")
+
+    error_message = f"{PRINT_PREFIX} {tool['name']} output still invalid after {retries + 1} attempts"
+    print(f"[red][bold]{error_message}[/bold][/red]")
+    raise StructuredOutputError(error_message)
+
+async def allm_structured_indexed(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], tool: dict, temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, dict], int], bool]] = None, retries: int = 2) -> dict[int, dict]:
+    """
+    Like allm_turns_indexed, but each result is the tool input (Anthropic) or JSON schema output (OpenAI),
+    already validated against tool['input_schema']. Prompts must not end with a prefilled assistant turn
+    """
+    prompt_list = validate_prompts(prompts, n)
+    async_client = get_async_client(client)
+
+    if isinstance(prompts, dict):
+        prompt_list = prompt_list * n  # type: ignore
+
+    cache_prefix_len = get_shared_prefix_len(prompt_list) if isinstance(async_client, AsyncAnthropic) else None
+
+    results = await gather_quorum([
+        allm_structured_call(async_client, prompt, tool, temperature, max_tokens, cache_prefix_len, hedge, retries)
+        for prompt in prompt_list
+    ], quorum, deadline, early_stop)
+
+    for i, result in sorted(results.items()):
+        print(f"{PRINT_PREFIX} structured_response[{i}]: {result}")
+
+    return results
+
+def llm_structured_indexed(client: SyncClient | AsyncClient, prompts: PromptsDict | list[PromptsDict], tool: dict, temperature: float, n: Optional[int], max_tokens: int = 4000, quorum: Optional[int] = None, deadline: Optional[float] = None, hedge: Optional[str] = None, early_stop: Optional[Callable[[dict[int, dict], int], bool]] = None, retries: int = 2) -> dict[int, dict]:
+    return run_coroutine(allm_structured_indexed(client, prompts, tool, temperature, n, max_tokens, quorum, deadline, hedge, early_stop, retries))
+
+@backoff.on_exception(backoff.expo,
+                      (RateLimitError, InternalServerError),
+                      max_tries=10,
+                      on_backoff=on_backoff_anthropic)
+async def _aopen_anthropic_stream(client: AsyncAnthropic, limiter: RateLimiter, call_record: dict, **kwargs):
+    # Only opening the stream is retried - once text has been handed to the caller it can't be taken back
+    call_record['attempts'] += 1
+    await limiter.wait_unblocked()
+
+    stream_manager = client.messages.stream(**kwargs)
+    try:
+        return stream_manager, await stream_manager.__aenter__()
+    except RateLimitError as e:
+        on_rate_limit(limiter, e)
+        raise
+
+async def _aopen_first_delta(client: AsyncAnthropic, limiter: RateLimiter, estimate: tuple[int, int], call_record: dict, **kwargs):
+    # Opening a stream only counts as done once the first token is in, which is what a hedge races on
+    await limiter.acquire(*estimate)
+    try:
+        stream_manager, stream = await _aopen_anthropic_stream(client, limiter, call_record, **kwargs)
+    except BaseException as e:
+        release_request(limiter, estimate, e)
+        raise
+
+    try:
+        deltas = stream.text_stream.__aiter__()
+        first_delta = await _anext(deltas)
+    except BaseException:
+        await stream_manager.__aexit__(None, None, None)
+        limiter.release(0, estimate[1])
+        raise
+
+    return stream_manager, stream, deltas, first_delta
+
+async def _aclose_stream(limiter: RateLimiter, estimate: tuple[int, int], opened_stream) -> None:
+    # A hedge loser is closed after its first token, so the rest of its output estimate goes unused
+    await opened_stream[0].__aexit__(None, None, None)
+    limiter.release(0, max(0, estimate[1] - estimate_tokens(opened_stream[3] or "")))
+
+async def _achain_deltas(first_delta: Optional[str], deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    if first_delta is not None:
+        yield first_delta
+
+    async for delta in deltas:
+        yield delta
+
+def find_stop(text: str, stops: list[str], search_from: int) -> Optional[int]:
+    # Index just past the earliest stop string found at or after search_from, if any
+    ends = [i + len(stop) for stop in stops if (i := text.find(stop, search_from)) != -1]
+    return min(ends) if ends else None
+
+async def allm_stream(client: SyncClient | AsyncClient, prompts: PromptsDict, stop_sequences: list[str], temperature: float, max_tokens: int = 4000, until: Optional[list[str]] = None, timings: Optional[dict] = None, hedge: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yield response text as it is generated, closing the stream once any `until` string has streamed in
+    """
+    validate_prompts(prompts, 1)
+    async_client = get_async_client(client)
+
+    if timings is None:
+        timings = {}
+
+    start = time.monotonic()
+
+    # Streams aren't recorded, and OpenAI isn't streamed - both arrive as a single chunk instead
+    if not isinstance(async_client, AsyncAnthropic) or get_cassette():
+        text = await allm_turn(async_client, prompts, stop_sequences, temperature, max_tokens, hedge)
+
+        stop_idx = find_stop(text, until, 0) if until else None
+        timings.update({"ttft": time.monotonic() - start, "total": time.monotonic() - start, "stop": "until" if stop_idx else "complete"})
+
+        yield text[:stop_idx]
+        return
+
+    system: str = prompts['system']  # type: ignore
+    messages: list[Message] = prompts['messages']  # type: ignore
+
+    anthropic_messages = cast_messages_anthropic(messages)
+
+    if prompt_caching_enabled():
+        anthropic_system, anthropic_messages = add_cache_breakpoints(system, anthropic_messages, None)
+    else:
+        anthropic_system = system
+
+    limiter = get_rate_limiter("anthropic")
+    estimate = estimate_request(limiter, system, messages, max_tokens)
+
+    model = get_model("ANTHROPIC_MODEL")
+
+    telemetry = get_telemetry()
+    call_record = telemetry.start_call("anthropic", model)
+    call_record['source'] = "stream"
+
+    try:
+        stream_manager, stream, deltas, first_delta = await hedge_call(hedge, functools.partial(
+            _aopen_first_delta,
+            async_client,
+            limiter,
+            estimate,
+            call_record,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=anthropic_system,
+            messages=anthropic_messages,
+            stop_sequences=stop_sequences,
+        ), functools.partial(_aclose_stream, limiter, estimate))
+    except BaseException as e:
+        telemetry.finish_call(call_record, error=e)
+
+        if isinstance(e, RateLimitError):
+            error_message = f"{PRINT_PREFIX} Anthropic RateLimitError: {e}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise LLMAPIRateLimitError(error_message)
+        if isinstance(e, InternalServerError):
+            error_message = f"{PRINT_PREFIX} Anthropic InternalServerError: {e}"
+            print(f"[red][bold]{error_message}[/bold][/red]")
+            raise LLMAPIInternalServerError(error_message)
+
+        raise
+
+    text = ""
+    longest_stop = max((len(stop) for stop in until), default=0) if until else 0
+
+    message = None
+    try:
+        async for delta in _achain_deltas(first_delta, deltas):
+            if "ttft" not in timings:
+                timings['ttft'] = time.monotonic() - start
+
+            # A stop string can straddle two deltas, so the search starts far enough back to catch it
+            search_from = max(0, len(text) - longest_stop + 1)
+            text += delta
+
+            stop_idx = find_stop(text, until, search_from) if until else None
+            if stop_idx is not None:
+                timings['stop'] = "until"
+                yield delta[:len(delta) - (len(text) - stop_idx)]
+                break
+
+            yield delta
+
+        else:
+            message = await stream.get_final_message()
+            timings['stop'] = message.stop_reason
+
+            settle_request(limiter, estimate, message.usage)
+            record_cache_usage(message.usage)
+
+    finally:
+        await stream_manager.__aexit__(None, None, None)
+
+        # Closed at an `until` match, by the caller or by cancellation: the output never generated is handed back
+        if message is None:
+            limiter.release(0, max(0, estimate[1] - estimate_tokens(text)))
+
+        timings.setdefault("ttft", time.monotonic() - start)
+        timings.setdefault("stop", "closed")
+        timings['total'] = time.monotonic() - start
+
+        call_record['ttft'] = timings['ttft']
+        telemetry.finish_call(call_record, message.usage if message else None, timings['stop'])
+
+        print(f"{PRINT_PREFIX} stream: first token after {timings['ttft']:0.2f}s, done after {timings['total']:0.2f}s ({timings['stop']})")
+
+async def _anext(stream: AsyncIterator[str]) -> Optional[str]:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+def llm_stream(client: SyncClient | AsyncClient, prompts: PromptsDict, stop_sequences: list[str], temperature: float, max_tokens: int = 4000, until: Optional[list[str]] = None, timings: Optional[dict] = None, hedge: Optional[str] = None) -> Iterator[str]:
+    stream = allm_stream(client, prompts, stop_sequences, temperature, max_tokens, until, timings, hedge)
+
+    # Breaking out of the loop early closes the stream (and the underlying request) on the engine loop
+    try:
+        while (delta := run_coroutine(_anext(stream))) is not None:
+            yield delta
+    finally:
+        run_coroutine(stream.aclose())  # type: ignore
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Callable
+
+from anthropic import Anthropic, AsyncAnthropic
+from anthropic.types import Message as AnthropicMessage
+
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat.chat_completion import ChatCompletion as OpenAIChatCompletion
+
+from utils.llm import register_async_client
+
+
+# Offline stand-ins for the Anthropic and OpenAI clients, used by the tests and
+# the benchmarks in meta_tools/. The returned clients are genuine SDK instances
+# (so the isinstance() dispatch in utils.llm still applies) whose `messages` /
+# `chat` resources are swapped out for in-process fakes.
+
+Responder = Callable[[dict], str]
+Latency = float | Callable[[dict], float]
+
+
+def echo_responder(request: dict) -> str:
+    return f"<stub>{len(request.get('messages', []))}</stub>"
+
+def parse_json_object(text: str) -> dict:
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+
+    return value if isinstance(value, dict) else {}
+
+def stub_token_count(text: str) -> int:
+    return len(text) // 4
+
+def flatten_content(content: str | list[dict]) -> tuple[str, bool]:
+    # Returns the text of a system prompt/message and whether it carries a cache breakpoint
+    if isinstance(content, str):
+        return content, False
+    else:
+        text = "".join(block.get("text", "") for block in content)
+        return text, any("cache_control" in block for block in content)
+
+
+class StubLLM:
+    def __init__(self, responder: Responder = echo_responder, latency: Latency = 0.0, chunk_size: int = 8, chunk_latency: float = 0.0) -> None:
+        self.responder = responder
+        self.latency = latency
+
+        # Streamed responses arrive in chunk_size pieces, chunk_latency apart
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+
+        self.requests: list[dict] = []
+        self.lock = threading.Lock()
+
+        # Prefixes "written" to the simulated Anthropic prompt cache
+        self.cached_prefixes: set[str] = set()
+
+    def get_latency(self, request: dict) -> float:
+        if callable(self.latency):
+            return self.latency(request)
+        else:
+            return self.latency
+
+    def record(self, request: dict) -> int:
+        with self.lock:
+            self.requests.append(request)
+            return len(self.requests)
+
+    def anthropic_message(self, request: dict) -> AnthropicMessage:
+        request_idx = self.record(request)
+        text = self.responder(request)
+
+        # With a forced tool the responder's text is taken as the tool input JSON (anything else becomes an empty input)
+        if "tool_choice" in request:
+            content = [{"type": "tool_use", "id": f"toolu_stub_{request_idx}", "name": request['tool_choice']['name'], "input": parse_json_object(text)}]
+        else:
+            content = [{"type": "text", "text": text}]
+
+        return AnthropicMessage.model_validate({
+            "id": f"msg_stub_{request_idx}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "stub"),
+            "content": content,
+            "stop_reason": "tool_use" if "tool_choice" in request else "end_turn",
+            "stop_sequence": None,
+            "usage": self.anthropic_usage(request, text),
+        })
+
+    def anthropic_usage(self, request: dict, text: str) -> dict:
+        segments = [flatten_content(request.get("system", ""))]
+        segments += [flatten_content(message['content']) for message in request['messages']]
+
+        prefix, read_upto, create_upto = "", 0, 0
+        with self.lock:
+            for segment_text, is_breakpoint in segments:
+                prefix += segment_text
+
+                if is_breakpoint:
+                    if prefix in self.cached_prefixes:
+                        read_upto = len(prefix)
+                    else:
+                        self.cached_prefixes.add(prefix)
+                        create_upto = len(prefix)
+
+        cache_read = stub_token_count(prefix[:read_upto])
+        cache_creation = stub_token_count(prefix[read_upto:create_upto]) if create_upto > read_upto else 0
+
+        return {"input_tokens": stub_token_count(prefix) - cache_read - cache_creation,
+                "output_tokens": stub_token_count(text),
+                "cache_read_input_tokens": cache_read,
+                "cache_creation_input_tokens": cache_creation}
+
+    def openai_completion(self, request: dict) -> OpenAIChatCompletion:
+        request_idx = self.record(request)
+        texts = [self.responder(request) for _ in range(request.get("n") or 1)]
+
+        return OpenAIChatCompletion.model_validate({
+            "id": f"chatcmpl_stub_{request_idx}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "stub"),
+            "choices": [{"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                        for i, text in enumerate(texts)],
+        })
+
+    def anthropic(self) -> Anthropic:
+        client = Anthropic(api_key="stub")
+        client.messages = StubAnthropicMessages(self)  # type: ignore
+
+        async_client = AsyncAnthropic(api_key="stub")
+        async_client.messages = StubAsyncAnthropicMessages(self)  # type: ignore
+
+        register_async_client(client, async_client)
+
+        return client
+
+    def openai(self) -> OpenAI:
+        client = OpenAI(api_key="stub")
+        client.chat = StubOpenAIChat(StubOpenAICompletions(self))  # type: ignore
+
+        async_client = AsyncOpenAI(api_key="stub")
+        async_client.chat = StubOpenAIChat(StubAsyncOpenAICompletions(self))  # type: ignore
+
+        register_async_client(client, async_client)
+
+        return client
+
+
+class StubAnthropicMessages:
+    def __init__(self, stub: StubLLM) -> None:
+        self.stub = stub
+
+    def create(self, **kwargs) -> AnthropicMessage:
+        time.sleep(self.stub.get_latency(kwargs))
+        return self.stub.anthropic_message(kwargs)
+
+
+class StubAsyncAnthropicMessages:
+    def __init__(self, stub: StubLLM) -> None:
+        self.stub = stub
+
+    async def create(self, **kwargs) -> AnthropicMessage:
+        await asyncio.sleep(self.stub.get_latency(kwargs))
+        return self.stub.anthropic_message(kwargs)
+
+    def stream(self, **kwargs) -> "StubAsyncAnthropicStream":
+        return StubAsyncAnthropicStream(self.stub, kwargs)
+
+
+class StubAsyncAnthropicStream:
+    def __init__(self, stub: StubLLM, request: dict) -> None:
+        self.stub = stub
+        self.request = request
+
+        self.closed = False
+
+    async def __aenter__(self) -> "StubAsyncAnthropicStream":
+        await asyncio.sleep(self.stub.get_latency(self.request))
+        self.message = self.stub.anthropic_message(self.request)
+        return self
+
+    async def __aexit__(self, exc_type, exc, exc_tb) -> None:
+        self.closed = True
+
+    @property
+    async def text_stream(self) -> AsyncIterator[str]:
+        text = self.message.content[0].text  # type: ignore
+        for i in range(0, len(text), self.stub.chunk_size):
+            if i:
+                await asyncio.sleep(self.stub.chunk_latency)
+            yield text[i:i + self.stub.chunk_size]
+
+    async def get_final_message(self) -> AnthropicMessage:
+        return self.message
+
+
+class StubOpenAIChat:
+    def __init__(self, completions) -> None:
+        self.completions = completions
+
+
+class StubOpenAICompletions:
+    def __init__(self, stub: StubLLM) -> None:
+        self.stub = stub
+
+    def create(self, **kwargs) -> OpenAIChatCompletion:
+        time.sleep(self.stub.get_latency(kwargs))
+        return self.stub.openai_completion(kwargs)
+
+
+class StubAsyncOpenAICompletions:
+    def __init__(self, stub: StubLLM) -> None:
+        self.stub = stub
+
+    async def create(self, **kwargs) -> OpenAIChatCompletion:
+        await asyncio.sleep(self.stub.get_latency(kwargs))
+        return self.stub.openai_completion(kwargs)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Iterable, Iterator, Optional, overload
+
+from utils.custom_types import Message
+
+
+class MessageSequence(Sequence):
+    """
+    Immutable list of messages that shares its prefix: extend() returns a new sequence pointing at this one rather
+    than a copy of it, so every prompt of a fan-out holds the same history. Iterates as plain Message dicts, which are
+    only cast to the SDK types at send time
+    """
+    __slots__ = ("prefix", "messages", "length")
+
+    def __init__(self, messages: Iterable[Message] = (), prefix: Optional[MessageSequence] = None) -> None:
+        self.prefix = prefix
+        self.messages: tuple[Message, ...] = tuple(messages)
+        self.length = (prefix.length if prefix is not None else 0) + len(self.messages)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @overload
+    def __getitem__(self, index: int) -> Message: ...
+    @overload
+    def __getitem__(self, index: slice) -> MessageSequence: ...
+
+    def __getitem__(self, index):
+        prefix_len = self.length - len(self.messages)
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+
+            # Cutting into the own messages only (e.g. [:-1] to drop a prefill) keeps the prefix shared
+            if start == 0 and step == 1 and stop >= prefix_len:
+                return MessageSequence(self.messages[:stop - prefix_len], self.prefix)
+
+            return MessageSequence(list(self)[index])
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("MessageSequence index out of range")
+
+        if index < prefix_len:
+            return self.prefix[index]  # type: ignore
+
+        return self.messages[index - prefix_len]
+
+    def __iter__(self) -> Iterator[Message]:
+        if self.prefix is not None:
+            yield from self.prefix
+        yield from self.messages
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (MessageSequence, list, tuple)):
+            return NotImplemented
+
+        return len(self) == len(other) and all(a is b or a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"MessageSequence({list(self)!r})"
+
+    def extend(self, *messages: Message) -> MessageSequence:
+        return MessageSequence(messages, self)
+
+    def shared_prefix_len(self, other: MessageSequence) -> int:
+        # Length of the longest prefix object both sequences are built on, found without comparing messages
+        prefixes = set()
+
+        sequence: Optional[MessageSequence] = self
+        while sequence is not None:
+            prefixes.add(id(sequence))
+            sequence = sequence.prefix
+
+        sequence = other
+        while sequence is not None and id(sequence) not in prefixes:
+            sequence = sequence.prefix
+
+        return sequence.length if sequence is not None else 0
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Iterable, Optional
 
 import glob
 import os
@@ -10,8 +10,9 @@ from xml.etree.ElementTree import Element
 from rich import print
 
 from utils.enums import Role
-from utils.llm import llm_turn
-from utils.custom_types import NestedStrDict
+from utils.llm import llm_turn, llm_turns_indexed
+from utils.xml_repair import record_repair, repair_xml
+from utils.custom_types import NestedStrDict, PromptsDict
 
 from agents.prompt_management import get_msg
 
@@ -21,6 +22,7 @@ from anthropic import Anthropic
 PRINT_PREFIX = "[bold][Parsing][/bold]"
 
 TOKEN_GROWTH_ALLOWANCE = 128
+XML_FIX_ATTEMPTS = 6
 
 
 def files2dict(path: str, extension: str) -> dict[str, str]:
@@ -34,61 +36,158 @@ def files2dict(path: str, extension: str) -> dict[str, str]:
 
     return retval
 
-def xmlstr2dict(xml_string: str, client: Anthropic, depth: int = 0) -> dict:
+def xmlstr2dict(xml_string: str, client: Optional[Anthropic], depth: int = 0, expected_tags: Optional[Iterable[str] | dict[str, list[str]]] = None) -> dict:
+    # expected_tags (see repair_xml) lists the tags the string should contain; a {tag: child tags} schema starts at "root"
     try:
         xml_string = xml_string.strip()
         xml_string = f"<root>{xml_string}</root>"
         root = ET.fromstring(xml_string)
 
+        if depth == 0:
+            record_repair("clean")
+
     except ET.ParseError:
-        if depth < 6:
-            print(f"{PRINT_PREFIX} [yellow][bold]Error parsing XML:\n{xml_string}[/bold][/yellow]")
-            print(f"{PRINT_PREFIX} [yellow][bold]Attempting fix...[/bold][/yellow]")
+        repaired_xml = repair_xml(xml_string, expected_tags if expected_tags is None or isinstance(expected_tags, dict) else [*expected_tags, "root"])
 
-            system_prompt = """You are an expert in the field of programming, and are especially good at finding mistakes XML files.
-    Make sure there are no mistakes in the XML file, such as invalid characters, missing or unclosed tags, etc.
-    You may also want to make sure that the XML file is well-formed.
-    Make sure the tag pairs that were given remain and are balanced.
-    If there are any singleton tags, you should close them or replace them with an equivalent description."""
-            user_prompt = f"Fix the following XML file according to the given instructions. Be especially vigilant for singleton tags:\n{xml_string}\n"
-            
-            assistant_prompt = "<root>"
-            stop_seq = "</root>"
+        if repaired_xml is not None:
+            print(f"{PRINT_PREFIX} [yellow]Repaired XML without the LLM[/yellow]")
+            record_repair("repaired")
+            root = ET.fromstring(repaired_xml)
+
+        # Without a client there is no LLM fix - callers on the engine loop (e.g. early-stop checks) can't block on one
+        elif client is None:
+            record_repair("failed")
+            raise
 
-            messages = [get_msg(Role.USER, user_prompt), get_msg(Role.ASSISTANT, assistant_prompt)]
+        elif depth < XML_FIX_ATTEMPTS:
+            record_repair("llm")
+
+            print(f"{PRINT_PREFIX} [yellow][bold]Error parsing XML:\n{xml_string}[/bold][/yellow]")
+            print(f"{PRINT_PREFIX} [yellow][bold]Attempting fix...[/bold][/yellow]")
 
             fixed_xml = llm_turn(client=client,
-                                prompts={"system": system_prompt,
-                                        "messages": messages},
-                                stop_sequences=[stop_seq],
-                                temperature=1.0,
+                                prompts=get_fix_prompts(xml_string),
+                                stop_sequences=["</root>"],
+                                # First attempt is deterministic (and cacheable); retries sample for a different fix
+                                temperature=0.0 if depth == 0 else 1.0,
                                 max_tokens=len(xml_string) + TOKEN_GROWTH_ALLOWANCE)
 
-            return xmlstr2dict(fixed_xml, client, depth + 1)
+            return xmlstr2dict(fixed_xml, client, depth + 1, expected_tags)
         else:
+            record_repair("failed")
             error_message = f"Error parsing XML, and fix attempt limit of {depth+1} reached:\n{xml_string}"
             print(f"{PRINT_PREFIX} [red][bold]{error_message}[/bold][/red]")
             raise RecursionError(error_message)
     
-    def parse_element(element: ET.Element) -> Optional[dict] | Optional[str]:
-        if len(element) == 0:
-            if element.text is None:
-                return None
+    return root2dict(root)
+
+def get_fix_prompts(xml_string: str) -> PromptsDict:
+    system_prompt = """You are an expert in the field of programming, and are especially good at finding mistakes XML files.
+    Make sure there are no mistakes in the XML file, such as invalid characters, missing or unclosed tags, etc.
+    You may also want to make sure that the XML file is well-formed.
+    Make sure the tag pairs that were given remain and are balanced.
+    If there are any singleton tags, you should close them or replace them with an equivalent description."""
+    user_prompt = f"Fix the following XML file according to the given instructions. Be especially vigilant for singleton tags:\n{xml_string}\n"
+
+    # The fix continues from <root> and stops at </root>, so the caller gets the inner XML back
+    return {"system": system_prompt,
+            "messages": [get_msg(Role.USER, user_prompt), get_msg(Role.ASSISTANT, "<root>")]}
+
+def parse_xml_locally(xml_string: str, expected_tags: Optional[Iterable[str] | dict[str, list[str]]] = None) -> tuple[Optional[ET.Element], str]:
+    # (root, outcome) for an unwrapped string, outcome being "clean" or "repaired" - or (None, "failed") if even local repair can't parse it
+    xml_string = f"<root>{xml_string.strip()}</root>"
+
+    try:
+        return ET.fromstring(xml_string), "clean"
+    except ET.ParseError:
+        repaired_xml = repair_xml(xml_string, expected_tags if expected_tags is None or isinstance(expected_tags, dict) else [*expected_tags, "root"])
+
+    if repaired_xml is None:
+        return None, "failed"
+
+    print(f"{PRINT_PREFIX} [yellow]Repaired XML without the LLM[/yellow]")
+    return ET.fromstring(repaired_xml), "repaired"
+
+def xmlstrs2dicts(xml_strings: dict[int, str], client: Optional[Anthropic], expected_tags: Optional[Iterable[str] | dict[str, list[str]]] = None, drop_failed: bool = False) -> dict[int, dict]:
+    """
+    Batch xmlstr2dict: every string is parsed (and locally repaired) first, then the ones that still don't parse
+    are fixed by the LLM together, one concurrent round per attempt rather than one call chain per string.
+    With drop_failed, strings that can't be recovered are left out of the result instead of raising
+    """
+    parsed_dicts: dict[int, dict] = {}
+    pending: dict[int, str] = {}
+
+    for i, xml_string in xml_strings.items():
+        root, outcome = parse_xml_locally(xml_string, expected_tags)
+        if root is None:
+            pending[i] = xml_string
+        else:
+            record_repair(outcome)
+            parsed_dicts[i] = root2dict(root)
+
+    for attempt in range(XML_FIX_ATTEMPTS if client is not None else 0):
+        if not pending:
+            break
+
+        for _ in pending:
+            record_repair("llm")
+
+        print(f"{PRINT_PREFIX} [yellow][bold]Attempting fix of {len(pending)} XML strings (attempt {attempt + 1} of {XML_FIX_ATTEMPTS})...[/bold][/yellow]")
+
+        pending_indices = list(pending)
+        fixed_xmls = llm_turns_indexed(client=client,  # type: ignore
+                                       prompts=[get_fix_prompts(f"<root>{pending[i].strip()}</root>") for i in pending_indices],
+                                       stop_sequences=["</root>"],
+                                       temperature=0.0 if attempt == 0 else 1.0,
+                                       n=None,
+                                       max_tokens=max(len(pending[i]) for i in pending_indices) + TOKEN_GROWTH_ALLOWANCE)
+
+        for j, i in enumerate(pending_indices):
+            # A fix call that failed outright leaves the string as it was for the next round
+            if j not in fixed_xmls:
+                continue
+
+            root, outcome = parse_xml_locally(fixed_xmls[j], expected_tags)
+            if root is None:
+                pending[i] = fixed_xmls[j]
             else:
-                return element.text # .strip() if element.text != ' ' else element.text
+                if outcome == "repaired":
+                    record_repair("repaired")
+                parsed_dicts[i] = root2dict(root)
+                del pending[i]
+
+    for _ in pending:
+        record_repair("failed")
+
+    if pending and drop_failed:
+        print(f"{PRINT_PREFIX} [yellow][bold]Dropping {len(pending)} of {len(xml_strings)} XML strings that couldn't be parsed: {sorted(pending)}[/bold][/yellow]")
+    elif pending:
+        error_message = f"{PRINT_PREFIX} Error parsing {len(pending)} XML strings after {XML_FIX_ATTEMPTS if client is not None else 0} fix attempts: {sorted(pending)}"
+        print(f"[red][bold]{error_message}[/bold][/red]")
+        raise RecursionError(error_message) if client is not None else ET.ParseError(error_message)
+
+    return parsed_dicts
+
+def element2value(element: ET.Element) -> Optional[dict] | Optional[str]:
+    if len(element) == 0:
+        if element.text is None:
+            return None
         else:
-            result = {}
-            for child in element:
-                child_result = parse_element(child)
-                if child_result is not None:
-                    if child_result != "None":
-                        result[child.tag] = child_result
-                        result.update(child.attrib)
-                    else:
-                        result[child.tag] = None
-            return result
-    
-    result = parse_element(root)
+            return element.text # .strip() if element.text != ' ' else element.text
+    else:
+        result = {}
+        for child in element:
+            child_result = element2value(child)
+            if child_result is not None:
+                if child_result != "None":
+                    result[child.tag] = child_result
+                    result.update(child.attrib)
+                else:
+                    result[child.tag] = None
+        return result
+
+def root2dict(root: ET.Element) -> dict:
+    result = element2value(root)
     if isinstance(result, dict):
         return result
     else:
@@ -96,6 +195,65 @@ def xmlstr2dict(xml_string: str, client: Anthropic, depth: int = 0) -> dict:
         print(f"[red][bold]{error_message}[/bold][/red]")
         raise TypeError(error_message)
 
+
+class XMLStreamParser:
+    """
+    Incremental xmlstr2dict: feed() it streamed text deltas and it returns each field (as a "/"-joined path
+    and its value) as soon as the field's closing tag arrives; close() returns the same dict xmlstr2dict would
+    """
+    def __init__(self, expected_tags: Optional[Iterable[str] | dict[str, list[str]]] = None) -> None:
+        self.expected_tags = expected_tags
+
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.parser.feed("<root>")
+
+        self.text = ""
+        self.path: list[str] = []
+        self.root: Optional[ET.Element] = None
+        self.broken = False
+
+    def feed(self, delta: str) -> list[tuple[str, Optional[dict] | Optional[str]]]:
+        self.text += delta
+
+        # Once the stream stops being well-formed, fields are only available from close()
+        if self.broken:
+            return []
+
+        try:
+            self.parser.feed(delta)
+            return self.read_fields()
+        except ET.ParseError:
+            self.broken = True
+            return []
+
+    def read_fields(self) -> list[tuple[str, Optional[dict] | Optional[str]]]:
+        fields = []
+
+        for event, element in self.parser.read_events():
+            if event == "start":
+                if self.root is None:
+                    self.root = element
+                else:
+                    self.path.append(element.tag)
+            elif element is not self.root:
+                fields.append(("/".join(self.path), element2value(element)))
+                self.path.pop()
+
+        return fields
+
+    def close(self, client: Optional[Anthropic]) -> dict:
+        if not self.broken:
+            try:
+                self.parser.feed("</root>")
+                self.parser.close()
+                record_repair("clean")
+                return root2dict(self.root)  # type: ignore
+            except ET.ParseError:
+                pass
+
+        # Truncated or malformed output gets the full xmlstr2dict treatment (local repair, then the LLM)
+        return xmlstr2dict(self.text, client, expected_tags=self.expected_tags)
+
 def dict2xml(d: NestedStrDict, tag: str="root") -> Element:
     """
     Convert a dictionary with possible nested dictionaries into XML
@@ -112,20 +270,80 @@ def dict2xml(d: NestedStrDict, tag: str="root") -> Element:
         elem.append(child)
     return elem
 
-def xml2xmlstr(xml: Element, no_root: bool=True) -> str:
-    def extract_root_xmlstr(xml_str: str, root_str):
-        xml_str = xml_str.strip()
-        open_tag, close_tag = f"<{root_str}>", f"</{root_str}>"
+def extract_root_xmlstr(xml_str: str, root_str: str) -> str:
+    xml_str = xml_str.strip()
+    open_tag, close_tag = f"<{root_str}>", f"</{root_str}>"
 
-        match = xml_str[xml_str.find(open_tag)+len(open_tag):xml_str.find(close_tag)]
+    match = xml_str[xml_str.find(open_tag)+len(open_tag):xml_str.find(close_tag)]
 
-        return match.strip()
-    
+    return match.strip()
+
+def xml2xmlstr(xml: Element, no_root: bool=True) -> str:
     if no_root:
         return extract_root_xmlstr(ET.tostring(xml, encoding="unicode"), xml.tag)
     else:
         return ET.tostring(xml, encoding="unicode")
 
+def escape_xml_text(text: str) -> str:
+    # The same escaping ET.tostring applies to element text
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+
+    return text
+
+def write_xml_children(d: NestedStrDict, parts: list[str]) -> None:
+    for key, val in d.items():
+        if isinstance(val, dict) and val:
+            parts.append(f"<{key}>")
+            write_xml_children(val, parts)
+            parts.append(f"</{key}>")
+        elif isinstance(val, dict) or not (text := str(val)):
+            parts.append(f"<{key} />")
+        else:
+            parts.append(f"<{key}>{escape_xml_text(text)}</{key}>")
+
+def dict2xmlstr(d: NestedStrDict, tag: str = "root") -> str:
+    """
+    Same string as xml2xmlstr(dict2xml(d, tag)), written directly instead of building and searching an ElementTree
+    """
+    parts: list[str] = []
+    write_xml_children(d, parts)
+    xml_str = "".join(parts)
+
+    # xml2xmlstr cuts at the first <tag> and </tag>, which isn't the root when it is empty or a key reuses its tag
+    if not d:
+        return extract_root_xmlstr(f"<{tag} />", tag)
+    if f"<{tag}>" in xml_str or f"</{tag}>" in xml_str:
+        return extract_root_xmlstr(f"<{tag}>{xml_str}</{tag}>", tag)
+
+    return xml_str
+
+def get_tag_delta(text: str, tag: str, emitted: int) -> tuple[str, int]:
+    # New text inside <tag> since `emitted` characters of it were handed out, for printing partial output.
+    # Anything that could be the start of the closing tag is held back until the next call
+    open_tag, close_tag = f"<{tag}>", f"</{tag}>"
+
+    start = text.find(open_tag)
+    if start == -1:
+        return "", emitted
+    start += len(open_tag)
+
+    end = text.find(close_tag, start)
+    if end == -1:
+        end = len(text)
+        for i in range(len(close_tag) - 1, 0, -1):
+            if text.endswith(close_tag[:i]):
+                end -= i
+                break
+
+    inner = text[start:max(start, end)]
+
+    return inner[emitted:], max(emitted, len(inner))
+
 def extract_language_and_code(markdown_string: str) -> Optional[tuple[str, str]]:
     pattern = re.compile(r"```(\w+)\n(.*?)```", re.DOTALL)
     match = pattern.search(markdown_string)
@@ -0,0 +1,118 @@
+import os
+import threading
+from typing import Optional
+
+from anthropic.types import MessageParam as AnthropicMessageParam
+from anthropic.types import TextBlockParam as AnthropicTextBlockParam
+
+from rich import print
+
+from utils.custom_types import PromptsDict
+from utils.messages import MessageSequence
+from utils.tokens import estimate_prompt_tokens
+
+
+PRINT_PREFIX = "[bold][PromptCache][/bold]"
+
+# Anthropic silently skips caching prefixes shorter than this (Sonnet/Opus; Haiku is 2048)
+MIN_CACHEABLE_TOKENS = 1024
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+_stats_lock = threading.Lock()
+prompt_cache_stats: dict[str, int] = {
+    "calls": 0,
+    "input_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_creation_input_tokens": 0,
+}
+
+
+def prompt_caching_enabled() -> bool:
+    return os.environ.get("ANTHROPIC_PROMPT_CACHING", "True") == "True"
+
+def prompt_cache_priming_enabled() -> bool:
+    return os.environ.get("ANTHROPIC_PROMPT_CACHE_PRIMING", "True") == "True"
+
+def get_shared_prefix_len(prompt_list: list[PromptsDict]) -> int:
+    # Number of leading messages that every prompt in a fan-out batch has in common
+    first_messages: list = prompt_list[0]['messages']  # type: ignore
+
+    if any(prompt['system'] != prompt_list[0]['system'] for prompt in prompt_list):
+        return 0
+
+    prefix_len = len(first_messages)
+    for prompt in prompt_list[1:]:
+        messages: list = prompt['messages']  # type: ignore
+
+        prefix_len = min(prefix_len, len(messages))
+
+        # Fan-outs built on the same MessageSequence history only need their own tails compared
+        shared_len = first_messages.shared_prefix_len(messages) if isinstance(messages, MessageSequence) and isinstance(first_messages, MessageSequence) else 0
+        for i in range(min(shared_len, prefix_len), prefix_len):
+            if messages[i] is not first_messages[i] and messages[i] != first_messages[i]:
+                prefix_len = i
+                break
+
+    return prefix_len
+
+def get_breakpoint_idx(messages: list, prefix_len: Optional[int]) -> Optional[int]:
+    if prefix_len is None:
+        prefix_len = len(messages)
+
+    breakpoint_idx = min(prefix_len, len(messages)) - 1
+
+    # The assistant prefill changes from call to call, so cache up to the turn before it
+    if breakpoint_idx >= 0 and breakpoint_idx == len(messages) - 1 and messages[breakpoint_idx]['role'] == "assistant":
+        breakpoint_idx -= 1
+
+    if breakpoint_idx >= 0:
+        return breakpoint_idx
+    else:
+        return None
+
+def add_cache_breakpoints(system: str, messages: list[AnthropicMessageParam], prefix_len: Optional[int]) -> tuple[list[AnthropicTextBlockParam], list[AnthropicMessageParam]]:
+    system_blocks = [AnthropicTextBlockParam(type="text", text=system, cache_control=CACHE_CONTROL)]  # type: ignore
+
+    breakpoint_idx = get_breakpoint_idx(messages, prefix_len)
+    if breakpoint_idx is None:
+        return system_blocks, messages
+
+    cached_messages = list(messages)
+    breakpoint_message = cached_messages[breakpoint_idx]
+    cached_messages[breakpoint_idx] = AnthropicMessageParam(role=breakpoint_message['role'],
+                                                            content=[AnthropicTextBlockParam(type="text",
+                                                                                             text=breakpoint_message['content'],  # type: ignore
+                                                                                             cache_control=CACHE_CONTROL)])  # type: ignore
+
+    return system_blocks, cached_messages
+
+def should_prime_cache(prompt_list: list[PromptsDict], prefix_len: int) -> bool:
+    # Concurrent requests only hit the cache once an earlier response has started,
+    # so a large shared prefix is written once before the batch goes out
+    if len(prompt_list) < 2 or not prompt_cache_priming_enabled():
+        return False
+
+    prefix_tokens = estimate_prompt_tokens(prompt_list[0]['system'], prompt_list[0]['messages'][:prefix_len])  # type: ignore
+
+    return prefix_tokens >= MIN_CACHEABLE_TOKENS
+
+def record_cache_usage(usage) -> None:
+    if usage is None:
+        return
+
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_creation = getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    with _stats_lock:
+        prompt_cache_stats["calls"] += 1
+        prompt_cache_stats["input_tokens"] += usage.input_tokens
+        prompt_cache_stats["cache_read_input_tokens"] += cache_read
+        prompt_cache_stats["cache_creation_input_tokens"] += cache_creation
+
+    if cache_read or cache_creation:
+        print(f"{PRINT_PREFIX} cache read: {cache_read} tokens, cache write: {cache_creation} tokens, uncached: {usage.input_tokens} tokens")
+
+def get_prompt_cache_stats() -> dict[str, int]:
+    with _stats_lock:
+        return dict(prompt_cache_stats)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+import dotenv
+
+from rich import print
+
+
+PRINT_PREFIX = "[bold][RateLimit][/bold]"
+
+DEFAULT_OUTPUT_ESTIMATE = 512
+OUTPUT_ESTIMATE_SMOOTHING = 0.2
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        # Debit up front and let the level go negative: later callers queue behind
+        # earlier ones instead of racing them, and the deficit is the wait time
+        self.refill(now)
+        self.level -= min(amount, self.capacity)
+
+        if self.level >= 0:
+            return 0.0
+        else:
+            return -self.level / self.rate
+
+    def credit(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    def __init__(self, name: str, requests_per_min: Optional[float] = None, input_tokens_per_min: Optional[float] = None, output_tokens_per_min: Optional[float] = None) -> None:
+        self.PRINT_PREFIX = f"{PRINT_PREFIX} [{name}]"
+
+        self.requests = TokenBucket(requests_per_min) if requests_per_min else None
+        self.input_tokens = TokenBucket(input_tokens_per_min) if input_tokens_per_min else None
+        self.output_tokens = TokenBucket(output_tokens_per_min) if output_tokens_per_min else None
+
+        self.output_estimate: float = DEFAULT_OUTPUT_ESTIMATE
+        self.blocked_until = 0.0
+
+        self.lock = threading.Lock()
+
+        self.total_requests = 0
+        self.total_wait = 0.0
+
+    def estimate_output(self, max_tokens: int) -> int:
+        return int(min(max_tokens, self.output_estimate))
+
+    def reserve(self, input_tokens: int, output_tokens: int) -> float:
+        with self.lock:
+            now = time.monotonic()
+
+            waits = [self.blocked_until - now]
+            for bucket, amount in ((self.requests, 1), (self.input_tokens, input_tokens), (self.output_tokens, output_tokens)):
+                if bucket:
+                    waits.append(bucket.reserve(amount, now))
+
+            wait = max(0.0, *waits)
+
+            self.total_requests += 1
+            self.total_wait += wait
+
+            return wait
+
+    async def acquire(self, input_tokens: int, output_tokens: int) -> None:
+        wait = self.reserve(input_tokens, output_tokens)
+        if wait > 0:
+            print(f"{self.PRINT_PREFIX} queueing request for {wait:0.2f} seconds")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.release(input_tokens, output_tokens, requests=1)
+                raise
+
+    async def wait_unblocked(self) -> None:
+        # Retries of an already reserved call only wait out a server retry-after instead of reserving again
+        wait = self.blocked_until - time.monotonic()
+        if wait > 0:
+            print(f"{self.PRINT_PREFIX} holding retry for {wait:0.2f} seconds")
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_input: int, actual_input: int, estimated_output: int, actual_output: int, n: int = 1) -> None:
+        with self.lock:
+            if self.input_tokens:
+                self.input_tokens.credit(estimated_input - actual_input)
+            if self.output_tokens:
+                self.output_tokens.credit(estimated_output - actual_output)
+
+            # The estimate is per choice, while a call with n choices reports their total output
+            self.output_estimate += OUTPUT_ESTIMATE_SMOOTHING * (actual_output / n - self.output_estimate)
+
+    def release(self, input_tokens: int, output_tokens: int, requests: int = 0) -> None:
+        # Hand back a reservation that is never settled, without counting it towards the output estimate
+        with self.lock:
+            if self.requests:
+                self.requests.credit(requests)
+            if self.input_tokens:
+                self.input_tokens.credit(input_tokens)
+            if self.output_tokens:
+                self.output_tokens.credit(output_tokens)
+
+    def block(self, seconds: float) -> None:
+        # Server-side 429: hold every queued caller until the advertised retry-after
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_env_limit(key: str) -> Optional[float]:
+    value = os.environ.get(key)
+    if value:
+        return float(value)
+    else:
+        return None
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            dotenv.load_dotenv()
+
+            env_prefix = provider.upper()
+            _rate_limiters[provider] = RateLimiter(name=provider,
+                                                   requests_per_min=get_env_limit(f"{env_prefix}_REQUESTS_PER_MIN"),
+                                                   input_tokens_per_min=get_env_limit(f"{env_prefix}_INPUT_TOKENS_PER_MIN"),
+                                                   output_tokens_per_min=get_env_limit(f"{env_prefix}_OUTPUT_TOKENS_PER_MIN"))
+
+        return _rate_limiters[provider]
+
+def get_retry_after(exception: Exception) -> Optional[float]:
+    response = getattr(exception, "response", None)
+    if response is None:
+        return None
+
+    retry_after = response.headers.get("retry-after")
+    try:
+        return float(retry_after) if retry_after else None
+    except ValueError:
+        return None
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import dotenv
+
+from rich import print
+
+from utils.custom_types import Message
+
+
+dotenv.load_dotenv()
+
+
+PRINT_PREFIX = "[bold][ResponseCache][/bold]"
+
+DEFAULT_CACHE_PATH = os.path.join("data", "cache", "llm_responses.sqlite")
+DEFAULT_MAX_MB = 64
+
+
+def get_cache_key(provider: str, model: str, system: str, messages: list[Message], stop_sequences: list[str], max_tokens: int, n: int = 1, temperature: Optional[float] = None, tool: Optional[dict] = None) -> str:
+    request = {
+        "provider": provider,
+        "model": model,
+        "system": system,
+        "messages": [{"role": message['role'], "content": message['content']} for message in messages],
+        "stop_sequences": stop_sequences,
+        "max_tokens": max_tokens,
+        "n": n,
+    }
+
+    # The response cache only ever holds temperature 0 calls, so temperature is keyed only when given
+    if temperature is not None:
+        request["temperature"] = temperature
+
+    # Likewise for the tool/schema of structured-output calls, so plain text keys stay as they were
+    if tool is not None:
+        request["tool"] = tool
+
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    PRINT_PREFIX = PRINT_PREFIX
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Shared by the engine loop and any caller threads, so access is serialized here
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                       key TEXT PRIMARY KEY,
+                                       response TEXT NOT NULL,
+                                       size INTEGER NOT NULL,
+                                       last_access REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.connection.commit()
+
+        self.total_bytes: int = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.last_access: float = self.connection.execute("SELECT COALESCE(MAX(last_access), 0) FROM responses").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+
+    def next_access(self) -> float:
+        # Strictly increasing, so LRU order holds even when the wall clock is coarse
+        self.last_access = max(time.time(), self.last_access + 1e-6)
+        return self.last_access
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (self.next_access(), key))
+            self.connection.commit()
+
+            self.hits += 1
+
+        print(f"{self.PRINT_PREFIX} hit ({self.hits} hits, {self.misses} misses)")
+
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous:
+                self.total_bytes -= previous[0]
+
+            self.connection.execute("INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                                    (key, response, size, self.next_access()))
+            self.total_bytes += size
+
+            self.evict()
+
+            self.connection.commit()
+
+    def evict(self) -> None:
+        # Least recently used entries go first until the store is back under its cap
+        while self.total_bytes > self.max_bytes:
+            row = self.connection.execute("SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 1").fetchone()
+            if row is None:
+                self.total_bytes = 0
+                break
+
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self.total_bytes -= row[1]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.total_bytes = 0
+
+    def get_stats(self) -> dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+                    "bytes": self.total_bytes}
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    global _response_cache
+
+    if os.environ.get("LLM_RESPONSE_CACHE") != "True":
+        return None
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            path = os.environ.get("LLM_RESPONSE_CACHE_PATH") or DEFAULT_CACHE_PATH
+            max_mb = float(os.environ.get("LLM_RESPONSE_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+
+            _response_cache = ResponseCache(path, int(max_mb * 1024 * 1024))
+
+        return _response_cache
@@ -0,0 +1,77 @@
+import re
+import zlib
+
+import numpy as np
+
+
+HASH_FEATURES = 2 ** 12
+
+
+def normalize_text(text: str) -> str:
+    # Comparison key only: candidates that differ just in trailing whitespace or blank lines are the same candidate.
+    # Indentation and line breaks are kept - in Python they change what the code does
+    text = "\n".join(line.rstrip() for line in text.splitlines())
+    return re.sub(r"\n{3,}", "\n\n", text).strip("\n")
+
+def dedupe_candidates(candidates: list[str]) -> tuple[list[str], list[int]]:
+    # Unique candidates in first-seen order (original text kept), with how many samples produced each
+    unique_idxs: dict[str, int] = {}
+    unique_candidates: list[str] = []
+    multiplicities: list[int] = []
+
+    for candidate in candidates:
+        key = normalize_text(candidate)
+
+        if key in unique_idxs:
+            multiplicities[unique_idxs[key]] += 1
+        else:
+            unique_idxs[key] = len(unique_candidates)
+            unique_candidates.append(candidate)
+            multiplicities.append(1)
+
+    return unique_candidates, multiplicities
+
+def tokenize(text: str) -> list[str]:
+    # Operators are tokens too: "size > limit" and "size < limit" must not look identical
+    return re.findall(r"\w+|[<>=!+\-*/%&|^~]+", text.lower())
+
+def hash_vectorize(texts: list[str], n_features: int = HASH_FEATURES) -> np.ndarray:
+    # Unigrams and bigrams hashed into a fixed width with crc32 (stable across runs, unlike hash()),
+    # sublinear tf and L2 normalized rows so a dot product is the cosine similarity
+    vectors = np.zeros((len(texts), n_features), dtype=np.float32)
+
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        idxs = [zlib.crc32(feature.encode()) % n_features for feature in features]
+        np.add.at(vectors[row], idxs, 1.0)
+
+    np.log1p(vectors, out=vectors)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    return vectors / norms
+
+def cluster_candidates(candidates: list[str], multiplicities: list[int], threshold: float) -> tuple[list[str], list[int]]:
+    # Greedy leader clustering: each candidate joins the first representative it is at least `threshold`
+    # cosine-similar to, otherwise it becomes a representative itself. Multiplicities are summed per cluster
+    if len(candidates) < 2 or threshold <= 0:
+        return candidates, multiplicities
+
+    vectors = hash_vectorize(candidates)
+    similarities = vectors @ vectors.T
+
+    representative_idxs: list[int] = []
+    cluster_multiplicities: list[int] = []
+
+    for idx, count in enumerate(multiplicities):
+        for cluster, representative_idx in enumerate(representative_idxs):
+            if similarities[idx, representative_idx] >= threshold:
+                cluster_multiplicities[cluster] += count
+                break
+        else:
+            representative_idxs.append(idx)
+            cluster_multiplicities.append(count)
+
+    return [candidates[idx] for idx in representative_idxs], cluster_multiplicities
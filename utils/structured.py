@@ -0,0 +1,76 @@
+import json
+from typing import Optional
+
+from anthropic.types import Message as AnthropicMessage
+from anthropic.types import ToolUseBlock as AnthropicToolUseBlock
+
+from openai.types.chat.chat_completion import ChatCompletion as OpenAIChatCompletion
+
+
+JSON_TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float), "boolean": bool}
+
+
+def get_tool(name: str, description: str, schema: dict) -> dict:
+    # Anthropic tool definition; the same dict is turned into an OpenAI response_format by get_response_format
+    return {"name": name, "description": description, "input_schema": schema}
+
+def get_response_format(tool: dict) -> dict:
+    return {"type": "json_schema",
+            "json_schema": {"name": tool['name'], "description": tool['description'], "schema": tool['input_schema'], "strict": True}}
+
+def validate_schema(value, schema: dict, path: str = "$") -> list[str]:
+    """
+    Errors for value against the subset of JSON Schema the tools use (type, enum, properties, required,
+    additionalProperties, items, minItems, minimum, maximum); an empty list means it is valid
+    """
+    expected_type = JSON_TYPES.get(schema.get('type', ""), object)
+
+    # bool is an int to Python but not to JSON Schema
+    if not isinstance(value, expected_type) or (isinstance(value, bool) and schema.get('type') in ("integer", "number")):
+        return [f"{path}: expected {schema.get('type')}, got {type(value).__name__}"]
+
+    errors: list[str] = []
+
+    if "enum" in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+    if "minimum" in schema and value < schema['minimum']:
+        errors.append(f"{path}: {value} below minimum {schema['minimum']}")
+    if "maximum" in schema and value > schema['maximum']:
+        errors.append(f"{path}: {value} above maximum {schema['maximum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+
+        errors += [f"{path}: missing {key}" for key in schema.get('required', []) if key not in value]
+        if schema.get('additionalProperties') is False:
+            errors += [f"{path}: unexpected {key}" for key in value if key not in properties]
+
+        for key, property_schema in properties.items():
+            if key in value:
+                errors += validate_schema(value[key], property_schema, f"{path}.{key}")
+
+    if isinstance(value, list) and len(value) < schema.get('minItems', 0):
+        errors.append(f"{path}: {len(value)} items, fewer than minItems {schema['minItems']}")
+
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += validate_schema(item, schema['items'], f"{path}[{i}]")
+
+    return errors
+
+def anthropic_message_to_tool_input(llm_response: AnthropicMessage, tool_name: str) -> Optional[dict]:
+    for content in llm_response.content:
+        if isinstance(content, AnthropicToolUseBlock) and content.name == tool_name:
+            return content.input  # type: ignore
+
+    return None
+
+def openai_completion_to_json(llm_response: OpenAIChatCompletion) -> Optional[dict]:
+    content = llm_response.choices[0].message.content
+    if content is None:
+        return None
+
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return None
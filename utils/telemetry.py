@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from rich import print
+from rich.table import Table
+
+
+PRINT_PREFIX = "[bold][Telemetry][/bold]"
+
+TELEMETRY_FILENAME = "telemetry.json"
+
+# Who is calling the LLM right now. Agents set this as they enter each state, and
+# run_coroutine carries it over to the engine loop with the rest of the caller's context
+_call_context: ContextVar[dict[str, Optional[str]]] = ContextVar("llm_call_context", default={"agent": None, "state": None, "task": None})
+
+# Calls made outside a task (UI, AgentManager) are never dumped with one, so only the latest of them are kept
+UNTASKED_RECORD_LIMIT = int(os.environ.get("TELEMETRY_UNTASKED_RECORDS") or 1000)
+
+SUMMED_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "retries", "latency")
+
+
+def set_call_context(agent: Optional[str], state: Optional[str], task: Optional[str] = None) -> None:
+    _call_context.set({"agent": agent, "state": state, "task": task})
+
+def get_call_context() -> dict[str, Optional[str]]:
+    return _call_context.get()
+
+
+class Telemetry:
+    PRINT_PREFIX = PRINT_PREFIX
+
+    def __init__(self) -> None:
+        self.records: list[dict] = []
+        self.untasked_records: deque[dict] = deque(maxlen=UNTASKED_RECORD_LIMIT)
+        self.lock = threading.Lock()
+
+    def start_call(self, provider: str, model: str) -> dict:
+        return {**get_call_context(),
+                "provider": provider,
+                "model": model,
+                "source": "api",
+                "attempts": 0,
+                "start": time.monotonic()}
+
+    def finish_call(self, call_record: dict, usage=None, stop_reason: Optional[str] = None, error: Optional[BaseException] = None) -> dict:
+        start = call_record.pop("start")
+        attempts = call_record.pop("attempts")
+
+        call_record.update({
+            "input_tokens": (getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0) if usage else 0,
+            "output_tokens": (getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None) or 0) if usage else 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+            "retries": max(0, attempts - 1),
+            "latency": time.monotonic() - start,
+            "stop_reason": stop_reason,
+            "error": None,
+        })
+
+        if isinstance(error, asyncio.CancelledError):
+            call_record['error'] = "cancelled"
+        elif error is not None:
+            call_record['error'] = f"{type(error).__name__}: {error}"
+
+        with self.lock:
+            (self.records if call_record['task'] is not None else self.untasked_records).append(call_record)
+
+        return call_record
+
+    def get_records(self, task: Optional[str] = None) -> list[dict]:
+        # Without a task: every record held, task records first
+        with self.lock:
+            if task is None:
+                return self.records + list(self.untasked_records)
+
+            return [call_record for call_record in self.records if call_record['task'] == task]
+
+    def pop_records(self, task: str) -> list[dict]:
+        # Takes a finished task's records out, so a long-running process only holds the tasks still in flight
+        with self.lock:
+            call_records = [call_record for call_record in self.records if call_record['task'] == task]
+            self.records = [call_record for call_record in self.records if call_record['task'] != task]
+
+        return call_records
+
+    def summarize(self, call_records: list[dict], by: Optional[str]) -> dict[str, dict]:
+        summary: dict[str, dict] = {}
+
+        for call_record in call_records:
+            group = summary.setdefault(str(call_record[by]) if by else "total", {"calls": 0, "errors": 0, "max_latency": 0.0, **{field: 0 for field in SUMMED_FIELDS}})
+
+            group['calls'] += 1
+            group['errors'] += call_record['error'] is not None
+            group['max_latency'] = max(group['max_latency'], call_record['latency'])
+            for field in SUMMED_FIELDS:
+                group[field] += call_record[field]
+
+        return summary
+
+    def print_summary(self, call_records: list[dict], title: str) -> None:
+        table = Table(title=title)
+
+        for column in ("State", "Calls", "Errors", "Retries", "Input", "Output", "Cache read", "Total s", "Mean s", "Max s"):
+            table.add_column(column, justify="left" if column == "State" else "right")
+
+        summary = self.summarize(call_records, "state")
+        for total in self.summarize(call_records, None).values():
+            summary["[bold]total[/bold]"] = total
+
+        for state, group in summary.items():
+            table.add_row(state,
+                          str(group['calls']),
+                          str(group['errors']),
+                          str(group['retries']),
+                          str(group['input_tokens']),
+                          str(group['output_tokens']),
+                          str(group['cache_read_input_tokens']),
+                          f"{group['latency']:0.1f}",
+                          f"{group['latency'] / group['calls']:0.2f}",
+                          f"{group['max_latency']:0.2f}")
+
+        print(table)
+
+    def dump(self, call_records: list[dict], path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump({"by_state": self.summarize(call_records, "state"),
+                       "by_agent": self.summarize(call_records, "agent"),
+                       "by_task": self.summarize(call_records, "task"),
+                       "calls": call_records}, file, indent=4)
+
+        print(f"{self.PRINT_PREFIX} wrote {len(call_records)} call records to {path}")
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    return _telemetry
@@ -0,0 +1,21 @@
+import math
+from typing import Iterable
+
+from utils.custom_types import Message
+
+
+# Rough local token estimates (no tokenizer round-trip). Claude and GPT-4 class
+# tokenizers average a little under 4 characters per token on English and code;
+# erring slightly high keeps budgets and rate limits on the safe side.
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def estimate_message_tokens(message: Message) -> int:
+    return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+def estimate_prompt_tokens(system: str, messages: Iterable[Message]) -> int:
+    return estimate_tokens(system) + sum(estimate_message_tokens(message) for message in messages)
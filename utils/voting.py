@@ -0,0 +1,138 @@
+import itertools
+import math
+import re
+
+import numpy as np
+
+
+AGGREGATION_METHODS = ("borda", "kemeny", "bradley_terry")
+
+# Exhaustive Kemeny search over n! orderings; larger candidate sets fall back to the Borda order
+KEMENY_MAX_CANDIDATES = 8
+BRADLEY_TERRY_ITERATIONS = 100
+
+
+def get_swing(remaining: int, margin: float) -> int:
+    # How many of the outstanding votes are assumed able to go against the current result;
+    # margin 1.0 assumes all of them (exact), lower values stop earlier at some risk of a different outcome
+    return math.ceil(remaining * margin)
+
+def scores_settled(scores: list[float], remaining: int, margin: float = 1.0, vote_range: float = 2.0) -> bool:
+    # A single ballot can move the leader's lead over any other candidate by at most vote_range
+    # (2 for a +1/-1 best/worst vote, n - 1 for a Borda ballot over n candidates)
+    if len(scores) < 2:
+        return True
+
+    leader, runner_up = sorted(scores, reverse=True)[:2]
+
+    return leader - runner_up > vote_range * get_swing(remaining, margin)
+
+def majority_settled(count: int, received: int, remaining: int, margin: float = 1.0) -> bool:
+    # Whether count / total > 0.5 is already decided. Outstanding votes may also fail and never
+    # arrive, but the fraction's bounds are still reached with all of them in
+    swing = get_swing(remaining, margin)
+
+    if received + swing == 0:
+        return False
+
+    return count / (received + swing) > 0.5 or (count + swing) / (received + swing) <= 0.5
+
+def parse_ranking(ranking: str | list[int]) -> list[int]:
+    # "3, 1, 2" or "candidate_3 > candidate_1 > ..." (or a structured [3, 1, 2]) -> [3, 1, 2], repeats dropped
+    if isinstance(ranking, list):
+        return list(dict.fromkeys(ranking))
+
+    return list(dict.fromkeys(int(number) for number in re.findall(r"\d+", ranking)))
+
+def ballot_points(parsed_ballot: dict, index_map: list[int]) -> np.ndarray:
+    """
+    Centered Borda points per candidate (absolute order) for one ballot: (n - 1) / 2 for the best down to
+    -(n - 1) / 2 for the worst. Takes a full <ranking> or, failing that, the legacy best/worst pair;
+    candidates a ballot leaves out share the positions between its top and bottom
+    """
+    candidate_count = len(index_map)
+
+    if parsed_ballot.get('ranking'):
+        top = [index_map[number - 1] for number in parse_ranking(parsed_ballot['ranking']) if 1 <= number <= candidate_count]
+        bottom = []
+    else:
+        top = [index_map[int(parsed_ballot['best_candidate']) - 1]]
+        bottom = [index_map[int(parsed_ballot['worst_candidate']) - 1]]
+        bottom = [idx for idx in bottom if idx not in top]
+
+    if not top:
+        raise ValueError(f"Ballot ranks none of the {candidate_count} candidates: {parsed_ballot}")
+
+    positions = np.full(candidate_count, np.nan)
+    positions[top] = np.arange(len(top))
+    positions[bottom] = candidate_count - 1 - np.arange(len(bottom))[::-1]
+
+    unranked = np.isnan(positions)
+    if unranked.any():
+        positions[unranked] = (len(top) + candidate_count - 1 - len(bottom)) / 2
+
+    return (candidate_count - 1) / 2 - positions
+
+def pairwise_wins(points: np.ndarray) -> np.ndarray:
+    # wins[i, j]: ballots ranking candidate i above j, ties counting half
+    wins = (points[:, :, None] > points[:, None, :]).sum(axis=0) + 0.5 * (points[:, :, None] == points[:, None, :]).sum(axis=0)
+    np.fill_diagonal(wins, 0)
+
+    return wins
+
+def kemeny(points: np.ndarray) -> np.ndarray:
+    ballot_count, candidate_count = points.shape
+
+    if candidate_count > KEMENY_MAX_CANDIDATES:
+        return points.sum(axis=0)
+
+    wins = pairwise_wins(points)
+
+    # Every ordering at once: agreement is the number of pairwise preferences it keeps
+    orderings = np.array(list(itertools.permutations(range(candidate_count))))
+    positions = np.argsort(orderings, axis=1)
+    agreement = ((positions[:, :, None] < positions[:, None, :]) * wins).sum(axis=(1, 2))
+
+    best_positions = positions[np.argmax(agreement)]
+
+    return ((candidate_count - 1) / 2 - best_positions) * ballot_count
+
+def bradley_terry(points: np.ndarray) -> np.ndarray:
+    ballot_count, candidate_count = points.shape
+
+    # Half a win each way keeps candidates that never won from collapsing to zero strength
+    wins = pairwise_wins(points) + 0.5 * (1 - np.eye(candidate_count))
+    comparisons = wins + wins.T
+
+    strengths = np.ones(candidate_count)
+    for _ in range(BRADLEY_TERRY_ITERATIONS):
+        strengths = wins.sum(axis=1) / (comparisons / (strengths[:, None] + strengths[None, :])).sum(axis=1)
+        strengths /= strengths.sum()
+
+    # Expected centered Borda score under the fitted model, so it reads on the same scale as borda()
+    win_probabilities = strengths[:, None] / (strengths[:, None] + strengths[None, :])
+    np.fill_diagonal(win_probabilities, 0)
+
+    return (win_probabilities.sum(axis=1) - (candidate_count - 1) / 2) * ballot_count
+
+def aggregate(points: np.ndarray, method: str = "borda") -> np.ndarray:
+    """
+    Combine a ballots x candidates matrix of ballot_points rows into one score per candidate
+    """
+    if method == "borda":
+        return points.sum(axis=0)
+    elif method == "kemeny":
+        return kemeny(points)
+    elif method == "bradley_terry":
+        return bradley_terry(points)
+
+    raise ValueError(f"Unknown aggregation method {method}, expected one of {AGGREGATION_METHODS}")
+
+def get_margin(scores: np.ndarray, ballot_count: int) -> float:
+    # Leader's lead over the runner-up as a fraction of the largest lead ballot_count ballots could give
+    if len(scores) < 2 or ballot_count == 0:
+        return 1.0
+
+    leader, runner_up = np.sort(scores)[::-1][:2]
+
+    return float((leader - runner_up) / (ballot_count * (len(scores) - 1)))
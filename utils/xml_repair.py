@@ -0,0 +1,169 @@
+import re
+import threading
+from typing import Iterable, Optional
+
+import xml.etree.ElementTree as ET
+
+
+# Fenced code and existing CDATA are copied through untouched; everything else is scanned for tags
+PROTECTED_PATTERN = re.compile(r"<!\[CDATA\[.*?\]\]>|```.*?```", re.DOTALL)
+TAG_PATTERN = re.compile(r"<(/?)([A-Za-z_][\w.\-]*)((?:\s+[^<>]*?)?)\s*(/?)>")
+UNQUOTED_ATTRIBUTE_PATTERN = re.compile(r"""(\w+)\s*=\s*([^\s"'=<>]+)""")
+VALID_ATTRIBUTES_PATTERN = re.compile(r"""(?:\s+[A-Za-z_][\w.\-:]*\s*=\s*(?:"[^"<]*"|'[^'<]*'))*\s*""")
+STRAY_AMPERSAND_PATTERN = re.compile(r"&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);)")
+
+REPAIR_OUTCOMES = ("clean", "repaired", "llm", "failed")
+
+_repair_stats = {outcome: 0 for outcome in REPAIR_OUTCOMES}
+_repair_stats_lock = threading.Lock()
+
+
+def record_repair(outcome: str) -> None:
+    with _repair_stats_lock:
+        _repair_stats[outcome] += 1
+
+def get_repair_stats() -> dict[str, int]:
+    with _repair_stats_lock:
+        return dict(_repair_stats)
+
+def escape_text(text: str) -> str:
+    return STRAY_AMPERSAND_PATTERN.sub("&amp;", text).replace("<", "&lt;").replace(">", "&gt;")
+
+def to_cdata(text: str) -> str:
+    # "]]>" can't appear inside a CDATA section, so it is split across two
+    return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+def tokenize_markup(markup: str, expected_tags: Optional[set[str]]) -> list[tuple[str, str, str]]:
+    # (kind, name, text) with kind one of open/close/empty/text; text tokens are already escaped
+    tokens: list[tuple[str, str, str]] = []
+
+    text_start = 0
+    for tag in TAG_PATTERN.finditer(markup):
+        closing, name, attributes, self_closing = tag.groups()
+        if expected_tags is not None and name not in expected_tags:
+            continue
+
+        attributes = UNQUOTED_ATTRIBUTE_PATTERN.sub(r'\1="\2"', attributes)
+        if not VALID_ATTRIBUTES_PATTERN.fullmatch(attributes) or (closing and attributes.strip()):
+            # e.g. <class 'int'> in printed output
+            continue
+
+        tokens.append(("text", "", escape_text(markup[text_start:tag.start()])))
+
+        if closing:
+            tokens.append(("close", name, f"</{name}>"))
+        elif self_closing:
+            tokens.append(("empty", name, f"<{name}{attributes}/>"))
+        else:
+            tokens.append(("open", name, f"<{name}{attributes}>"))
+
+        text_start = tag.end()
+
+    tokens.append(("text", "", escape_text(markup[text_start:])))
+
+    return tokens
+
+def tokenize_xml(xml_string: str, expected_tags: Optional[set[str]]) -> list[tuple[str, str, str]]:
+    tokens: list[tuple[str, str, str]] = []
+
+    position = 0
+    for protected in PROTECTED_PATTERN.finditer(xml_string):
+        tokens += tokenize_markup(xml_string[position:protected.start()], expected_tags)
+
+        protected_text = protected.group(0)
+        tokens.append(("text", "", to_cdata(protected_text) if protected_text.startswith("```") else protected_text))
+
+        position = protected.end()
+
+    tokens += tokenize_markup(xml_string[position:], expected_tags)
+
+    return tokens
+
+def balance_tokens(tokens: list[tuple[str, str, str]], children: Optional[dict[str, list[str]]] = None) -> str:
+    # children maps a tag to the tags allowed directly inside it (tags not in it are leaves); when given,
+    # an open that doesn't belong in the current element closes that element first
+    parts: list[str] = []
+
+    # Open elements as (name, whether a child element has been seen)
+    stack: list[list] = []
+
+    for kind, name, text in tokens:
+        if kind == "open" and stack and stack[-1][0] == name and not stack[-1][1]:
+            # <tag>value<tag> - a repeated open of a leaf is almost always a typo for its close
+            kind, text = "close", f"</{name}>"
+
+        if kind in ("open", "empty") and children is not None:
+            while stack and name not in children.get(stack[-1][0], []):
+                parts.append(f"</{stack.pop()[0]}>")
+
+        if kind == "open":
+            if stack:
+                stack[-1][1] = True
+            stack.append([name, False])
+            parts.append(text)
+        elif kind == "empty":
+            if stack:
+                stack[-1][1] = True
+            parts.append(text)
+        elif kind == "close":
+            open_names = [open_name for open_name, _ in stack]
+            if name not in open_names:
+                # A close with nothing to close is kept as text
+                parts.append(escape_text(text))
+                continue
+
+            # Anything left open inside it ends where its parent does
+            while stack:
+                open_name, _ = stack.pop()
+                parts.append(f"</{open_name}>")
+                if open_name == name:
+                    break
+        else:
+            parts.append(text)
+
+    parts += [f"</{open_name}>" for open_name, _ in reversed(stack)]
+
+    return "".join(parts)
+
+def fits_schema(root: ET.Element, tag_names: set[str], children: Optional[dict[str, list[str]]]) -> bool:
+    # A repair that leaves an expected tag's markup in text or repeats a leaf has most likely moved an element
+    # boundary (e.g. a tag mentioned in prose taken as the real one), so the values can't be trusted
+    markup_pattern = re.compile(rf"</?(?:{'|'.join(re.escape(name) for name in sorted(tag_names))})\b[^<>]*>")
+
+    for element in root.iter():
+        if any(markup_pattern.search(text) for text in (element.text, element.tail) if text):
+            return False
+
+        if children is not None:
+            leaf_names = [child.tag for child in element if child.tag not in children]
+            if len(leaf_names) != len(set(leaf_names)):
+                return False
+
+    return True
+
+def repair_xml(xml_string: str, expected_tags: Optional[Iterable[str] | dict[str, list[str]]] = None) -> Optional[str]:
+    """
+    Mechanical repair of LLM XML: escapes stray & < >, wraps fenced code in CDATA, quotes bare attribute
+    values, and balances tags. With expected_tags, any other tag is treated as text; given as a
+    {tag: child tags} schema, elements are also closed where a tag that can't be their child opens.
+    Returns the repaired string, or None if it still doesn't parse or doesn't fit expected_tags
+    (expected markup left in text, or a leaf repeated)
+    """
+    if isinstance(expected_tags, dict):
+        children = expected_tags
+        tag_names = set(expected_tags) | {child for child_tags in expected_tags.values() for child in child_tags}
+    else:
+        children = None
+        tag_names = set(expected_tags) if expected_tags is not None else None
+
+    repaired = balance_tokens(tokenize_xml(xml_string, tag_names), children)
+
+    try:
+        root = ET.fromstring(repaired)
+    except ET.ParseError:
+        return None
+
+    if tag_names is not None and not fits_schema(root, tag_names, children):
+        return None
+
+    return repaired